@@ -13,4 +13,13 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'app.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+from owner.events import EVENTS_PATH, availability_events  # noqa: E402 (needs apps loaded)
+
+
+async def application(scope, receive, send):
+    """Django, except for the long-lived availability event streams"""
+    if scope['type'] == 'http' and scope['path'] == EVENTS_PATH:
+        return await availability_events(scope, receive, send)
+    return await django_application(scope, receive, send)
@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/3.2/ref/settings/
 """
 
 import os
+from datetime import timedelta
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -153,11 +154,112 @@ MEDIA_ROOT = '/vol/web/media'
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 REST_FRAMEWORK = {
-    'DEFAULT_SCHEMA_CLASS': 'drf_spectacular.openapi.AutoSchema'
+    'DEFAULT_SCHEMA_CLASS': 'drf_spectacular.openapi.AutoSchema',
+    'DEFAULT_PAGINATION_CLASS': 'core.pagination.KeysetPagination',
+    'PAGE_SIZE': int(os.environ.get('API_PAGE_SIZE', 50)),
 }
 
+# Largest ?page_size= a client may ask for
+API_MAX_PAGE_SIZE = int(os.environ.get('API_MAX_PAGE_SIZE', 500))
+
+# Authenticated tokens remembered per worker (entries, seconds); a revoked
+# token or changed owner can be seen by other workers for this long
+AUTH_TOKEN_CACHE_SIZE = int(os.environ.get('AUTH_TOKEN_CACHE_SIZE', 10000))
+AUTH_TOKEN_CACHE_TTL = int(os.environ.get('AUTH_TOKEN_CACHE_TTL', 60))
+
 TOMTOM_MAPS_API_KEY = os.environ.get('TOMTOM_MAPS_API_KEY')
 
+# Geocoder answers are reused for this long (days, or hours when TomTom had
+# no results), and TomTom requests time out after GEOCODE_TIMEOUT seconds
+GEOCODE_CACHE_MAX_AGE = timedelta(days=int(os.environ.get('GEOCODE_CACHE_MAX_AGE_DAYS', 30)))
+GEOCODE_NEGATIVE_CACHE_MAX_AGE = timedelta(hours=int(os.environ.get('GEOCODE_NEGATIVE_CACHE_MAX_AGE_HOURS', 24)))
+GEOCODE_TIMEOUT = float(os.environ.get('GEOCODE_TIMEOUT', 5))
+
 OPENAI_API_KEY = os.environ.get('OPENAI_API_KEY')
 
-PLACE_SERVICE_URL = os.environ.get("PLACE_SERVICE_URL", "http://localhost:8000/api/place/")
\ No newline at end of file
+# Match suggestions (see owner.suggestions): "local" explains the top match
+# without any external call, "openai" needs the openai package and
+# OPENAI_API_KEY, anything else is a dotted path to a provider class;
+# answers are cached per profile and candidates (entries, seconds)
+SUGGESTION_PROVIDER = os.environ.get('SUGGESTION_PROVIDER', 'openai' if OPENAI_API_KEY else 'local')
+SUGGESTION_CACHE_SIZE = int(os.environ.get('SUGGESTION_CACHE_SIZE', 1000))
+SUGGESTION_CACHE_TTL = int(os.environ.get('SUGGESTION_CACHE_TTL', 3600))
+
+# Owners are placed at login from a local MaxMind DB (e.g. GeoLite2-City.mmdb)
+# with lookups cached per IP; GEOIP_PROXY_COUNT is the number of proxies in
+# front of the app that append to X-Forwarded-For (nginx passes REMOTE_ADDR)
+GEOIP_DATABASE_PATH = os.environ.get('GEOIP_DATABASE_PATH')
+GEOIP_CACHE_SIZE = int(os.environ.get('GEOIP_CACHE_SIZE', 10000))
+GEOIP_CACHE_TTL = int(os.environ.get('GEOIP_CACHE_TTL', 86400))
+GEOIP_PROXY_COUNT = int(os.environ.get('GEOIP_PROXY_COUNT', 0))
+
+PLACE_SERVICE_URL = os.environ.get("PLACE_SERVICE_URL", "http://localhost:8000/api/place/")
+
+# "auto" resolves places in-process when the place app is installed,
+# "remote" always goes through PLACE_SERVICE_URL, "local" never does
+PLACE_SERVICE_MODE = os.environ.get('PLACE_SERVICE_MODE', 'auto')
+
+# HTTP client for the place service (seconds, connections per worker)
+PLACE_SERVICE_CONNECT_TIMEOUT = float(os.environ.get('PLACE_SERVICE_CONNECT_TIMEOUT', 2))
+PLACE_SERVICE_READ_TIMEOUT = float(os.environ.get('PLACE_SERVICE_READ_TIMEOUT', 5))
+PLACE_SERVICE_RETRIES = int(os.environ.get('PLACE_SERVICE_RETRIES', 2))
+PLACE_SERVICE_POOL_SIZE = int(os.environ.get('PLACE_SERVICE_POOL_SIZE', 10))
+PLACE_SERVICE_BREAKER_THRESHOLD = int(os.environ.get('PLACE_SERVICE_BREAKER_THRESHOLD', 5))
+PLACE_SERVICE_BREAKER_RESET = float(os.environ.get('PLACE_SERVICE_BREAKER_RESET', 30))
+
+# Place lookups cached by the owner app (entries, seconds, share via CACHES)
+PLACE_CACHE_MAX_ENTRIES = int(os.environ.get('PLACE_CACHE_MAX_ENTRIES', 10000))
+PLACE_CACHE_TTL = int(os.environ.get('PLACE_CACHE_TTL', 3600))
+PLACE_CACHE_SHARED = bool(int(os.environ.get('PLACE_CACHE_SHARED', 0)))
+
+# Longest availability slot accepted; bounds the time-window index scans
+AVAILABILITY_MAX_DURATION = timedelta(hours=int(os.environ.get('AVAILABILITY_MAX_DURATION_HOURS', 24)))
+
+# Availabilities that ended this long ago are moved to the archive table by
+# the archive_availabilities command, in batches of this many rows
+AVAILABILITY_ARCHIVE_AFTER = timedelta(days=int(os.environ.get('AVAILABILITY_ARCHIVE_AFTER_DAYS', 7)))
+AVAILABILITY_ARCHIVE_BATCH_SIZE = int(os.environ.get('AVAILABILITY_ARCHIVE_BATCH_SIZE', 1000))
+
+# Most availabilities a single bulk/recurring request may create
+AVAILABILITY_BULK_MAX_SLOTS = int(os.environ.get('AVAILABILITY_BULK_MAX_SLOTS', 500))
+
+# Default time window of availabilities shown on the map
+MAP_DEFAULT_WINDOW = timedelta(hours=int(os.environ.get('MAP_DEFAULT_WINDOW_HOURS', 24)))
+
+# Map clustering: grid cells per 256px tile, zoom from which single places
+# are returned, seconds between checks for place changes in other workers
+PLACE_CLUSTER_CELLS_PER_TILE = int(os.environ.get('PLACE_CLUSTER_CELLS_PER_TILE', 4))
+PLACE_CLUSTER_MAX_ZOOM = int(os.environ.get('PLACE_CLUSTER_MAX_ZOOM', 15))
+PLACE_CLUSTER_CHECK_INTERVAL = float(os.environ.get('PLACE_CLUSTER_CHECK_INTERVAL', 1))
+
+# Place autocomplete: seconds between checks for place changes in other
+# workers, lowest trigram similarity (0-1) of a fuzzy suggestion
+PLACE_SEARCH_CHECK_INTERVAL = float(os.environ.get('PLACE_SEARCH_CHECK_INTERVAL', 1))
+PLACE_SEARCH_MIN_SIMILARITY = float(os.environ.get('PLACE_SEARCH_MIN_SIMILARITY', 0.3))
+
+# Seconds between checks of the owner spatial index against the database
+OWNER_INDEX_CHECK_INTERVAL = float(os.environ.get('OWNER_INDEX_CHECK_INTERVAL', 1))
+
+# Serve nearby-owner lookups from the per-worker spatial index instead of the DB
+OWNER_SPATIAL_INDEX = bool(int(os.environ.get('OWNER_SPATIAL_INDEX', 1)))
+
+# Owner matching (see owner.matching): candidates are the MATCH_CANDIDATES
+# nearest owners within MATCH_RADIUS_KM, MATCH_TOP_N best are returned out
+# of the MATCH_STORED_K kept per owner in the MatchCandidate table
+MATCH_RADIUS_KM = float(os.environ.get('MATCH_RADIUS_KM', 25))
+MATCH_CANDIDATES = int(os.environ.get('MATCH_CANDIDATES', 500))
+MATCH_TOP_N = int(os.environ.get('MATCH_TOP_N', 10))
+MATCH_STORED_K = int(os.environ.get('MATCH_STORED_K', 50))
+
+# Delta sync (?since=): seconds a cursor is moved back to cover transactions
+# still committing, and how long deletions are remembered for clients
+SYNC_CURSOR_OVERLAP = timedelta(seconds=int(os.environ.get('SYNC_CURSOR_OVERLAP_SECONDS', 10)))
+SYNC_TOMBSTONE_RETENTION = timedelta(days=int(os.environ.get('SYNC_TOMBSTONE_RETENTION_DAYS', 30)))
+
+# Live availability events (see owner.events): events buffered per client
+# before it has to resync, seconds between keepalive comments
+EVENTS_QUEUE_SIZE = int(os.environ.get('EVENTS_QUEUE_SIZE', 100))
+EVENTS_KEEPALIVE = float(os.environ.get('EVENTS_KEEPALIVE', 15))
+# How writes reach the ASGI process streaming the events: "postgresql"
+# (LISTEN/NOTIFY) or "local" (same process); the database vendor when unset
+EVENTS_BUS = os.environ.get('EVENTS_BUS', '')
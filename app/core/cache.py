@@ -0,0 +1,94 @@
+"""
+Small in-process caches shared by the apps.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from django.core.cache import caches
+
+MISSING = object()
+
+
+class TTLCache:
+    """
+    Thread-safe LRU cache whose entries expire after `ttl` seconds.
+
+    With `shared_prefix` set, entries are also written to Django's default
+    cache under that prefix so that other workers can pick them up; the
+    in-process LRU stays in front of it.
+    """
+
+    def __init__(self, maxsize, ttl, shared_prefix=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.shared_prefix = shared_prefix
+        self._data = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.evictions = 0
+
+    def _shared_key(self, key):
+        return f"{self.shared_prefix}:{key}"
+
+    def get(self, key, default=None):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                if entry[0] > now:
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return entry[1]
+                del self._data[key]
+
+        if self.shared_prefix is not None:
+            value = caches['default'].get(self._shared_key(key), MISSING)
+            if value is not MISSING:
+                self._store(key, value)
+                with self._lock:
+                    self.hits += 1
+                return value
+
+        with self._lock:
+            self.misses += 1
+        return default
+
+    def _store(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def set(self, key, value):
+        self._store(key, value)
+        if self.shared_prefix is not None:
+            caches['default'].set(self._shared_key(key), value, self.ttl)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+        if self.shared_prefix is not None:
+            caches['default'].delete(self._shared_key(key))
+
+    def clear(self):
+        """Empty the in-process entries and reset the counters"""
+        with self._lock:
+            self._data.clear()
+            self.hits = self.misses = self.evictions = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._data),
+                'maxsize': self.maxsize,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+            }
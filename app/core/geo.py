@@ -0,0 +1,146 @@
+"""
+Geographic helpers shared by the owner and place apps.
+"""
+from math import radians, degrees, cos, sin, asin, sqrt, floor
+
+import numpy as np
+
+EARTH_RADIUS_KM = 6371
+
+# Size of a spatial grid cell in degrees (~5.5 km of latitude)
+GRID_CELL_DEGREES = 0.05
+
+# Deepest web map zoom level accepted by the map endpoints
+MAX_ZOOM = 22
+
+# Above this many cells a radius query is cheaper as a plain scan
+MAX_GRID_CELLS = 400
+
+
+def haversine_distance(lat1, lon1, lat2, lon2):
+    """Great-circle distance in km between two (lat, lon) points"""
+    lat1, lon1, lat2, lon2 = map(radians, map(float, [lat1, lon1, lat2, lon2]))
+    dlat = lat2 - lat1
+    dlon = lon2 - lon1
+    a = sin(dlat/2)**2 + cos(lat1) * cos(lat2) * sin(dlon/2)**2
+    c = 2 * asin(min(1.0, sqrt(a)))
+    return EARTH_RADIUS_KM * c
+
+
+def haversine_distances(lat, lon, lats, lons):
+    """Great-circle distances in km from one point to arrays of points"""
+    lat1, lon1 = radians(float(lat)), radians(float(lon))
+    lat2 = np.radians(np.asarray(lats, dtype=np.float64))
+    lon2 = np.radians(np.asarray(lons, dtype=np.float64))
+    a = np.sin((lat2 - lat1) / 2)**2 + cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2)**2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+def rank_by_distance(distances, radius_km=None, k=None):
+    """
+    Return the indices of `distances` within `radius_km`, nearest first,
+    keeping only the `k` nearest when given.
+    """
+    distances = np.asarray(distances, dtype=np.float64)
+    indices = np.arange(len(distances))
+    if radius_km is not None:
+        indices = indices[distances <= radius_km]
+    if k is not None and k < len(indices):
+        # Partial selection first so only k items are fully sorted
+        indices = indices[np.argpartition(distances[indices], k - 1)[:k]]
+    return indices[np.argsort(distances[indices], kind='stable')]
+
+
+def parse_bbox(value):
+    """
+    Parse "min_lon,min_lat,max_lon,max_lat" into a tuple of floats. A
+    min_lon greater than max_lon means the box crosses the antimeridian.
+    """
+    try:
+        min_lon, min_lat, max_lon, max_lat = (float(part) for part in value.split(','))
+    except (AttributeError, ValueError):
+        raise ValueError('bbox must be "min_lon,min_lat,max_lon,max_lat"')
+    if not (-90 <= min_lat <= max_lat <= 90 and -180 <= min_lon <= 180 and -180 <= max_lon <= 180):
+        raise ValueError('bbox is out of range')
+    return min_lon, min_lat, max_lon, max_lat
+
+
+def in_bbox(lat, lon, bbox):
+    """Whether a point lies in a (min_lon, min_lat, max_lon, max_lat) box"""
+    min_lon, min_lat, max_lon, max_lat = bbox
+    if not min_lat <= lat <= max_lat:
+        return False
+    if min_lon <= max_lon:
+        return min_lon <= lon <= max_lon
+    return lon >= min_lon or lon <= max_lon
+
+
+def parse_zoom(value):
+    """Parse a web map zoom level"""
+    try:
+        zoom = int(value)
+    except (TypeError, ValueError):
+        raise ValueError('zoom must be an integer')
+    if not 0 <= zoom <= MAX_ZOOM:
+        raise ValueError(f'zoom must be between 0 and {MAX_ZOOM}')
+    return zoom
+
+
+def _grid_size(cell_degrees):
+    return round(180 / cell_degrees), round(360 / cell_degrees)
+
+
+def _grid_index(lat, lon, cell_degrees):
+    rows, cols = _grid_size(cell_degrees)
+    row = min(int(floor((float(lat) + 90) / cell_degrees)), rows - 1)
+    col = int(floor((float(lon) + 180) / cell_degrees)) % cols
+    return row, col
+
+
+def grid_cell(lat, lon, cell_degrees=GRID_CELL_DEGREES):
+    """Return the key ("row:col") of the grid cell containing a point"""
+    row, col = _grid_index(lat, lon, cell_degrees)
+    return f"{row}:{col}"
+
+
+def cells_within_radius(lat, lon, radius_km, cell_degrees=GRID_CELL_DEGREES,
+                        max_cells=MAX_GRID_CELLS):
+    """
+    Return the keys of every grid cell overlapping the circle of `radius_km`
+    around (lat, lon), or None when the circle spans more than `max_cells`.
+    """
+    lat, lon = float(lat), float(lon)
+    rows, cols = _grid_size(cell_degrees)
+    angular_radius = radius_km / EARTH_RADIUS_KM
+    radius_deg = degrees(angular_radius)
+
+    min_row, center_col = _grid_index(max(lat - radius_deg, -90), lon, cell_degrees)
+    max_row, _ = _grid_index(min(lat + radius_deg, 90), lon, cell_degrees)
+
+    # Longitude extent of the circle; it covers every meridian near the poles
+    if abs(lat) + radius_deg >= 90 or angular_radius >= 1:
+        col_offsets = range(cols)
+    else:
+        dlon = degrees(asin(min(1.0, sin(angular_radius) / cos(radians(lat)))))
+        span = int(dlon // cell_degrees) + 1
+        if 2 * span + 1 >= cols:
+            col_offsets = range(cols)
+        else:
+            col_offsets = [(center_col + offset) % cols for offset in range(-span, span + 1)]
+
+    if (max_row - min_row + 1) * len(col_offsets) > max_cells:
+        return None
+
+    cells = []
+    for row in range(min_row, max_row + 1):
+        cell_lat = row * cell_degrees - 90 + cell_degrees / 2
+        # Half-diagonal of the cell, measured at its edge nearest the equator
+        edge_lat = min(abs(cell_lat - cell_degrees / 2), abs(cell_lat + cell_degrees / 2))
+        half_diagonal = haversine_distance(
+            edge_lat, 0, edge_lat + cell_degrees / 2, cell_degrees / 2)
+        for col in col_offsets:
+            cell_lon = col * cell_degrees - 180 + cell_degrees / 2
+            # Triangle inequality: nothing in the cell can be closer than this
+            if haversine_distance(lat, lon, cell_lat, cell_lon) - half_diagonal <= radius_km:
+                cells.append(f"{row}:{col}")
+    return cells
@@ -0,0 +1,144 @@
+"""
+Array-backed KD-tree over points on the earth's surface.
+
+Points are stored as 3D unit vectors so that straight-line (chord) distance
+is monotonic with great-circle distance and no special casing is needed at
+the poles or the antimeridian.
+"""
+import heapq
+
+import numpy as np
+
+from .geo import EARTH_RADIUS_KM
+
+
+def to_unit_vectors(lats, lons):
+    """Convert arrays of degrees to an (n, 3) array of unit vectors"""
+    lat = np.radians(np.asarray(lats, dtype=np.float64))
+    lon = np.radians(np.asarray(lons, dtype=np.float64))
+    cos_lat = np.cos(lat)
+    return np.column_stack((cos_lat * np.cos(lon), cos_lat * np.sin(lon), np.sin(lat)))
+
+
+def km_to_chord(km):
+    return 2 * np.sin(min(km / EARTH_RADIUS_KM, np.pi) / 2)
+
+
+def chord_to_km(chord):
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.minimum(np.asarray(chord) / 2, 1.0))
+
+
+class KDTree:
+    """
+    Static KD-tree. Nodes live in flat arrays; each node owns the contiguous
+    slice [lo, hi) of the reordered points and a bounding box around them.
+    """
+    leaf_size = 16
+
+    def __init__(self, ids, lats, lons):
+        self.ids = np.asarray(ids, dtype=np.int64)
+        self.points = to_unit_vectors(lats, lons).reshape(-1, 3)
+        self._build()
+
+    def __len__(self):
+        return len(self.ids)
+
+    def _build(self):
+        n = len(self.ids)
+        order = np.arange(n)
+        lo, hi, left, right, box_min, box_max = [], [], [], [], [], []
+
+        def add_node(start, end):
+            chunk = self.points[order[start:end]]
+            lo.append(start)
+            hi.append(end)
+            left.append(-1)
+            right.append(-1)
+            box_min.append(chunk.min(axis=0) if end > start else np.zeros(3))
+            box_max.append(chunk.max(axis=0) if end > start else np.zeros(3))
+            return len(lo) - 1
+
+        stack = [add_node(0, n)]
+        while stack:
+            node = stack.pop()
+            start, end = lo[node], hi[node]
+            if end - start <= self.leaf_size:
+                continue
+            # Split the widest axis at the median
+            axis = int(np.argmax(box_max[node] - box_min[node]))
+            mid = (start + end) // 2
+            segment = order[start:end]
+            partition = np.argpartition(self.points[segment, axis], mid - start)
+            order[start:end] = segment[partition]
+            left[node] = add_node(start, mid)
+            right[node] = add_node(mid, end)
+            stack.extend((left[node], right[node]))
+
+        self.ids = self.ids[order]
+        self.points = self.points[order]
+        self._lo = np.array(lo, dtype=np.int64)
+        self._hi = np.array(hi, dtype=np.int64)
+        self._left = np.array(left, dtype=np.int64)
+        self._right = np.array(right, dtype=np.int64)
+        self._box_min = np.array(box_min).reshape(-1, 3)
+        self._box_max = np.array(box_max).reshape(-1, 3)
+
+    def _box_distance(self, node, point):
+        gap = np.maximum(0, np.maximum(self._box_min[node] - point, point - self._box_max[node]))
+        return float(np.sqrt(gap @ gap))
+
+    def _leaf_chords(self, node, point):
+        segment = self.points[self._lo[node]:self._hi[node]]
+        return np.sqrt(((segment - point) ** 2).sum(axis=1))
+
+    def query_radius(self, lat, lon, radius_km):
+        """Return (ids, distances in km) of every point within the radius"""
+        if not len(self):
+            return np.empty(0, dtype=np.int64), np.empty(0)
+        point = to_unit_vectors([lat], [lon])[0]
+        max_chord = km_to_chord(radius_km)
+        found_ids, found_chords = [], []
+        stack = [0]
+        while stack:
+            node = stack.pop()
+            if self._box_distance(node, point) > max_chord:
+                continue
+            if self._left[node] == -1:
+                chords = self._leaf_chords(node, point)
+                mask = chords <= max_chord
+                found_ids.append(self.ids[self._lo[node]:self._hi[node]][mask])
+                found_chords.append(chords[mask])
+            else:
+                stack.extend((self._left[node], self._right[node]))
+        if not found_ids:
+            return np.empty(0, dtype=np.int64), np.empty(0)
+        return np.concatenate(found_ids), chord_to_km(np.concatenate(found_chords))
+
+    def query_nearest(self, lat, lon, k, radius_km=None):
+        """Return (ids, distances in km) of the k nearest points, nearest first"""
+        if not len(self) or k < 1:
+            return np.empty(0, dtype=np.int64), np.empty(0)
+        point = to_unit_vectors([lat], [lon])[0]
+        bound = km_to_chord(radius_km) if radius_km is not None else np.inf
+        best = []  # max-heap of (-chord, id) holding the k best so far
+        nodes = [(self._box_distance(0, point), 0)]
+        while nodes:
+            box_distance, node = heapq.heappop(nodes)
+            limit = -best[0][0] if len(best) == k else bound
+            if box_distance > limit:
+                break
+            if self._left[node] == -1:
+                chords = self._leaf_chords(node, point)
+                for chord, point_id in zip(chords, self.ids[self._lo[node]:self._hi[node]]):
+                    if chord > bound:
+                        continue
+                    if len(best) < k:
+                        heapq.heappush(best, (-chord, int(point_id)))
+                    elif chord < -best[0][0]:
+                        heapq.heapreplace(best, (-chord, int(point_id)))
+            else:
+                for child in (self._left[node], self._right[node]):
+                    heapq.heappush(nodes, (self._box_distance(child, point), child))
+        best.sort(key=lambda item: -item[0])
+        ids = np.array([point_id for _, point_id in best], dtype=np.int64)
+        return ids, chord_to_km([-chord for chord, _ in best])
@@ -1,3 +1,57 @@
 from django.db import models
+from django.db.models import F
 
-# Create your models here.
+
+class TableVersion(models.Model):
+    """
+    Change counter for a table, bumped on every relevant write so that
+    per-process caches can cheaply tell whether they are stale.
+    """
+    name = models.CharField(max_length=50, primary_key=True)
+    version = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.name} v{self.version}"
+
+    @classmethod
+    def bump(cls, name):
+        """Increment the counter for `name` and return its new value"""
+        if not cls.objects.filter(name=name).update(version=F('version') + 1):
+            _, created = cls.objects.get_or_create(name=name, defaults={'version': 1})
+            if not created:
+                cls.objects.filter(name=name).update(version=F('version') + 1)
+        return cls.current(name)
+
+    @classmethod
+    def current(cls, name):
+        """Return the counter for `name`, 0 if it was never bumped"""
+        version = cls.objects.filter(name=name).values_list('version', flat=True).first()
+        return version or 0
+
+    @classmethod
+    def current_many(cls, names):
+        """Return {name: counter} for several tables with a single query"""
+        versions = dict(cls.objects.filter(name__in=names).values_list('name', 'version'))
+        return {name: versions.get(name, 0) for name in names}
+
+
+class Tombstone(models.Model):
+    """
+    Marker left behind by a deleted row so delta-sync clients learn about
+    the deletion, see core.sync. Pruned after SYNC_TOMBSTONE_RETENTION.
+    """
+    model = models.CharField(max_length=100)  # model label, e.g. "owner.dog"
+    object_id = models.BigIntegerField()
+    deleted_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['model', 'deleted_at'], name='tombstone_model_deleted_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.model} #{self.object_id} deleted {self.deleted_at:%Y-%m-%d %H:%M}"
+
+    @classmethod
+    def record(cls, instance):
+        return cls.objects.create(model=instance._meta.label_lower, object_id=instance.pk)
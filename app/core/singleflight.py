@@ -0,0 +1,80 @@
+"""
+Coalescing of duplicate work: concurrent calls for the same key share one
+execution within a worker (SingleFlight) and take turns across workers
+(advisory_lock).
+"""
+import hashlib
+import threading
+from contextlib import contextmanager
+
+from django.db import connection
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Runs `fn` once per key at a time: callers arriving while a call for
+    their key is in flight wait for it and get its result, or its exception.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, fn):
+        """Return (result, shared), shared being True for callers that waited"""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            else:
+                call.waiters += 1
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result, False
+
+
+def _lock_id(name):
+    """Signed 64-bit key for pg_advisory_lock"""
+    return int.from_bytes(hashlib.blake2b(name.encode(), digest_size=8).digest(), 'big', signed=True)
+
+
+@contextmanager
+def advisory_lock(name):
+    """
+    Session-level Postgres advisory lock on `name`, so that only one worker
+    at a time runs the block. A no-op on other databases, where callers
+    rely on unique constraints instead.
+    """
+    if connection.vendor != 'postgresql':
+        yield
+        return
+    key = _lock_id(name)
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT pg_advisory_lock(%s)', [key])
+    try:
+        yield
+    finally:
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_advisory_unlock(%s)', [key])
@@ -3,4 +3,5 @@ from owner import models
 
 admin.site.register(models.Dog)
 admin.site.register(models.Owner)
-admin.site.register(models.OwnerAvailability)
\ No newline at end of file
+admin.site.register(models.OwnerAvailability)
+admin.site.register(models.OwnerAvailabilityArchive)
\ No newline at end of file
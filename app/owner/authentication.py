@@ -0,0 +1,64 @@
+"""
+Token authentication that skips the database for recently seen tokens.
+
+DRF's TokenAuthentication joins Token and User on every request, and the
+owner views then look up the user's Owner on top. CachedTokenAuthentication
+keeps token key -> (user, owner) in-process for AUTH_TOKEN_CACHE_TTL
+seconds and sets `request.owner`. The owner.signals receivers evict an
+entry as soon as its token, user or owner is saved or deleted in this
+worker; other workers notice within the TTL.
+"""
+import copy
+
+from django.conf import settings
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+
+from core.cache import TTLCache
+from .models import Owner
+
+token_cache = TTLCache(maxsize=settings.AUTH_TOKEN_CACHE_SIZE, ttl=settings.AUTH_TOKEN_CACHE_TTL)
+
+
+def evict_tokens(keys):
+    for key in keys:
+        token_cache.delete(key)
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+
+    def authenticate(self, request):
+        result = super().authenticate(request)
+        if result is not None:
+            user, _ = result
+            # Cached by select_related: None for users without a profile
+            request.owner = user._state.fields_cache.get('owner')
+        return result
+
+    def authenticate_credentials(self, key):
+        entry = token_cache.get(key)
+        if entry is None:
+            model = self.get_model()
+            try:
+                token = model.objects.select_related('user__owner').get(key=key)
+            except model.DoesNotExist:
+                raise exceptions.AuthenticationFailed('Invalid token.')
+            entry = (token.user, token)
+            token_cache.set(key, entry)
+
+        user, token = entry
+        if not user.is_active:
+            raise exceptions.AuthenticationFailed('User inactive or deleted.')
+        # Views may modify the user and owner they are given, not the cached ones
+        return copy.deepcopy(user), token
+
+
+def request_owner(request):
+    """
+    The Owner of the authenticated user, or None: the one attached by
+    CachedTokenAuthentication, queried for other authentication methods.
+    """
+    try:
+        return request.owner
+    except AttributeError:
+        return Owner.objects.filter(user=request.user).first()
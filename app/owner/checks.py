@@ -0,0 +1,35 @@
+"""
+System checks for the owner app.
+"""
+from django.conf import settings
+from django.core.checks import Error, Tags, register
+from django.db import connections
+from django.db.models import F
+
+
+@register(Tags.database)
+def check_availability_durations(app_configs, databases=None, **kwargs):
+    """
+    owner.filters.overlapping only scans AVAILABILITY_MAX_DURATION back, so
+    stored slots longer than the setting (after lowering it) go missing from
+    the time-window queries. Runs with `migrate` and `check --database`.
+    """
+    from .models import OwnerAvailability
+
+    errors = []
+    for alias in databases or ():
+        table = OwnerAvailability._meta.db_table
+        if table not in connections[alias].introspection.table_names():
+            continue  # Not migrated yet
+        too_long = OwnerAvailability.objects.using(alias).filter(
+            end_time__gt=F('start_time') + settings.AVAILABILITY_MAX_DURATION)
+        count = too_long.count()
+        if count:
+            errors.append(Error(
+                f'{count} availabilities in database "{alias}" are longer than '
+                f'AVAILABILITY_MAX_DURATION ({settings.AVAILABILITY_MAX_DURATION}) and are '
+                'missed by the time-window queries.',
+                hint='Raise AVAILABILITY_MAX_DURATION_HOURS back, or split or shorten those slots.',
+                id='owner.E001',
+            ))
+    return errors
@@ -0,0 +1,288 @@
+"""
+Live availability events, pushed to clients over Server-Sent Events.
+
+Clients open GET /api/owner/events/?place_ids=1,2 and/or ?bbox=... on the
+ASGI application (see app/asgi.py, served by uvicorn next to the uwsgi
+workers) and receive a "created", "updated" or "deleted" event with the
+place_id and ids of the OwnerAvailabilities written at those places, once
+the write commits. Clients refetch what they show; events carry no rows.
+
+Events fan out from `broker`, which lives in the ASGI process. Writes made
+in other processes reach it through the bus chosen by EVENTS_BUS: on
+PostgreSQL they are sent with NOTIFY inside the writing transaction and
+`listener` relays them to the broker; "local" keeps them in the writing
+process (tests, single-process servers).
+"""
+import asyncio
+import json
+import logging
+import select
+import threading
+from collections import defaultdict
+from urllib.parse import parse_qs
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection, transaction
+
+from core.geo import in_bbox, parse_bbox
+
+logger = logging.getLogger(__name__)
+
+EVENTS_PATH = '/api/owner/events/'
+# PostgreSQL channel of the events and the largest payload NOTIFY accepts
+EVENTS_CHANNEL = 'availability_events'
+NOTIFY_MAX_BYTES = 8000
+
+
+class Subscription:
+    """One client's filter and queue, owned by the event loop serving it"""
+
+    def __init__(self, loop, place_ids=None, bbox=None, maxsize=100):
+        self.loop = loop
+        self.place_ids = frozenset(place_ids or ())
+        self.bbox = bbox
+        self.queue = asyncio.Queue(maxsize=maxsize)
+        self.lagged = False
+
+    def matches(self, event):
+        """Events of the subscribed places; bbox ones are located by the stream"""
+        return event['place_id'] in self.place_ids or self.bbox is not None
+
+    def put(self, event):
+        """Runs on the subscriber's loop; a client that falls behind must resync"""
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.lagged = True
+
+
+class Broker:
+    """Thread-safe fan-out from the threads that write to the loops that stream"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscriptions = set()
+
+    def has_subscribers(self):
+        return bool(self._subscriptions)
+
+    def subscribe(self, loop, place_ids=None, bbox=None):
+        subscription = Subscription(loop, place_ids, bbox, maxsize=settings.EVENTS_QUEUE_SIZE)
+        with self._lock:
+            self._subscriptions.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscriptions.discard(subscription)
+
+    def resync(self):
+        """Events may have been missed: every client refetches"""
+        with self._lock:
+            subscriptions = list(self._subscriptions)
+        for subscription in subscriptions:
+            subscription.lagged = True
+
+    def publish(self, event):
+        with self._lock:
+            subscriptions = list(self._subscriptions)
+        for subscription in subscriptions:
+            if subscription.matches(event):
+                try:
+                    subscription.loop.call_soon_threadsafe(subscription.put, event)
+                except RuntimeError:
+                    self.unsubscribe(subscription)  # Its loop is gone
+
+
+broker = Broker()
+
+
+class Listener:
+    """
+    LISTENs on EVENTS_CHANNEL from a thread of the ASGI process, with its
+    own database connection, and hands the notifications to `broker`.
+    """
+    poll_interval = 1
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stopping = threading.Event()
+
+    def start(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._stopping.clear()
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+
+    def stop(self):
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            self._stopping.set()
+            thread.join()
+
+    def _run(self):
+        failed = False
+        while not self._stopping.is_set():
+            try:
+                self._listen(resync=failed)
+            except Exception:
+                logger.exception("Availability event listener failed, reconnecting")
+                failed = True
+                self._stopping.wait(self.poll_interval)
+            finally:
+                connection.close()
+
+    def _listen(self, resync):
+        with connection.cursor() as cursor:
+            cursor.execute(f'LISTEN {EVENTS_CHANNEL}')
+        if resync:
+            broker.resync()
+        raw = connection.connection
+        while not self._stopping.is_set():
+            if not select.select([raw], [], [], self.poll_interval)[0]:
+                continue
+            raw.poll()
+            while raw.notifies:
+                broker.publish(json.loads(raw.notifies.pop(0).payload))
+
+
+listener = Listener()
+
+
+def uses_postgres_bus():
+    return (settings.EVENTS_BUS or connection.vendor) == 'postgresql'
+
+
+def publish_availabilities(kind, availabilities):
+    """
+    Send one `kind` event per place of `availabilities` to its subscribers
+    once the current transaction commits, or right away outside of one.
+    """
+    postgres_bus = uses_postgres_bus()
+    if not postgres_bus and not broker.has_subscribers():
+        return
+
+    # Captured now: after a delete the instances no longer have a pk
+    ids_by_place = defaultdict(list)
+    for availability in availabilities:
+        ids_by_place[availability.place_id].append(availability.pk)
+    events = [{'event': kind, 'place_id': place_id, 'ids': ids} for place_id, ids in ids_by_place.items()]
+    if not postgres_bus:
+        transaction.on_commit(lambda: [broker.publish(event) for event in events])
+        return
+
+    # NOTIFY is delivered when the transaction commits, and never on rollback
+    with connection.cursor() as cursor:
+        for event in events:
+            payload = json.dumps(event)
+            if len(payload) > NOTIFY_MAX_BYTES:
+                payload = json.dumps({**event, 'ids': None})  # Clients refetch either way
+            cursor.execute('SELECT pg_notify(%s, %s)', [EVENTS_CHANNEL, payload])
+
+
+def _place_location(place_id):
+    """(latitude, longitude) of a place, or None when unknown"""
+    from .places import PlaceServiceUnavailable, get_places
+
+    try:
+        place = get_places([place_id]).get(place_id)
+    except PlaceServiceUnavailable:
+        return None
+    if place is None or place.get('latitude') is None:
+        return None
+    return float(place['latitude']), float(place['longitude'])
+
+
+def _parse_filters(query_string):
+    params = parse_qs(query_string.decode('latin-1'))
+    place_ids = bbox = None
+    if 'place_ids' in params:
+        try:
+            place_ids = {int(part) for part in params['place_ids'][0].split(',') if part}
+        except ValueError:
+            raise ValueError('place_ids must be a comma-separated list of ids')
+    if 'bbox' in params:
+        bbox = parse_bbox(params['bbox'][0])
+    if not place_ids and bbox is None:
+        raise ValueError('Subscribe with place_ids and/or bbox')
+    return place_ids, bbox
+
+
+def format_event(event_name, data):
+    """One Server-Sent Event carrying `data` as JSON"""
+    return f"event: {event_name}\ndata: {json.dumps(data, cls=DjangoJSONEncoder)}\n\n".encode()
+
+
+def _cors_headers(scope):
+    """Let the frontend origins read the stream, as corsheaders does for the API"""
+    origin = dict(scope.get('headers', ())).get(b'origin')
+    if origin is not None and origin.decode('latin-1') in settings.CORS_ALLOWED_ORIGINS:
+        return [(b'access-control-allow-origin', origin), (b'vary', b'Origin')]
+    return []
+
+
+async def _wait_for_disconnect(receive):
+    while (await receive())['type'] != 'http.disconnect':
+        pass
+
+
+async def availability_events(scope, receive, send):
+    """ASGI application streaming the events of the requested places"""
+    try:
+        place_ids, bbox = _parse_filters(scope.get('query_string', b''))
+    except ValueError as e:
+        await send({
+            'type': 'http.response.start', 'status': 400,
+            'headers': [(b'content-type', b'application/json')],
+        })
+        await send({'type': 'http.response.body', 'body': json.dumps({'error': str(e)}).encode()})
+        return
+
+    if uses_postgres_bus():
+        listener.start()
+    subscription = broker.subscribe(asyncio.get_running_loop(), place_ids, bbox)
+    disconnected = asyncio.ensure_future(_wait_for_disconnect(receive))
+    try:
+        await send({
+            'type': 'http.response.start', 'status': 200,
+            'headers': [
+                (b'content-type', b'text/event-stream'),
+                (b'cache-control', b'no-cache'),
+                (b'x-accel-buffering', b'no'),  # Stream through the nginx proxy
+                *_cors_headers(scope),
+            ],
+        })
+        await send({'type': 'http.response.body', 'body': b': subscribed\n\n', 'more_body': True})
+        while not disconnected.done():
+            if subscription.lagged:
+                # Events were dropped; the client refetches and reconnects
+                await send({'type': 'http.response.body', 'body': format_event('resync', {}), 'more_body': True})
+                break
+            next_event = asyncio.ensure_future(subscription.queue.get())
+            await asyncio.wait(
+                {next_event, disconnected}, timeout=settings.EVENTS_KEEPALIVE,
+                return_when=asyncio.FIRST_COMPLETED)
+            if not next_event.done():
+                next_event.cancel()
+                if not disconnected.done():
+                    await send({'type': 'http.response.body', 'body': b': keepalive\n\n', 'more_body': True})
+                continue
+            # Events are shared between subscribers, leave them untouched
+            event = next_event.result()
+            if event['place_id'] not in subscription.place_ids:
+                # Off the loop: the place may come from the remote place service
+                location = await sync_to_async(_place_location)(event['place_id'])
+                if location is None or not in_bbox(*location, subscription.bbox):
+                    continue
+            data = {key: value for key, value in event.items() if key != 'event'}
+            await send({'type': 'http.response.body', 'body': format_event(event['event'], data), 'more_body': True})
+        if not disconnected.done():
+            await send({'type': 'http.response.body', 'body': b''})
+    finally:
+        broker.unsubscribe(subscription)
+        disconnected.cancel()
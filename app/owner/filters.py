@@ -0,0 +1,41 @@
+import django_filters
+from django.conf import settings
+from .models import OwnerAvailability
+
+
+class IsoDateTimeRangeFilter(django_filters.BaseRangeFilter, django_filters.IsoDateTimeFilter):
+    """Two comma-separated ISO 8601 timestamps, e.g. ?overlaps=start,end"""
+
+
+class OwnerAvailabilityFilter(django_filters.FilterSet):
+    overlaps = IsoDateTimeRangeFilter(method='filter_overlaps')
+    at = django_filters.IsoDateTimeFilter(method='filter_at')
+
+    class Meta:
+        model = OwnerAvailability
+        fields = ['owner', 'place_id', 'dog', 'start_time', 'end_time']
+
+    def filter_overlaps(self, queryset, name, value):
+        start, end = value
+        return overlapping(queryset, start, end)
+
+    def filter_at(self, queryset, name, value):
+        return overlapping(queryset, value, value, inclusive_start=True)
+
+
+def overlapping(queryset, start, end, inclusive_start=False):
+    """
+    Availabilities whose [start_time, end_time) window overlaps [start, end).
+
+    Slots are at most AVAILABILITY_MAX_DURATION long (stored ones are
+    checked by owner.checks), so the start_time lower bound turns the
+    (place_id, start_time, end_time) index lookup into a bounded range scan
+    instead of a walk over the whole history.
+    """
+    queryset = queryset.filter(
+        start_time__gt=start - settings.AVAILABILITY_MAX_DURATION,
+        end_time__gt=start,
+    )
+    if inclusive_start:
+        return queryset.filter(start_time__lte=end)
+    return queryset.filter(start_time__lt=end)
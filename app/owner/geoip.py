@@ -0,0 +1,99 @@
+"""
+Client location from a local GeoIP database, used to place owners at login.
+
+Lookups read a MaxMind DB file (e.g. GeoLite2-City) memory-mapped from
+GEOIP_DATABASE_PATH, so no request leaves the server, and are cached per
+IP. Without the `maxminddb` package or a database file every lookup
+returns None and owners keep their stored location.
+"""
+import ipaddress
+import logging
+import threading
+
+from django.conf import settings
+
+from core.cache import TTLCache
+
+try:
+    import maxminddb
+except ImportError:  # pragma: no cover - optional dependency
+    maxminddb = None
+
+logger = logging.getLogger(__name__)
+
+NOT_FOUND = object()
+
+
+def client_ip(request):
+    """
+    The client's address: REMOTE_ADDR, or when GEOIP_PROXY_COUNT proxies
+    that append to X-Forwarded-For sit in front of the app, the address the
+    outermost of them saw.
+    """
+    proxies = settings.GEOIP_PROXY_COUNT
+    forwarded = request.META.get('HTTP_X_FORWARDED_FOR')
+    if proxies and forwarded:
+        hops = [hop.strip() for hop in forwarded.split(',') if hop.strip()]
+        if hops:
+            return hops[-min(proxies, len(hops))]
+    return request.META.get('REMOTE_ADDR')
+
+
+class GeoIPLocator:
+
+    def __init__(self, path, cache_size, cache_ttl):
+        self.path = path
+        self.cache = TTLCache(maxsize=cache_size, ttl=cache_ttl)
+        self._reader = None
+        self._lock = threading.Lock()
+
+    def _open(self):
+        if self._reader is None and maxminddb is not None and self.path:
+            with self._lock:
+                if self._reader is None:
+                    try:
+                        self._reader = maxminddb.open_database(self.path, maxminddb.MODE_MMAP)
+                    except (OSError, ValueError):
+                        logger.warning("GeoIP database %s could not be opened", self.path)
+                        self.path = None  # Do not retry on every login
+        return self._reader
+
+    def locate(self, ip):
+        """{"latitude", "longitude"} of a public IP address, or None"""
+        try:
+            address = ipaddress.ip_address(ip)
+        except (TypeError, ValueError):
+            return None
+        if not address.is_global:
+            return None
+
+        location = self.cache.get(ip, NOT_FOUND)
+        if location is NOT_FOUND:
+            location = self._lookup(address)
+            self.cache.set(ip, location)
+        return location
+
+    def _lookup(self, address):
+        reader = self._open()
+        if reader is None:
+            return None
+        try:
+            record = reader.get(str(address)) or {}
+        except ValueError:
+            return None
+        coordinates = record.get('location') or {}
+        if coordinates.get('latitude') is None or coordinates.get('longitude') is None:
+            return None
+        return {'latitude': coordinates['latitude'], 'longitude': coordinates['longitude']}
+
+
+locator = GeoIPLocator(
+    settings.GEOIP_DATABASE_PATH,
+    cache_size=settings.GEOIP_CACHE_SIZE,
+    cache_ttl=settings.GEOIP_CACHE_TTL,
+)
+
+
+def get_current_location(request):
+    """Where the client making `request` is, or None when unknown"""
+    return locator.locate(client_ip(request))
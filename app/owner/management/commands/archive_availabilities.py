@@ -0,0 +1,57 @@
+"""
+Django command to move availabilities that ended a while ago out of the
+live OwnerAvailability table, into OwnerAvailabilityArchive or nowhere.
+Meant to run on a schedule, e.g. nightly from cron.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from core.models import TableVersion, Tombstone
+from owner.models import OwnerAvailability, OwnerAvailabilityArchive
+
+ARCHIVED_FIELDS = ('id', 'owner_id', 'dog_id', 'place_id', 'start_time', 'end_time')
+
+
+class Command(BaseCommand):
+    """Django command to archive or prune past availabilities."""
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days', type=int, default=settings.AVAILABILITY_ARCHIVE_AFTER.days,
+            help='Move availabilities that ended more than this many days ago.')
+        parser.add_argument(
+            '--batch-size', type=int, default=settings.AVAILABILITY_ARCHIVE_BATCH_SIZE,
+            help='Rows moved per transaction.')
+        parser.add_argument(
+            '--prune', action='store_true',
+            help='Delete the availabilities instead of archiving them.')
+
+    def handle(self, *args, **options):
+        """Entrypoint for command."""
+        cutoff = timezone.now() - timedelta(days=options['days'])
+        expired = OwnerAvailability.objects.filter(end_time__lt=cutoff).order_by('id')
+        moved = 0
+        while True:
+            with transaction.atomic():
+                rows = list(expired.values(*ARCHIVED_FIELDS)[:options['batch_size']])
+                if not rows:
+                    break
+                if not options['prune']:
+                    OwnerAvailabilityArchive.objects.bulk_create(
+                        [OwnerAvailabilityArchive(**row) for row in rows], ignore_conflicts=True)
+                # Expired slots are dropped without per-row signals: no events
+                # or index updates for history, tombstones written in bulk
+                ids = [row['id'] for row in rows]
+                batch = OwnerAvailability.objects.filter(id__in=ids)
+                batch._raw_delete(batch.db)
+                label = OwnerAvailability._meta.label_lower
+                Tombstone.objects.bulk_create([Tombstone(model=label, object_id=object_id) for object_id in ids])
+                TableVersion.bump(label)
+            moved += len(rows)
+
+        action = 'Pruned' if options['prune'] else 'Archived'
+        self.stdout.write(self.style.SUCCESS(f'{action} {moved} availabilities.'))
@@ -0,0 +1,47 @@
+"""
+Django command to recompute the stored owner matches (MatchCandidate).
+With --pending it only refreshes the owners queued by the signals, once or
+every --interval seconds as a long-running worker (see
+docker-compose-deploy.yml); without, it rebuilds every owner.
+"""
+import time
+
+from django.core.management.base import BaseCommand
+
+from owner.match_store import queue_refresh, refresh_pending
+from owner.models import Owner
+
+
+class Command(BaseCommand):
+    """Django command to rebuild the match-candidate table."""
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--pending', action='store_true',
+            help='Only refresh the owners queued since the last run.')
+        parser.add_argument(
+            '--batch-size', type=int, default=100,
+            help='Owners claimed from the queue at a time.')
+        parser.add_argument(
+            '--interval', type=float,
+            help='With --pending, keep draining the queue every this many seconds.')
+
+    def handle(self, *args, **options):
+        """Entrypoint for command."""
+        batch_size = options['batch_size']
+        if not options['pending']:
+            batch = []
+            for owner_id in Owner.objects.values_list('id', flat=True).iterator():
+                batch.append(owner_id)
+                if len(batch) == batch_size:
+                    queue_refresh(batch)
+                    batch = []
+            queue_refresh(batch)
+        worker = options['pending'] and options['interval']
+        while True:
+            refreshed = refresh_pending(batch_size)
+            if refreshed or not worker:
+                self.stdout.write(self.style.SUCCESS(f'Refreshed matches of {refreshed} owners.'))
+            if not worker:
+                return
+            time.sleep(options['interval'])
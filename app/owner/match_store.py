@@ -0,0 +1,125 @@
+"""
+Precomputed matches: the MATCH_STORED_K best candidates of every owner in
+the MatchCandidate table, so that reading matches is one index range scan.
+
+A change to an owner or their dogs can move that owner in the rankings of
+the owners around them, so the signals queue a refresh (MatchRefresh) for
+the owner, the owners that have them stored as a match, and their nearest
+MATCH_CANDIDATES neighbours. An availability only feeds the availability
+feature, so it queues just the owners with time at the same place. The
+rebuild_matches command drains the queue, or rebuilds every owner; reads
+serve the stored rows and only compute owners that have none stored yet.
+"""
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .filters import overlapping
+from .matching import compute_matches
+from .models import MatchCandidate, MatchRefresh, Owner, OwnerAvailability
+from .spatial_index import owner_index
+
+
+def affected_owners(owner_id, location=None):
+    """Ids of the owners whose matches may change with those of `owner_id`"""
+    ids = {owner_id}
+    ids.update(MatchCandidate.objects.filter(candidate_id=owner_id).values_list('owner_id', flat=True))
+    location = location or owner_index.location(owner_id)
+    if location is not None:
+        nearby, _ = owner_index.nearby(
+            *location, settings.MATCH_RADIUS_KM, k=settings.MATCH_CANDIDATES)
+        ids.update(nearby)
+    return ids
+
+
+def availability_affected_owners(availabilities):
+    """
+    Ids of the owners whose availability feature may change with
+    `availabilities`: their owners, owners with upcoming time at the same
+    places in the same span, and owners that scored time shared with them
+    before (for the old place and times of an update)
+    """
+    owner_ids = {availability.owner_id for availability in availabilities}
+    ids = set(owner_ids)
+    ids.update(
+        MatchCandidate.objects.filter(candidate_id__in=owner_ids, breakdown__availability__gt=0)
+        .values_list('owner_id', flat=True)
+    )
+    by_place = defaultdict(list)
+    for availability in availabilities:
+        by_place[availability.place_id].append(availability)
+    for place_id, slots in by_place.items():
+        ids.update(overlapping(
+            OwnerAvailability.objects.filter(place_id=place_id, end_time__gt=timezone.now()),
+            min(slot.start_time for slot in slots),
+            max(slot.end_time for slot in slots),
+        ).values_list('owner_id', flat=True))
+    return ids
+
+
+def queue_refresh(owner_ids):
+    """Mark owners for the next rebuild_matches run; queuing twice is a no-op"""
+    MatchRefresh.objects.bulk_create(
+        [MatchRefresh(owner_id=owner_id) for owner_id in owner_ids], ignore_conflicts=True)
+
+
+def refresh_owner(owner):
+    """Recompute and store the matches of one owner"""
+    matches = compute_matches(owner, settings.MATCH_STORED_K)
+    with transaction.atomic():
+        # One refresh of an owner at a time (reads and the worker), so the
+        # delete sees the rows of the previous one before inserting
+        list(Owner.objects.select_for_update().filter(pk=owner.pk).values_list('pk'))
+        MatchCandidate.objects.filter(owner=owner).delete()
+        MatchCandidate.objects.bulk_create([
+            MatchCandidate(
+                owner=owner, candidate_id=match['owner_id'], score=match['score'],
+                distance_km=match['distance_km'], breakdown=match['breakdown'])
+            for match in matches
+        ])
+
+
+def refresh_pending(batch_size=100):
+    """Refresh every queued owner, a batch at a time; returns how many were refreshed"""
+    refreshed = 0
+    while True:
+        # Claim a batch first: owners queued again meanwhile get a new row
+        with transaction.atomic():
+            owner_ids = list(
+                MatchRefresh.objects.select_for_update(skip_locked=True)
+                .order_by('queued_at').values_list('owner_id', flat=True)[:batch_size]
+            )
+            if not owner_ids:
+                return refreshed
+            MatchRefresh.objects.filter(owner_id__in=owner_ids).delete()
+        # Owners deleted since they were queued took their rows with them
+        for owner in Owner.objects.filter(id__in=owner_ids):
+            refresh_owner(owner)
+            refreshed += 1
+
+
+def stored_matches(owner, limit=None):
+    """
+    The stored best `limit` matches of `owner` like owner.matching.find_matches
+    returns them. Queued owners are served their stored rows until the
+    rebuild_matches worker gets to them, except queued owners with nothing
+    stored yet (new owners), which are computed on the spot.
+    """
+    limit = settings.MATCH_TOP_N if limit is None else limit
+    rows = MatchCandidate.objects.filter(owner=owner).select_related('candidate__user').order_by('-score', 'id')
+    matches = list(rows[:limit])
+    # Deleting the queue row claims it: concurrent reads compute once
+    if not matches and MatchRefresh.objects.filter(owner_id=owner.pk).delete()[0]:
+        refresh_owner(owner)
+        matches = list(rows[:limit])
+
+    found = []
+    for match in matches:
+        candidate = match.candidate
+        candidate.score = match.score
+        candidate.distance_km = match.distance_km
+        candidate.score_breakdown = match.breakdown
+        found.append(candidate)
+    return found
@@ -0,0 +1,188 @@
+"""
+Owner matching: which other owners make good walking companions.
+
+Candidates are the MATCH_CANDIDATES nearest owners within MATCH_RADIUS_KM,
+straight from the per-worker spatial index (owners of the same city when
+the owner has no location). Each candidate is scored on five features in
+[0, 1], computed for the whole batch in numpy arrays:
+
+    distance      closer is better, 0 at the edge of the radius
+    owner_age     owners of a similar age
+    dog_age       the closest pair of dog ages
+    breed         same breed, or breeds sharing a word ("Labrador Retriever")
+    availability  upcoming time at the same place, see owner.meetups
+
+and ranked by their weighted sum. The whole run costs a handful of queries.
+"""
+import math
+from collections import defaultdict
+
+import numpy as np
+from django.conf import settings
+from django.utils import timezone
+
+from .filters import overlapping
+from .meetups import sweep_join
+from .models import Dog, Owner, OwnerAvailability
+from .spatial_index import owner_index
+
+# Weight of each feature in the score, summing to 1
+WEIGHTS = {
+    'distance': 0.3,
+    'owner_age': 0.15,
+    'dog_age': 0.15,
+    'breed': 0.15,
+    'availability': 0.25,
+}
+FEATURES = tuple(WEIGHTS)
+
+# Differences at which the age features fall to 1/e (years)
+OWNER_AGE_SCALE = 10
+DOG_AGE_SCALE = 3
+# Shared upcoming time at which the availability feature reaches 1 - 1/e
+OVERLAP_SCALE_HOURS = 2
+
+
+def normalize_breed(breed):
+    return " ".join(breed.split()).casefold()
+
+
+def breed_compatibility(breed, my_breeds):
+    """1 for a breed I have, 0.5 when it shares a word with one, else 0"""
+    if breed in my_breeds:
+        return 1.0
+    words = set(breed.split())
+    if any(words & set(mine.split()) for mine in my_breeds):
+        return 0.5
+    return 0.0
+
+
+def find_candidates(owner):
+    """(ids, distances in km) of the owners worth scoring for `owner`"""
+    if owner.location is not None:
+        ids, distances = owner_index.nearby(
+            *owner.location, settings.MATCH_RADIUS_KM,
+            k=settings.MATCH_CANDIDATES, exclude=owner.pk)
+        return np.array(ids, dtype=np.int64), np.array(distances, dtype=np.float64)
+    ids = list(
+        Owner.objects.filter(city__iexact=owner.city).exclude(pk=owner.pk)
+        .order_by('id').values_list('id', flat=True)[:settings.MATCH_CANDIDATES]
+    )
+    return np.array(ids, dtype=np.int64), np.full(len(ids), np.nan)
+
+
+def score_candidates(owner, ids, distances):
+    """
+    Feature matrix (one row per candidate, columns in FEATURES order) of the
+    candidates `ids` at `distances` km from `owner`
+    """
+    features = np.zeros((len(ids), len(FEATURES)))
+    if not len(ids):
+        return features
+    position = {owner_id: i for i, owner_id in enumerate(ids.tolist())}
+    column = {feature: i for i, feature in enumerate(FEATURES)}
+
+    features[:, column['distance']] = np.nan_to_num(
+        np.clip(1 - distances / settings.MATCH_RADIUS_KM, 0, 1))
+
+    ages = dict(Owner.objects.filter(id__in=position).values_list('id', 'age'))
+    if ages:
+        rows_at = np.array([position[owner_id] for owner_id in ages])
+        gaps = np.abs(np.fromiter(ages.values(), dtype=np.float64, count=len(ages)) - owner.age)
+        features[rows_at, column['owner_age']] = np.exp(-gaps / OWNER_AGE_SCALE)
+
+    my_dogs = list(Dog.objects.filter(owner=owner).values_list('age', 'breed'))
+    if my_dogs:
+        rows = list(Dog.objects.filter(owner_id__in=position).values_list('owner_id', 'age', 'breed'))
+        if rows:
+            owner_ids, dog_ages, breeds = zip(*rows)
+            rows_at = np.array([position[owner_id] for owner_id in owner_ids])
+            my_ages = np.array([age for age, _ in my_dogs], dtype=np.float64)
+            gaps = np.abs(np.array(dog_ages, dtype=np.float64)[:, None] - my_ages[None, :]).min(axis=1)
+            np.maximum.at(features[:, column['dog_age']], rows_at, np.exp(-gaps / DOG_AGE_SCALE))
+
+            # Few distinct breeds: compare each once, then spread over the dogs
+            my_breeds = {normalize_breed(breed) for _, breed in my_dogs}
+            unique, inverse = np.unique([normalize_breed(breed) for breed in breeds], return_inverse=True)
+            compatibility = np.array([breed_compatibility(breed, my_breeds) for breed in unique])
+            np.maximum.at(features[:, column['breed']], rows_at, compatibility[inverse])
+
+    my_slots = list(OwnerAvailability.objects.filter(owner=owner, end_time__gt=timezone.now()))
+    if my_slots:
+        their_slots = overlapping(
+            OwnerAvailability.objects.filter(
+                owner_id__in=position, place_id__in={slot.place_id for slot in my_slots}),
+            min(slot.start_time for slot in my_slots),
+            max(slot.end_time for slot in my_slots),
+        ).only('owner_id', 'place_id', 'start_time', 'end_time')
+        hours = defaultdict(float)
+        for _, theirs, start, end in sweep_join(my_slots, their_slots):
+            hours[theirs.owner_id] += (end - start).total_seconds() / 3600
+        if hours:
+            rows_at = np.array([position[owner_id] for owner_id in hours])
+            overlap = np.fromiter(hours.values(), dtype=np.float64, count=len(hours))
+            features[rows_at, column['availability']] = 1 - np.exp(-overlap / OVERLAP_SCALE_HOURS)
+
+    return features
+
+
+def compute_matches(owner, limit=None):
+    """
+    The best `limit` (MATCH_TOP_N by default) candidates for `owner`, best
+    first, as dicts of owner_id, score, distance_km (None when unknown) and
+    the per-feature breakdown.
+    """
+    limit = settings.MATCH_TOP_N if limit is None else limit
+    ids, distances = find_candidates(owner)
+    features = score_candidates(owner, ids, distances)
+    scores = features @ np.array([WEIGHTS[feature] for feature in FEATURES])
+
+    # Best score first, then nearest, then oldest account
+    order = np.lexsort((ids, np.nan_to_num(distances, nan=np.inf), -scores))[:limit]
+    return [
+        {
+            'owner_id': int(ids[i]),
+            'score': round(float(scores[i]), 4),
+            'distance_km': None if math.isnan(distances[i]) else round(float(distances[i]), 3),
+            'breakdown': {
+                feature: round(float(value), 4) for feature, value in zip(FEATURES, features[i])
+            },
+        }
+        for i in order
+    ]
+
+
+def find_matches(owner, limit=None):
+    """compute_matches hydrated: Owners with score, distance_km and score_breakdown set"""
+    matches = compute_matches(owner, limit)
+    owners = Owner.objects.select_related('user').in_bulk([match['owner_id'] for match in matches])
+    found = []
+    for match in matches:
+        candidate = owners.get(match['owner_id'])
+        if candidate is not None:
+            candidate.score = match['score']
+            candidate.distance_km = match['distance_km']
+            candidate.score_breakdown = match['breakdown']
+            found.append(candidate)
+    return found
+
+
+REASONS = {
+    'distance': "lives nearby",
+    'owner_age': "is close to your age",
+    'dog_age': "has a dog of a similar age to yours",
+    'breed': "has a dog of a breed like yours",
+    'availability': "will be at the same place as you soon",
+}
+
+
+def explain_match(match):
+    """One sentence on why `match` (from find_matches) ranks where it does"""
+    contributions = sorted(
+        ((WEIGHTS[feature] * value, feature) for feature, value in match.score_breakdown.items()),
+        reverse=True)
+    reasons = [REASONS[feature] for contribution, feature in contributions[:2] if contribution > 0]
+    name = f"{match.user.first_name} {match.user.last_name}".strip() or match.user.username
+    if not reasons:
+        return f"{name} is your best match."
+    return f"{name} is your best match: {name.split()[0]} {' and '.join(reasons)}."
@@ -0,0 +1,42 @@
+"""
+Meetup matching: which other owners are at the same place at the same time.
+"""
+import heapq
+from collections import defaultdict
+from itertools import count
+
+
+def sweep_join(mine, others):
+    """
+    Pair every slot in `mine` with every slot in `others` that overlaps it
+    at the same place_id, as (my_slot, other_slot, overlap_start, overlap_end).
+
+    Each place is swept once in start_time order while the slots still open
+    on either side are kept in heaps keyed by end_time, so the cost is
+    O(n log n) plus the number of pairs returned.
+    """
+    by_place = defaultdict(list)
+    for side, slots in enumerate((mine, others)):
+        for slot in slots:
+            by_place[slot.place_id].append((slot.start_time, side, slot))
+
+    tiebreak = count()
+    pairs = []
+    for events in by_place.values():
+        events.sort(key=lambda event: (event[0], event[1]))
+        open_slots = ([], [])  # heaps of (end_time, tiebreak, slot) per side
+        for start, side, slot in events:
+            for heap in open_slots:
+                while heap and heap[0][0] <= start:
+                    heapq.heappop(heap)
+            # Everything still open on the other side overlaps this slot
+            for end, _, other in open_slots[1 - side]:
+                overlap_end = min(end, slot.end_time)
+                if side == 0:
+                    pairs.append((slot, other, start, overlap_end))
+                else:
+                    pairs.append((other, slot, start, overlap_end))
+            heapq.heappush(open_slots[side], (slot.end_time, next(tiebreak), slot))
+
+    pairs.sort(key=lambda pair: (pair[2], pair[0].pk or 0, pair[1].pk or 0))
+    return pairs
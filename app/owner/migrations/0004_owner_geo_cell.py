@@ -0,0 +1,28 @@
+# Generated by Django 3.2.25 on 2026-10-18 11:53
+
+from django.db import migrations, models
+
+from core.geo import grid_cell
+
+
+def populate_geo_cell(apps, schema_editor):
+    Owner = apps.get_model('owner', 'Owner')
+    owners = Owner.objects.filter(latitude__isnull=False, longitude__isnull=False)
+    for owner in owners.iterator():
+        owner.geo_cell = grid_cell(owner.latitude, owner.longitude)
+        owner.save(update_fields=['geo_cell'])
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('owner', '0003_auto_20250624_1536'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='owner',
+            name='geo_cell',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=24, null=True),
+        ),
+        migrations.RunPython(populate_geo_cell, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 3.2.25 on 2026-10-18 12:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('owner', '0004_owner_geo_cell'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='owneravailability',
+            index=models.Index(fields=['place_id', 'start_time', 'end_time'], name='availability_place_time_idx'),
+        ),
+    ]
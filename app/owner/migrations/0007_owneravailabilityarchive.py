@@ -0,0 +1,30 @@
+# Generated by Django 3.2.25 on 2026-10-18 12:12
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('owner', '0006_updated_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OwnerAvailabilityArchive',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('place_id', models.BigIntegerField()),
+                ('start_time', models.DateTimeField()),
+                ('end_time', models.DateTimeField()),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+                ('dog', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='owner.dog')),
+                ('owner', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='owner.owner')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='owneravailabilityarchive',
+            index=models.Index(fields=['place_id', 'start_time'], name='archive_place_time_idx'),
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 3.2.25 on 2026-10-18 12:24
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('owner', '0007_owneravailabilityarchive'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MatchRefresh',
+            fields=[
+                ('owner_id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('queued_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='MatchCandidate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('score', models.FloatField()),
+                ('distance_km', models.FloatField(null=True)),
+                ('breakdown', models.JSONField()),
+                ('candidate', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='owner.owner')),
+                ('owner', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='owner.owner')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='matchcandidate',
+            index=models.Index(fields=['owner', '-score'], name='match_owner_score_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='matchcandidate',
+            constraint=models.UniqueConstraint(fields=('owner', 'candidate'), name='match_owner_candidate_unique'),
+        ),
+    ]
@@ -0,0 +1,42 @@
+from datetime import timedelta
+
+from django.db import migrations
+
+# The AVAILABILITY_MAX_DURATION default when this ran; migrations must not
+# change with settings, owner.checks compares the stored slots to the setting
+MAX_DURATION = timedelta(hours=24)
+
+
+def split_long_availabilities(apps, schema_editor):
+    """
+    Availabilities created before AVAILABILITY_MAX_DURATION was enforced can
+    be longer, and the time-window queries (owner.filters.overlapping) do
+    not see them. Cut each into back-to-back slots of at most MAX_DURATION.
+    """
+    OwnerAvailability = apps.get_model('owner', 'OwnerAvailability')
+    max_duration = MAX_DURATION
+    for availability in OwnerAvailability.objects.all().iterator():
+        if availability.end_time - availability.start_time <= max_duration:
+            continue
+        parts = []
+        start = availability.start_time + max_duration
+        while start < availability.end_time:
+            end = min(start + max_duration, availability.end_time)
+            parts.append(OwnerAvailability(
+                owner_id=availability.owner_id, dog_id=availability.dog_id,
+                place_id=availability.place_id, start_time=start, end_time=end))
+            start = end
+        OwnerAvailability.objects.bulk_create(parts)
+        availability.end_time = availability.start_time + max_duration
+        availability.save(update_fields=['end_time', 'updated_at'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('owner', '0008_matchcandidate'),
+    ]
+
+    operations = [
+        migrations.RunPython(split_long_availabilities, migrations.RunPython.noop),
+    ]
@@ -1,5 +1,6 @@
 from django.contrib.auth.models import User
 from django.db import models
+from core.geo import grid_cell
 
 
 class Owner(models.Model):
@@ -11,10 +12,45 @@ class Owner(models.Model):
     picture = models.ImageField(upload_to='owner_pictures/', blank=True, null=True)
     latitude = models.DecimalField(max_digits=9, decimal_places=6, null=True, blank=True)
     longitude = models.DecimalField(max_digits=9, decimal_places=6, null=True, blank=True)
+    # Spatial grid key derived from latitude/longitude, see core.geo
+    geo_cell = models.CharField(max_length=24, null=True, blank=True, editable=False, db_index=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
 
     def __str__(self):
         return self.user.username
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the stored location so saves can tell whether it moved
+        instance._stored_location = instance.location
+        return instance
+
+    @property
+    def location(self):
+        """(lat, lon) as floats, or None when the owner has no location"""
+        latitude = self.__dict__.get('latitude')
+        longitude = self.__dict__.get('longitude')
+        if latitude is None or longitude is None:
+            return None
+        return round(float(latitude), 6), round(float(longitude), 6)
+
+    @property
+    def location_changed(self):
+        return getattr(self, '_stored_location', ...) != self.location
+
+    def save(self, *args, **kwargs):
+        # Keep the grid key in step with the coordinates
+        if self.latitude is not None and self.longitude is not None:
+            self.geo_cell = grid_cell(self.latitude, self.longitude)
+        else:
+            self.geo_cell = None
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and {'latitude', 'longitude'} & set(update_fields):
+            kwargs['update_fields'] = set(update_fields) | {'geo_cell', 'updated_at'}
+        super().save(*args, **kwargs)
+        self._stored_location = self.location
+
 
 class Dog(models.Model):
     owner = models.ForeignKey(Owner, on_delete=models.CASCADE, related_name='dogs')
@@ -23,6 +59,7 @@ class Dog(models.Model):
     age = models.PositiveIntegerField()
     about = models.TextField(blank=True)
     picture = models.ImageField(upload_to='dog_pictures/', blank=True, null=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
 
     def __str__(self):
         return f"{self.name} ({self.breed})"
@@ -34,6 +71,14 @@ class OwnerAvailability(models.Model):
     place_id = models.BigIntegerField()
     start_time = models.DateTimeField()
     end_time = models.DateTimeField()
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    class Meta:
+        indexes = [
+            # Serves place + time window lookups, see owner.filters.overlapping
+            models.Index(fields=['place_id', 'start_time', 'end_time'],
+                         name='availability_place_time_idx'),
+        ]
 
     def __str__(self):
         return (
@@ -41,4 +86,63 @@ class OwnerAvailability(models.Model):
             f" with {self.dog}"
             f" from {self.start_time.strftime('%Y-%m-%d %H:%M')}"
             f" to {self.end_time.strftime('%Y-%m-%d %H:%M')}"
-        )
\ No newline at end of file
+        )
+
+
+class OwnerAvailabilityArchive(models.Model):
+    """
+    Cold storage for availabilities that ended a while ago, moved out of
+    OwnerAvailability by the archive_availabilities command so live queries
+    and their indexes only cover current and upcoming slots. Rows keep the
+    id they had in OwnerAvailability.
+    """
+    id = models.BigIntegerField(primary_key=True)
+    owner = models.ForeignKey(Owner, on_delete=models.CASCADE, related_name='+')
+    dog = models.ForeignKey(Dog, on_delete=models.CASCADE, related_name='+')
+    place_id = models.BigIntegerField()
+    start_time = models.DateTimeField()
+    end_time = models.DateTimeField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['place_id', 'start_time'], name='archive_place_time_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.owner} was at place_id {self.place_id} with {self.dog} on {self.start_time:%Y-%m-%d}"
+
+
+class MatchCandidate(models.Model):
+    """
+    One of the MATCH_STORED_K best matches of an owner as last scored by
+    owner.matching, kept up to date by owner.match_store.
+    """
+    # Covered by the (owner, -score) index
+    owner = models.ForeignKey(Owner, on_delete=models.CASCADE, related_name='+', db_index=False)
+    candidate = models.ForeignKey(Owner, on_delete=models.CASCADE, related_name='+')
+    score = models.FloatField()
+    distance_km = models.FloatField(null=True)
+    breakdown = models.JSONField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['owner', 'candidate'], name='match_owner_candidate_unique'),
+        ]
+        indexes = [
+            # Serves an owner's matches best first in one index range scan
+            models.Index(fields=['owner', '-score'], name='match_owner_score_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.candidate} for {self.owner} ({self.score:.3f})"
+
+
+class MatchRefresh(models.Model):
+    """
+    Owners whose stored matches are out of date, queued by the signals and
+    drained by the rebuild_matches command. No foreign key: rows may be
+    queued for an owner in the middle of being deleted.
+    """
+    owner_id = models.BigIntegerField(primary_key=True)
+    queued_at = models.DateTimeField(auto_now_add=True, db_index=True)
@@ -0,0 +1,275 @@
+"""
+Place resolution for the owner app.
+
+Lookups use the place app's models directly when it is installed in the
+same project and fall back to the place service's HTTP API otherwise.
+
+Places almost never change, so lookups go through a TTL+LRU cache of
+id -> place and normalized name -> id, evicted by the Place signals.
+"""
+from urllib.parse import parse_qs, urlsplit
+
+import requests
+from django.apps import apps
+from django.conf import settings
+
+from core.cache import TTLCache
+from core.http import CircuitBreaker, pooled_session
+from core.singleflight import SingleFlight
+
+# Keep bulk lookups well under common URL length limits
+MAX_IDS_PER_REQUEST = 200
+
+place_cache = TTLCache(
+    maxsize=settings.PLACE_CACHE_MAX_ENTRIES,
+    ttl=settings.PLACE_CACHE_TTL,
+    shared_prefix='owner:place' if settings.PLACE_CACHE_SHARED else None,
+)
+
+
+class PlaceServiceError(Exception):
+    """The place service could not resolve or create a place"""
+
+
+class PlaceServiceUnavailable(PlaceServiceError):
+    """The place service is down, slow or its circuit breaker is open"""
+
+
+class PlaceServiceClient:
+    """
+    Shared HTTP client for PLACE_SERVICE_URL: pooled keep-alive connections,
+    bounded connect/read timeouts, retried GETs and a circuit breaker.
+    """
+
+    def __init__(self):
+        self.session = pooled_session(
+            pool_size=settings.PLACE_SERVICE_POOL_SIZE,
+            retries=settings.PLACE_SERVICE_RETRIES,
+        )
+        self.timeout = (
+            settings.PLACE_SERVICE_CONNECT_TIMEOUT,
+            settings.PLACE_SERVICE_READ_TIMEOUT,
+        )
+        self.breaker = CircuitBreaker(
+            failure_threshold=settings.PLACE_SERVICE_BREAKER_THRESHOLD,
+            reset_timeout=settings.PLACE_SERVICE_BREAKER_RESET,
+        )
+
+    def request(self, method, path, **kwargs):
+        if not self.breaker.allow():
+            raise PlaceServiceUnavailable('Place service is unavailable')
+        try:
+            response = self.session.request(
+                method, f"{settings.PLACE_SERVICE_URL}{path}", timeout=self.timeout, **kwargs)
+        except requests.RequestException as e:
+            self.breaker.record_failure()
+            raise PlaceServiceUnavailable('Place service is unavailable') from e
+        if response.status_code >= 500:
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_success()
+        return response
+
+    def get(self, path, **kwargs):
+        return self.request('GET', path, **kwargs)
+
+    def post(self, path, **kwargs):
+        return self.request('POST', path, **kwargs)
+
+
+place_client = PlaceServiceClient()
+
+
+# Concurrent lookups of the same place name share one find/create round trip
+place_lookups = SingleFlight()
+
+
+def normalize_place_name(name):
+    return " ".join(name.split()).casefold()
+
+
+def _id_key(place_id):
+    return f"id:{place_id}"
+
+
+def _name_key(name):
+    return f"name:{normalize_place_name(name)}"
+
+
+def cache_place(place):
+    """Remember a place dict returned by the place service"""
+    place_cache.set(_id_key(place['id']), place)
+    place_cache.set(_name_key(place['name']), place['id'])
+
+
+def evict_place(place_id, name=None):
+    place_cache.delete(_id_key(place_id))
+    if name:
+        place_cache.delete(_name_key(name))
+
+
+class RemotePlaceBackend:
+    """Places served by a separately deployed place service, over HTTP"""
+
+    def list_places(self, params):
+        """Every place matching the filters, following the cursor pages"""
+        params = {**params, "page_size": settings.API_MAX_PAGE_SIZE}
+        places = []
+        while True:
+            response = place_client.get("places/", params=params)
+            if response.status_code != 200:
+                raise PlaceServiceUnavailable('Place service could not list places')
+            page = response.json()
+            places.extend(page['results'])
+            if not page.get('next'):
+                return places
+            params['cursor'] = parse_qs(urlsplit(page['next']).query)['cursor'][0]
+
+    def get_places(self, place_ids):
+        places = []
+        for start in range(0, len(place_ids), MAX_IDS_PER_REQUEST):
+            batch = place_ids[start:start + MAX_IDS_PER_REQUEST]
+            places.extend(self.list_places({"ids": ",".join(map(str, batch))}))
+        return places
+
+    def get_places_in_bbox(self, bbox):
+        return self.list_places({"bbox": ",".join(map(str, bbox))})
+
+    def get_clusters(self, bbox, zoom):
+        response = place_client.get(
+            "clusters/", params={"bbox": ",".join(map(str, bbox)), "zoom": zoom})
+        if response.status_code != 200:
+            raise PlaceServiceUnavailable('Place service could not cluster places')
+        return response.json()
+
+    def find_place(self, place_name):
+        response = place_client.get("places/", params={"name": place_name})
+        if response.status_code == 200 and response.json()['results']:
+            return response.json()['results'][0]
+        return None
+
+    def create_place(self, place_name):
+        response = place_client.post("create/", json={"name": place_name})
+        if response.status_code == 503:
+            raise PlaceServiceUnavailable('Place service could not geocode the place')
+        if response.status_code not in (200, 201):
+            raise PlaceServiceError('Place could not be created in Place Service')
+        place = response.json()
+        if not place.get('id'):
+            raise PlaceServiceError('Place creation failed: No ID returned')
+        return place
+
+
+class LocalPlaceBackend:
+    """Places from the co-deployed place app, straight through its models"""
+
+    def get_places(self, place_ids):
+        from place.models import Place
+        from place.serializers import PlaceSerializer
+
+        return PlaceSerializer(Place.objects.filter(id__in=place_ids), many=True).data
+
+    def get_places_in_bbox(self, bbox):
+        from place.models import Place
+        from place.serializers import PlaceSerializer
+
+        return PlaceSerializer(Place.objects.in_bbox(bbox), many=True).data
+
+    def get_clusters(self, bbox, zoom):
+        from place.clustering import clusters_in_bbox
+
+        return clusters_in_bbox(bbox, zoom)
+
+    def find_place(self, place_name):
+        from place.search import search_index
+
+        # Also matches names that only differ in case or spacing
+        return search_index.exact(place_name)
+
+    def create_place(self, place_name):
+        from place.serializers import PlaceSerializer
+        from place.services import create_place
+        from place.utils import GeocodingError
+
+        try:
+            result = create_place(place_name)
+        except GeocodingError as e:
+            raise PlaceServiceUnavailable('Place could not be geocoded') from e
+        if not result:
+            raise PlaceServiceError('Place could not be created in Place Service')
+        return PlaceSerializer(result[0]).data
+
+
+remote_backend = RemotePlaceBackend()
+local_backend = LocalPlaceBackend()
+
+
+def get_backend():
+    """
+    The in-process backend when the place app runs in this Django project,
+    HTTP otherwise. PLACE_SERVICE_MODE ("local"/"remote") forces either.
+    """
+    mode = settings.PLACE_SERVICE_MODE
+    if mode == 'local' or (mode == 'auto' and apps.is_installed('place')):
+        return local_backend
+    return remote_backend
+
+
+def get_places(place_ids):
+    """Resolve place ids to place dicts, fetching all cache misses at once"""
+    places = {}
+    missing = []
+    for place_id in sorted(set(place_ids)):
+        place = place_cache.get(_id_key(place_id))
+        if place is None:
+            missing.append(place_id)
+        else:
+            places[place_id] = place
+
+    if missing:
+        try:
+            fetched = get_backend().get_places(missing)
+        except PlaceServiceUnavailable:
+            fetched = []  # Degraded place service: show what the cache has
+        for place in fetched:
+            cache_place(place)
+            places[place['id']] = place
+    return places
+
+
+def get_places_in_bbox(bbox):
+    """Place dicts inside a (min_lon, min_lat, max_lon, max_lat) box"""
+    places = get_backend().get_places_in_bbox(bbox)
+    for place in places:
+        cache_place(place)
+    return places
+
+
+def get_clusters(bbox, zoom):
+    """Clusters (or single places at high zoom) inside a bbox, see place.clustering"""
+    return get_backend().get_clusters(bbox, zoom)
+
+
+def get_place_names(place_ids):
+    """Resolve place ids to names"""
+    return {place_id: place['name'] for place_id, place in get_places(place_ids).items()}
+
+
+def get_or_create_place_id(place_name):
+    """Return the id of the place called `place_name`, creating it if needed"""
+    place_id = place_cache.get(_name_key(place_name))
+    if place_id is not None:
+        return place_id
+
+    place, _ = place_lookups.do(normalize_place_name(place_name), lambda: _find_or_create_place(place_name))
+    return place['id']
+
+
+def _find_or_create_place(place_name):
+    backend = get_backend()
+    place = backend.find_place(place_name) or backend.create_place(place_name)
+
+    cache_place(place)
+    # The geocoded name may differ from what was asked for
+    place_cache.set(_name_key(place_name), place['id'])
+    return place
@@ -1,8 +1,15 @@
+from django.conf import settings
 from django.contrib.auth.models import User
-import os
-from rest_framework import serializers
-import requests
-from .models import Owner, Dog, OwnerAvailability
+from django.db import models, transaction
+from datetime import datetime, timedelta
+from itertools import islice
+import pytz
+from rest_framework import exceptions, serializers
+from core.models import TableVersion
+from .models import Owner, Dog, OwnerAvailability, OwnerAvailabilityArchive
+from .places import (
+    PlaceServiceError, PlaceServiceUnavailable, get_or_create_place_id, get_place_names,
+)
 
 class BaseOwnerSerializer(serializers.ModelSerializer):
     # Fields from User model
@@ -18,11 +25,28 @@ class BaseOwnerSerializer(serializers.ModelSerializer):
     class Meta:
         model = Owner
         fields = [
-            'first_name', 'last_name',
+            'id', 'first_name', 'last_name',
             'gender', 'age', 'city', 'about_me', 'picture'
         ]
 
 
+class NearbyOwnerSerializer(BaseOwnerSerializer):
+    distance_km = serializers.FloatField(read_only=True)  # Set by NearbyOwnersViewSet
+
+    class Meta(BaseOwnerSerializer.Meta):
+        fields = BaseOwnerSerializer.Meta.fields + ['distance_km']
+
+
+class OwnerMatchSerializer(BaseOwnerSerializer):
+    # Set by owner.matching.find_matches and owner.match_store.stored_matches
+    score = serializers.FloatField(read_only=True)
+    distance_km = serializers.FloatField(read_only=True, allow_null=True)
+    score_breakdown = serializers.DictField(child=serializers.FloatField(), read_only=True)
+
+    class Meta(BaseOwnerSerializer.Meta):
+        fields = BaseOwnerSerializer.Meta.fields + ['score', 'distance_km', 'score_breakdown']
+
+
 class RegisterSerializer(BaseOwnerSerializer):
     # Fields from User model
     username = serializers.CharField(source='user.username', max_length=30, required=True)
@@ -58,7 +82,59 @@ class RegisterSerializer(BaseOwnerSerializer):
         return user
 
 
-PLACE_SERVICE_URL = os.environ.get("PLACE_SERVICE_URL", "http://localhost:8000/api/place/")
+def validate_time_window(start_time, end_time):
+    """Slots must end after they start and last at most AVAILABILITY_MAX_DURATION"""
+    if start_time is None or end_time is None:
+        return
+    if end_time <= start_time:
+        raise serializers.ValidationError({'end_time': 'End time must be after start time.'})
+    if end_time - start_time > settings.AVAILABILITY_MAX_DURATION:
+        raise serializers.ValidationError(
+            {'end_time': f'Availability can last at most {settings.AVAILABILITY_MAX_DURATION}.'})
+
+
+class PlaceServiceDown(exceptions.APIException):
+    status_code = 503
+    default_detail = 'Place service is unavailable, try again later.'
+    default_code = 'place_service_unavailable'
+
+
+def resolve_owner_dog_place(owner_username, dog, place_name):
+    """Look up the Owner, their Dog and the place id an availability refers to"""
+
+    # Get Owner object
+    owner = Owner.objects.filter(user__username=owner_username).first()
+    if not owner:
+        raise serializers.ValidationError({'owner_username': 'Owner not found'})
+
+    # Get Dog object
+    dog_instance = Dog.objects.filter(owner=owner, name=dog).first()
+    if not dog_instance:
+        raise serializers.ValidationError({'dog': 'Dog not found for this owner'})
+
+    # Fetch place_id from Place Service API (creating the place if needed)
+    try:
+        place_id = get_or_create_place_id(place_name)
+    except PlaceServiceUnavailable as e:
+        raise PlaceServiceDown(str(e))
+    except PlaceServiceError as e:
+        raise serializers.ValidationError({'place_name': str(e)})
+
+    return owner, dog_instance, place_id
+
+
+class OwnerAvailabilityListSerializer(serializers.ListSerializer):
+    """Resolve the place names of a whole page with one place-service call"""
+
+    def to_representation(self, data):
+        instances = list(data.all() if isinstance(data, models.Manager) else data)
+        self.child.place_names = get_place_names(
+            instance.place_id for instance in instances)
+        try:
+            return [self.child.to_representation(instance) for instance in instances]
+        finally:
+            del self.child.place_names
+
 
 class OwnerAvailabilitySerializer(serializers.ModelSerializer):
     owner_username = serializers.CharField(write_only=True)  # Accept owner_username in input
@@ -71,50 +147,26 @@ class OwnerAvailabilitySerializer(serializers.ModelSerializer):
     class Meta:
         model = OwnerAvailability
         # fields = '__all__'  # Include all fields in the model
-        fields = ['owner_username', 'dog', 'place_name', 'place_id', 'start_time', 'end_time']
+        fields = ['id', 'owner_username', 'dog', 'place_name', 'place_id', 'start_time', 'end_time']
+        list_serializer_class = OwnerAvailabilityListSerializer
+
+    def validate(self, attrs):
+        # A partial update is checked against the bound it leaves unchanged
+        validate_time_window(
+            attrs.get('start_time', getattr(self.instance, 'start_time', None)),
+            attrs.get('end_time', getattr(self.instance, 'end_time', None)),
+        )
+        return attrs
 
     def create(self, validated_data):
         """Manually retrieve Owner and Place ID before saving"""
 
         # Extract owner_username & place_name from validated_data
-        owner_username = validated_data.pop('owner_username')
-        dog = validated_data.pop('dog')
-        place_name = validated_data.pop('place_name')
-
-        # Get Owner object
-        owner = Owner.objects.filter(user__username=owner_username).first()
-        if not owner:
-            raise serializers.ValidationError({'owner_username': 'Owner not found'})
-        
-        # Get Dog object
-        dog_instance = Dog.objects.filter(owner=owner, name=dog).first()
-        if not dog_instance:
-            raise serializers.ValidationError({'dog': 'Dog not found for this owner'})
-
-        # Fetch place_id from Place Service API
-        response = requests.get(f"{PLACE_SERVICE_URL}places?name={place_name}")
-
-        print(f"Using PLACE_SERVICE_URL: {PLACE_SERVICE_URL}", flush=True) # Debugging
-        print(f"place_name: {place_name}", flush=True) # Debugging
-        print(f"response: {response}", flush=True) # Debugging
-
-        if response.status_code == 200 and response.json():
-            print("place found in Place Service")
-            place_id = response.json()[0]['id']  # Extract place_id from API response
-        else:
-            # create place with place_name
-            print("place not found in Place Service, creating new place")
-            create_response = requests.post(
-                f"{PLACE_SERVICE_URL}create/",
-                json={"name": place_name}
-            )
-            if create_response.status_code in (200, 201):
-                place_id = create_response.json().get('id')
-                print(f"Created place with ID: {place_id}")
-                if not place_id:
-                    raise serializers.ValidationError({'place_name': 'Place creation failed: No ID returned'})
-            else:
-                raise serializers.ValidationError({'place_name': 'Place could not be created in Place Service'})
+        owner, dog_instance, place_id = resolve_owner_dog_place(
+            validated_data.pop('owner_username'),
+            validated_data.pop('dog'),
+            validated_data.pop('place_name'),
+        )
 
         # Now create ProfileAvailability (without profile_username & place_name)
         return OwnerAvailability.objects.create(
@@ -132,16 +184,132 @@ class OwnerAvailabilitySerializer(serializers.ModelSerializer):
         data['owner_username'] = instance.owner.user.username
         data['dog'] = instance.dog.name
 
-        # Call the Place Service API to get place_name
-        response = requests.get(f"{PLACE_SERVICE_URL}places/{instance.place_id}/")
-        if response.status_code == 200:
-            data['place_name'] = response.json().get('name', 'Unknown')
-        else:
-            data['place_name'] = 'Unknown'
+        # Names are prefetched for the whole page when listing
+        place_names = getattr(self, 'place_names', None)
+        if place_names is None:
+            place_names = get_place_names([instance.place_id])
+        data['place_name'] = place_names.get(instance.place_id, 'Unknown')
 
         return data
 
 
+class AvailabilitySlotSerializer(serializers.Serializer):
+    start_time = serializers.DateTimeField()
+    end_time = serializers.DateTimeField()
+
+    def validate(self, attrs):
+        validate_time_window(attrs['start_time'], attrs['end_time'])
+        return attrs
+
+
+class RecurrenceSerializer(serializers.Serializer):
+    """A daily time window repeated on some weekdays between two dates"""
+    start_date = serializers.DateField()
+    end_date = serializers.DateField()
+    weekdays = serializers.ListField(  # Monday is 0, as in date.weekday()
+        child=serializers.IntegerField(min_value=0, max_value=6),
+        min_length=1, default=lambda: list(range(7)))
+    start_time = serializers.TimeField()
+    end_time = serializers.TimeField()
+    timezone = serializers.CharField(default=settings.TIME_ZONE)
+
+    def validate_timezone(self, value):
+        try:
+            return pytz.timezone(value)
+        except pytz.UnknownTimeZoneError:
+            raise serializers.ValidationError('Unknown time zone.')
+
+    def validate(self, attrs):
+        if attrs['end_date'] < attrs['start_date']:
+            raise serializers.ValidationError({'end_date': 'End date must not be before start date.'})
+        if attrs['end_time'] <= attrs['start_time']:
+            raise serializers.ValidationError({'end_time': 'End time must be after start time.'})
+        tz = attrs['timezone']
+        try:
+            for day, clock in ((attrs['start_date'], attrs['start_time']), (attrs['end_date'], attrs['end_time'])):
+                tz.localize(datetime.combine(day, clock)).astimezone(pytz.utc)
+        except OverflowError:
+            raise serializers.ValidationError('Dates are out of range in this time zone.')
+        return attrs
+
+    @staticmethod
+    def expand(recurrence):
+        """Yield the (start_time, end_time) of every occurrence"""
+        tz = recurrence['timezone']
+        # Counted in days rather than stepped past end_date, which may be date.max
+        days = (recurrence['end_date'] - recurrence['start_date']).days + 1
+        for offset in range(days):
+            day = recurrence['start_date'] + timedelta(days=offset)
+            if day.weekday() in recurrence['weekdays']:
+                yield (
+                    tz.localize(datetime.combine(day, recurrence['start_time'])),
+                    tz.localize(datetime.combine(day, recurrence['end_time'])),
+                )
+
+
+class OwnerAvailabilityBulkSerializer(serializers.Serializer):
+    """
+    Many availabilities for one owner, dog and place: an explicit list of
+    slots, a recurrence rule, or both. Owner, dog and place are resolved once
+    and every slot is inserted in a single bulk_create.
+    """
+    owner_username = serializers.CharField()
+    dog = serializers.CharField()
+    place_name = serializers.CharField()
+    slots = AvailabilitySlotSerializer(many=True, required=False)
+    recurrence = RecurrenceSerializer(required=False)
+
+    def validate(self, attrs):
+        windows = [(slot['start_time'], slot['end_time']) for slot in attrs.get('slots', [])]
+        if 'recurrence' in attrs:
+            # Stop one past the limit: enough to reject it, however long the rule runs
+            room = max(settings.AVAILABILITY_BULK_MAX_SLOTS - len(windows), 0) + 1
+            windows.extend(islice(RecurrenceSerializer.expand(attrs['recurrence']), room))
+        if not windows:
+            raise serializers.ValidationError('Provide slots or a recurrence.')
+        if len(windows) > settings.AVAILABILITY_BULK_MAX_SLOTS:
+            raise serializers.ValidationError(
+                f'At most {settings.AVAILABILITY_BULK_MAX_SLOTS} slots can be created at once.')
+        attrs['windows'] = sorted(set(windows))
+        return attrs
+
+    def create(self, validated_data):
+        owner, dog, place_id = resolve_owner_dog_place(
+            validated_data['owner_username'],
+            validated_data['dog'],
+            validated_data['place_name'],
+        )
+        with transaction.atomic():
+            availabilities = OwnerAvailability.objects.bulk_create([
+                OwnerAvailability(
+                    owner=owner, dog=dog, place_id=place_id,
+                    start_time=start_time, end_time=end_time)
+                for start_time, end_time in validated_data['windows']
+            ])
+            # bulk_create sends no post_save, see owner.signals
+            TableVersion.bump(OwnerAvailability._meta.label_lower)
+        return availabilities
+
+
+class MapAvailabilitySerializer(serializers.ModelSerializer):
+    owner_username = serializers.CharField(source='owner.user.username')
+    dog = serializers.CharField(source='dog.name')
+    dog_picture = serializers.ImageField(source='dog.picture')
+
+    class Meta:
+        model = OwnerAvailability
+        fields = ['id', 'owner_username', 'dog', 'dog_picture', 'start_time', 'end_time']
+
+
+class AvailabilityHistorySerializer(serializers.ModelSerializer):
+    owner_username = serializers.CharField(source='owner.user.username')
+    dog = serializers.CharField(source='dog.name')
+
+    class Meta:
+        model = OwnerAvailabilityArchive
+        fields = ['id', 'owner_username', 'dog', 'place_id', 'start_time', 'end_time']
+
+
 class DogSerializer(serializers.ModelSerializer):
     # name = serializers.CharField(write_only=True) # Comment so it will be included in the output
     breed = serializers.CharField(write_only=True)  # Accept place_name in input
@@ -151,7 +319,7 @@ class DogSerializer(serializers.ModelSerializer):
     class Meta:
         model = Dog
         # fields = '__all__'  # Include all fields in the model
-        fields = ['name', 'breed', 'age', 'about', 'picture']
+        fields = ['id', 'name', 'breed', 'age', 'about', 'picture']
 
     def create(self, validated_data):
         # Extract owner_username & place_name from validated_data
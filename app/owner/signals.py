@@ -0,0 +1,133 @@
+from django.apps import apps
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+
+from core.models import TableVersion, Tombstone
+from .authentication import evict_tokens
+from .events import publish_availabilities
+from .match_store import affected_owners, availability_affected_owners, queue_refresh
+from .models import Dog, Owner, OwnerAvailability
+from .places import evict_place
+from .spatial_index import owner_index
+
+
+# Tables whose every write moves their TableVersion, under the model label;
+# the conditional GET views validate against these
+VERSIONED_MODELS = (User, Owner, Dog, OwnerAvailability)
+
+
+def is_login(sender, update_fields):
+    """Logging in only updates last_login, which nothing in the API shows"""
+    return sender is User and update_fields is not None and set(update_fields) == {'last_login'}
+
+
+@receiver(post_save)
+@receiver(post_delete)
+def bump_table_version(sender, instance, update_fields=None, **kwargs):
+    if sender in VERSIONED_MODELS and not is_login(sender, update_fields):
+        TableVersion.bump(sender._meta.label_lower)
+
+
+@receiver(post_save, sender=Owner)
+def index_owner_location(sender, instance, **kwargs):
+    """
+    Keep the in-memory spatial index in step with owner locations, once
+    committed. Connected after bump_table_version, which the index follows.
+    """
+    owner_id, location = instance.pk, instance.location
+    transaction.on_commit(lambda: owner_index.update(owner_id, location))
+
+
+@receiver(post_delete, sender=Owner)
+def unindex_owner(sender, instance, **kwargs):
+    owner_id = instance.pk
+    transaction.on_commit(lambda: owner_index.update(owner_id, None))
+
+
+@receiver(post_delete, sender=Owner)
+@receiver(post_delete, sender=Dog)
+@receiver(post_delete, sender=OwnerAvailability)
+def record_tombstone(sender, instance, **kwargs):
+    """Let delta-sync clients know the row is gone, see core.sync"""
+    Tombstone.record(instance)
+
+
+@receiver(post_save, sender=OwnerAvailability)
+def push_availability_saved(sender, instance, created, **kwargs):
+    publish_availabilities('created' if created else 'updated', [instance])
+
+
+@receiver(post_delete, sender=OwnerAvailability)
+def push_availability_deleted(sender, instance, **kwargs):
+    publish_availabilities('deleted', [instance])
+
+
+@receiver(post_save, sender=User)
+def touch_user_rows(sender, instance, created, update_fields=None, **kwargs):
+    """Owners and availabilities show user fields, so they changed too"""
+    if created or is_login(sender, update_fields):
+        return
+    now = timezone.now()
+    Owner.objects.filter(user=instance).update(updated_at=now)
+    OwnerAvailability.objects.filter(owner__user=instance).update(updated_at=now)
+
+
+@receiver(post_save, sender=Dog)
+def touch_dog_availabilities(sender, instance, created, **kwargs):
+    """Availabilities show their dog's name"""
+    if not created:
+        OwnerAvailability.objects.filter(dog=instance).update(updated_at=timezone.now())
+
+
+@receiver(post_delete, sender=Token)
+def evict_deleted_token(sender, instance, **kwargs):
+    evict_tokens([instance.key])
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+@receiver(post_save, sender=Owner)
+@receiver(post_delete, sender=Owner)
+def evict_user_tokens(sender, instance, created=False, update_fields=None, **kwargs):
+    """Cached authentications carry the user and their owner, see owner.authentication"""
+    if created or is_login(sender, update_fields):
+        return
+    user_id = instance.pk if sender is User else instance.user_id
+    evict_tokens(Token.objects.filter(user_id=user_id).values_list('key', flat=True))
+
+
+@receiver(post_save, sender=Owner)
+def queue_owner_matches(sender, instance, **kwargs):
+    """The owner's age or location feeds the scores of everyone around them"""
+    queue_refresh(affected_owners(instance.pk, instance.location))
+
+
+@receiver(pre_delete, sender=Owner)
+def queue_deleted_owner_matches(sender, instance, **kwargs):
+    # Before the delete cascades over the MatchCandidate rows naming the owner
+    queue_refresh(affected_owners(instance.pk, instance.location) - {instance.pk})
+
+
+@receiver(post_save, sender=Dog)
+@receiver(post_delete, sender=Dog)
+def queue_dog_matches(sender, instance, **kwargs):
+    queue_refresh(affected_owners(instance.owner_id))
+
+
+@receiver(post_save, sender=OwnerAvailability)
+@receiver(post_delete, sender=OwnerAvailability)
+def queue_availability_matches(sender, instance, **kwargs):
+    queue_refresh(availability_affected_owners([instance]))
+
+
+if apps.is_installed('place'):
+    # Co-deployed place app: evict cached lookups as soon as a place changes
+
+    @receiver(post_save, sender='place.Place')
+    @receiver(post_delete, sender='place.Place')
+    def evict_cached_place(sender, instance, **kwargs):
+        evict_place(instance.pk, instance.name)
@@ -0,0 +1,150 @@
+"""
+Per-process spatial index of owner locations.
+
+Each worker keeps a KD-tree of (owner_id, lat, lon) in memory. Local writes
+are applied incrementally through the Owner signals once they commit;
+writes made by other workers are noticed through the Owner TableVersion
+(bumped by every Owner write, see owner.signals), which triggers a reload
+from the database.
+"""
+import threading
+import time
+
+import numpy as np
+from django.conf import settings
+
+from core.geo import haversine_distances, rank_by_distance
+from core.kdtree import KDTree
+from core.models import TableVersion
+
+VERSION_KEY = 'owner.owner'  # Owner._meta.label_lower
+
+
+class OwnerSpatialIndex:
+    """
+    KD-tree snapshot plus a small overlay of owners added, moved or removed
+    since it was built. The tree is rebuilt from memory once the overlay
+    grows past `rebuild_ratio` of the snapshot.
+    """
+    min_overlay = 64
+    rebuild_ratio = 0.05
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._tree = None
+        self._locations = {}  # owner_id -> (lat, lon) for every indexed owner
+        self._stale = set()  # ids whose tree entry is outdated or deleted
+        self._overlay = {}  # owner_id -> (lat, lon) not yet in the tree
+        self._version = None
+        self._checked_at = 0.0
+
+    def __len__(self):
+        return len(self._locations)
+
+    def clear(self):
+        """Drop the index; it is reloaded on the next query"""
+        with self._lock:
+            self._tree = None
+            self._version = None
+
+    def load(self):
+        """(Re)build the index from the database"""
+        from owner.models import Owner
+
+        with self._lock:
+            version = TableVersion.current(VERSION_KEY)
+            rows = Owner.objects.filter(
+                latitude__isnull=False, longitude__isnull=False,
+            ).values_list('id', 'latitude', 'longitude')
+            self._locations = {
+                owner_id: (float(lat), float(lon)) for owner_id, lat, lon in rows
+            }
+            self._rebuild()
+            self._version = version
+            self._checked_at = time.monotonic()
+
+    def _rebuild(self):
+        if self._locations:
+            ids = np.fromiter(self._locations, dtype=np.int64, count=len(self._locations))
+            coords = np.array(list(self._locations.values()))
+            self._tree = KDTree(ids, coords[:, 0], coords[:, 1])
+        else:
+            self._tree = KDTree([], [], [])
+        self._stale = set()
+        self._overlay = {}
+
+    def ensure_current(self):
+        """Reload when another worker has changed owner locations"""
+        with self._lock:
+            interval = settings.OWNER_INDEX_CHECK_INTERVAL
+            if self._tree is not None and time.monotonic() - self._checked_at < interval:
+                return
+            if self._tree is None or TableVersion.current(VERSION_KEY) != self._version:
+                self.load()
+            self._checked_at = time.monotonic()
+
+    def location(self, owner_id):
+        """(lat, lon) of an indexed owner, or None"""
+        self.ensure_current()
+        with self._lock:
+            return self._locations.get(owner_id)
+
+    def update(self, owner_id, location):
+        """
+        Apply a committed local write of an owner, at `location` (None when
+        removed). The write bumped the version once: any other step means
+        a change of another worker was missed.
+        """
+        with self._lock:
+            version = TableVersion.current(VERSION_KEY)
+            if self._tree is None or version == self._version:
+                return  # Reloaded since the write, which is included
+            if version != self._version + 1:
+                # Missed someone else's change; reload on the next query
+                self._tree = None
+                return
+            self._version = version
+            if self._locations.get(owner_id) == location:
+                return
+            self._stale.add(owner_id)
+            self._overlay.pop(owner_id, None)
+            if location is None:
+                self._locations.pop(owner_id, None)
+            else:
+                self._locations[owner_id] = location
+                self._overlay[owner_id] = location
+            if len(self._stale) > max(self.min_overlay, self.rebuild_ratio * len(self._tree)):
+                self._rebuild()
+
+    def nearby(self, lat, lon, radius_km, k=None, exclude=None):
+        """
+        Return (ids, distances in km) of owners within `radius_km`, nearest
+        first, keeping only the `k` nearest when given.
+        """
+        self.ensure_current()
+        with self._lock:
+            tree, stale, overlay = self._tree, self._stale, self._overlay
+            if k is None:
+                ids, distances = tree.query_radius(lat, lon, radius_km)
+            else:
+                # Over-fetch so that dropped entries cannot starve the result
+                ids, distances = tree.query_nearest(
+                    lat, lon, k + len(stale) + 1, radius_km=radius_km)
+            if stale:
+                keep = ~np.isin(ids, np.fromiter(stale, dtype=np.int64, count=len(stale)))
+                ids, distances = ids[keep], distances[keep]
+            if overlay:
+                extra_ids = np.fromiter(overlay, dtype=np.int64, count=len(overlay))
+                extra = np.array(list(overlay.values()))
+                ids = np.concatenate((ids, extra_ids))
+                distances = np.concatenate((
+                    distances, haversine_distances(lat, lon, extra[:, 0], extra[:, 1])))
+
+        if exclude is not None:
+            keep = ids != exclude
+            ids, distances = ids[keep], distances[keep]
+        nearest = rank_by_distance(distances, radius_km=radius_km, k=k)
+        return ids[nearest].tolist(), distances[nearest].tolist()
+
+
+owner_index = OwnerSpatialIndex()
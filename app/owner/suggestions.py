@@ -0,0 +1,210 @@
+"""
+Match suggestions: a completion provider writes a few sentences about the
+short list of matches from owner.matching.
+
+The provider is pluggable through SUGGESTION_PROVIDER: "local" explains
+the top match from its score breakdown without leaving the process (tests,
+offline deployments), "openai" asks OpenAI, or a dotted path to a class
+with the same `stream` method.
+
+Completions run in a background thread and are read as they are produced,
+so the view can stream them to the client. Identical requests (same
+profile, same candidates, same provider) share one completion while it
+runs and the finished text is cached for SUGGESTION_CACHE_TTL seconds.
+"""
+import hashlib
+import json
+import logging
+import threading
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils.module_loading import import_string
+
+from core.cache import TTLCache
+from .matching import explain_match
+
+try:
+    import openai  # type: ignore
+except ImportError:  # pragma: no cover - optional dependency
+    openai = None
+
+logger = logging.getLogger(__name__)
+
+suggestion_cache = TTLCache(maxsize=settings.SUGGESTION_CACHE_SIZE, ttl=settings.SUGGESTION_CACHE_TTL)
+
+
+class LocalCompletionProvider:
+    """Explains the top match from its score breakdown, word by word"""
+    name = 'local'
+
+    def stream(self, prompt, matches):
+        words = explain_match(matches[0]).split(' ')
+        for index, word in enumerate(words):
+            yield word if index == 0 else f' {word}'
+
+
+class OpenAICompletionProvider:
+    """Streams a chat completion from OpenAI (the openai package and OPENAI_API_KEY)"""
+    name = 'openai'
+    model = 'gpt-4o-mini'
+
+    def stream(self, prompt, matches):
+        if openai is None or not settings.OPENAI_API_KEY:
+            raise RuntimeError('OpenAI is not configured')
+        client = openai.OpenAI(api_key=settings.OPENAI_API_KEY)
+        response = client.chat.completions.create(
+            model=self.model,
+            messages=[
+                {"role": "system", "content": "You are an expert relationship matchmaker."},
+                {"role": "user", "content": prompt}
+            ],
+            stream=True,
+        )
+        for chunk in response:
+            text = chunk.choices[0].delta.content if chunk.choices else None
+            if text:
+                yield text
+
+
+PROVIDERS = {
+    'local': LocalCompletionProvider,
+    'openai': OpenAICompletionProvider,
+}
+
+
+def get_provider():
+    name = settings.SUGGESTION_PROVIDER
+    provider_class = PROVIDERS[name] if name in PROVIDERS else import_string(name)
+    return provider_class()
+
+
+def build_prompt(owner, profiles_data):
+    match_strings = "".join([
+        f"- Name: {match['first_name']} {match['last_name']}, Age: {match['age']}, "
+        f"Gender: {match['gender']}, City: {match['city']}, Score: {match['score']}\n"
+        f"  About: {match['about_me']}\n"
+        for match in profiles_data
+        ])
+
+    return (
+        f"You are an AI matchmaker helping users find a compatible match.\n"
+        f"The user profile is:\n"
+        f"Name: {owner.user.first_name} {owner.user.last_name},\n"
+        f"Age: {owner.age}, Gender: {owner.gender}, "
+        f"City: {owner.city}\n"
+        f"About: {owner.about_me}\n"
+        f"Here are potential matches, ranked by score:\n{match_strings}"
+        f"Based on age compatibility and shared interests, suggest the best match and explain why."
+    )
+
+
+class Completion:
+    """
+    The text of one suggestion as it is written: any number of readers
+    iterate over the chunks, waiting for the next ones until it is done.
+    """
+
+    def __init__(self, source, chunks=(), done=False):
+        self.source = source
+        self.cached = done
+        self._chunks = list(chunks)
+        self._done = done
+        self._error = None
+        self._condition = threading.Condition()
+
+    def append(self, chunk):
+        with self._condition:
+            self._chunks.append(chunk)
+            self._condition.notify_all()
+
+    def finish(self, error=None):
+        with self._condition:
+            self._done = True
+            self._error = error
+            self._condition.notify_all()
+
+    @property
+    def started(self):
+        return bool(self._chunks)
+
+    @property
+    def text(self):
+        return ''.join(self._chunks)
+
+    def __iter__(self):
+        position = 0
+        while True:
+            with self._condition:
+                self._condition.wait_for(lambda: len(self._chunks) > position or self._done)
+                chunks = self._chunks[position:]
+                done, error = self._done, self._error
+            position += len(chunks)
+            yield from chunks
+            if done:
+                if error is not None:
+                    raise error
+                return
+
+
+_lock = threading.Lock()
+_running = {}  # cache key -> Completion being written
+
+
+def cache_key(provider, owner, profiles_data):
+    """Hash of everything the completion depends on"""
+    payload = json.dumps({
+        'provider': provider.name,
+        'owner': [owner.pk, owner.user.first_name, owner.user.last_name,
+                  owner.age, owner.gender, owner.city, owner.about_me],
+        'matches': profiles_data,
+    }, sort_keys=True, cls=DjangoJSONEncoder)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def suggest(owner, matches, profiles_data):
+    """
+    A Completion suggesting one of `matches` (from find_matches or
+    stored_matches, serialized as `profiles_data`) to `owner`: the cached
+    one, the one already running for the same request, or a new one.
+    """
+    provider = get_provider()
+    key = cache_key(provider, owner, profiles_data)
+    text = suggestion_cache.get(key)
+    if text is not None:
+        return Completion(provider.name, [text], done=True)
+
+    with _lock:
+        completion = _running.get(key)
+        if completion is None:
+            completion = _running[key] = Completion(provider.name)
+            prompt = build_prompt(owner, profiles_data)
+            threading.Thread(
+                target=_write, args=(key, completion, provider, prompt, matches), daemon=True,
+            ).start()
+    return completion
+
+
+def _write(key, completion, provider, prompt, matches):
+    error = None
+    try:
+        try:
+            for chunk in provider.stream(prompt, matches):
+                completion.append(chunk)
+        except Exception as e:
+            if completion.started or isinstance(provider, LocalCompletionProvider):
+                raise
+            # Nothing sent yet: explain the matches locally instead, uncached
+            logger.warning("Suggestion provider %s failed: %s", provider.name, e)
+            completion.source = LocalCompletionProvider.name
+            for chunk in LocalCompletionProvider().stream(prompt, matches):
+                completion.append(chunk)
+        else:
+            suggestion_cache.set(key, completion.text)
+    except Exception as e:
+        logger.exception("Suggestion failed")
+        error = e
+    finally:
+        with _lock:
+            _running.pop(key, None)
+        completion.finish(error)
@@ -1,9 +1,51 @@
+from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.core.management import call_command
 from django.urls import reverse
-from owner.models import Owner, Dog
+from django.db import connection, transaction
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from datetime import timedelta
+from core.geo import grid_cell, cells_within_radius, haversine_distance, haversine_distances
+from core.kdtree import KDTree
+from core.cache import TTLCache
+from core.models import TableVersion, Tombstone
+from core.singleflight import SingleFlight
+from core.sync import encode_cursor
+from owner import serializers
+from owner.authentication import token_cache
+from owner.checks import check_availability_durations
+from owner.events import EVENTS_PATH, availability_events, broker as event_broker, listener as event_listener
+from owner.geoip import GeoIPLocator, client_ip
+from owner.matching import compute_matches
+from owner.meetups import sweep_join
+from owner.match_store import refresh_pending, stored_matches
+from owner.models import (
+    Owner, Dog, MatchCandidate, MatchRefresh, OwnerAvailability, OwnerAvailabilityArchive,
+)
+from owner.places import (
+    PlaceServiceUnavailable, cache_place, get_backend, get_or_create_place_id, get_place_names,
+    local_backend, place_cache, place_client, place_lookups, remote_backend,
+)
+from owner.spatial_index import OwnerSpatialIndex, owner_index
+from owner.suggestions import suggest, suggestion_cache
+from place.clustering import cluster_index
+from place.models import Place
+from place.search import search_index
+from place.utils import GeocodingError
 from rest_framework.test import APITestCase, APIClient
 from rest_framework.authtoken.models import Token
 from unittest.mock import patch
+from io import StringIO
+import asyncio
+import json
+import numpy as np
+import requests
+import threading
+import time
+import unittest
 
 User = get_user_model()
 
@@ -27,7 +69,6 @@ class BaseTestCase(APITestCase):
                 "age": 25,
                 "city": "New York",
                 "about_me": "I love coding and gaming.",
-                "picture": "My picture's url"
             },
             {
                 "username": "jane_smith",
@@ -39,7 +80,6 @@ class BaseTestCase(APITestCase):
                 "age": 30,
                 "city": "San Francisco",
                 "about_me": "I'm a tech enthusiast who enjoys hiking.",
-                "picture": "Jane's picture's url"
             },
             {
                 "username": "michael_brown",
@@ -51,7 +91,6 @@ class BaseTestCase(APITestCase):
                 "age": 28,
                 "city": "Seattle",
                 "about_me": "A bookworm who loves exploring coffee shops.",
-                "picture": "Michael's picture's url"
             }
         ]
         # Register profiles
@@ -79,7 +118,7 @@ class UserRegisterApiViewTest(BaseTestCase):
 
 
 class UserLoginApiViewTest(BaseTestCase):
-    @patch('profile.views.get_current_location')  # Mock location service
+    @patch('owner.views.get_current_location')  # Mock location service
     def test_valid_token_is_accepted(self, mock_location):
         """Test that a valid token is returned and associated with the correct user."""
         mock_location.return_value = {'latitude': 40.7128, 'longitude': -74.0060}  # Mock location data
@@ -109,17 +148,1633 @@ class UserLoginApiViewTest(BaseTestCase):
 class ProfileViewSetTest(BaseTestCase):
     def test_get_profiles(self):
         """Test that all registered profiles are returned."""
-        response = self.client.get(self.profile_list_url)
+        response = self.client.get(self.owner_list_url)
         
         self.assertEqual(response.status_code, 200)
-        self.assertEqual(len(response.data), 3)  # Ensure all three profiles are returned
+        self.assertEqual(len(response.data['results']), 3)  # Ensure all three profiles are returned
 
-        names = {owner["first_name"] for owner in response.data}
+        names = {owner["first_name"] for owner in response.data['results']}
         expected_names = {user["first_name"] for user in self.user_data}
 
         self.assertSetEqual(names, expected_names)  # Ensure returned users match the registered ones
 
 
+
+def create_owner(username, latitude=None, longitude=None, **extra):
+    """Create a user with an owner profile, bypassing the API, as if committed."""
+    user = User.objects.create_user(
+        username=username, password='securepassword',
+        first_name=username.title(), last_name='Test')
+    fields = {'age': 30, 'city': 'Tel Aviv', 'about_me': 'Dog person.'}
+    fields.update(extra)
+    with TestCase.captureOnCommitCallbacks(execute=True):
+        return Owner.objects.create(user=user, latitude=latitude, longitude=longitude, **fields)
+
+
+class NearbyOwnersViewSetTest(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.nearby_url = reverse('owner:nearby-owners-list')
+        # Ra'anana, with neighbours at increasing distances
+        cls.me = create_owner('me', 32.184800, 34.871000)
+        create_owner('neighbour', 32.190000, 34.880000)   # ~1 km
+        create_owner('herzliya', 32.162400, 34.844700)    # ~3.5 km
+        create_owner('haifa', 32.794000, 34.989600)       # ~68 km
+        create_owner('antipode', -32.184800, -145.129000)
+        create_owner('nowhere')
+
+    def setUp(self):
+        owner_index.clear()
+        self.client.force_authenticate(self.me.user)
+
+    def test_geo_cell_follows_coordinates(self):
+        """Test that the grid key is recomputed when the location changes."""
+        owner = create_owner('mover', 32.0, 34.0)
+        cell = owner.geo_cell
+        owner.latitude, owner.longitude = 40.7128, -74.0060
+        owner.save(update_fields=['latitude', 'longitude'])
+        owner.refresh_from_db()
+        self.assertNotEqual(owner.geo_cell, cell)
+        self.assertEqual(owner.geo_cell, grid_cell(40.7128, -74.0060))
+
+    def test_cells_cover_search_circle(self):
+        """Test that every point within the radius lies in a returned cell."""
+        for lat, lon, radius in [(32.1848, 34.871, 10), (0.01, 179.99, 25), (89.9, 0, 50)]:
+            cells = set(cells_within_radius(lat, lon, radius, max_cells=100000))
+            for step in range(200):
+                point_lat = lat + (step % 20 - 10) * radius / 1000
+                point_lon = lon + (step // 20 - 5) * radius / 500
+                point_lat = max(min(point_lat, 90), -90)
+                point_lon = (point_lon + 180) % 360 - 180
+                if haversine_distance(lat, lon, point_lat, point_lon) <= radius:
+                    self.assertIn(grid_cell(point_lat, point_lon), cells)
+
+    def test_nearby_within_default_radius(self):
+        """Test that only owners within 10 km are returned."""
+        response = self.client.get(self.nearby_url)
+        self.assertEqual(response.status_code, 200)
+        names = {owner['first_name'] for owner in response.data}
+        self.assertSetEqual(names, {'Neighbour', 'Herzliya'})
+
+    def test_nearby_large_radius_falls_back_to_scan(self):
+        """Test that a radius spanning too many cells still finds everyone in range."""
+        response = self.client.get(self.nearby_url, {'radius': 20100})
+        names = {owner['first_name'] for owner in response.data}
+        self.assertSetEqual(names, {'Neighbour', 'Herzliya', 'Haifa', 'Antipode'})
+
+    def test_nearby_sorted_by_distance(self):
+        """Test that results come back nearest first with their distance."""
+        response = self.client.get(self.nearby_url, {'radius': 100})
+        self.assertEqual([owner['first_name'] for owner in response.data],
+                         ['Neighbour', 'Herzliya', 'Haifa'])
+        distances = [owner['distance_km'] for owner in response.data]
+        self.assertEqual(distances, sorted(distances))
+        self.assertAlmostEqual(distances[1], haversine_distance(
+            32.1848, 34.871, 32.1624, 34.8447), places=6)
+
+    def test_nearby_k_nearest(self):
+        """Test that ?k= limits the results to the k nearest owners."""
+        response = self.client.get(self.nearby_url, {'radius': 100, 'k': 2})
+        self.assertEqual([owner['first_name'] for owner in response.data],
+                         ['Neighbour', 'Herzliya'])
+
+    def test_nearby_invalid_k(self):
+        """Test that a non-positive k is rejected."""
+        response = self.client.get(self.nearby_url, {'k': 0})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('k', response.data)
+
+
+@override_settings(OWNER_SPATIAL_INDEX=False)
+class NearbyOwnersFromDatabaseTest(NearbyOwnersViewSetTest):
+    """Same behaviour when nearby owners are looked up through the grid index."""
+
+
+class OwnerSpatialIndexTest(APITestCase):
+    def setUp(self):
+        owner_index.clear()
+
+    def test_kdtree_matches_brute_force(self):
+        """Test radius and nearest queries against a linear scan."""
+        rng = np.random.default_rng(7)
+        lats = rng.uniform(-89, 89, 2000)
+        lons = rng.uniform(-180, 180, 2000)
+        tree = KDTree(np.arange(2000), lats, lons)
+        for lat, lon in [(32.18, 34.87), (0, 179.9), (-88, 10)]:
+            expected = haversine_distances(lat, lon, lats, lons)
+            ids, distances = tree.query_radius(lat, lon, 1500)
+            self.assertSetEqual(set(ids.tolist()), set(np.flatnonzero(expected <= 1500).tolist()))
+            np.testing.assert_allclose(distances, expected[ids], atol=1e-6)
+            ids, distances = tree.query_nearest(lat, lon, 10)
+            self.assertEqual(ids.tolist(), np.argsort(expected)[:10].tolist())
+
+    def test_local_changes_are_applied_incrementally(self):
+        """Test that committed saves and deletes update the index without a reload."""
+        owner = create_owner('first', 32.0, 34.0)
+        owner_index.ensure_current()
+        with patch.object(owner_index, 'load') as load:
+            with self.captureOnCommitCallbacks(execute=True):
+                other = create_owner('second', 32.01, 34.0)
+            ids, _ = owner_index.nearby(32.0, 34.0, 5)
+            self.assertEqual(ids, [owner.id, other.id])
+
+            owner.latitude, owner.longitude = 40.0, -74.0
+            with self.captureOnCommitCallbacks(execute=True):
+                owner.save()
+            ids, _ = owner_index.nearby(32.0, 34.0, 5)
+            self.assertEqual(ids, [other.id])
+
+            with self.captureOnCommitCallbacks(execute=True):
+                other.delete()
+            ids, _ = owner_index.nearby(32.0, 34.0, 5)
+            self.assertEqual(ids, [])
+            load.assert_not_called()
+
+    def test_rolled_back_changes_are_not_applied(self):
+        """Test that a location change that never commits leaves the index alone."""
+        owner = create_owner('first', 32.0, 34.0)
+        owner_index.ensure_current()
+        owner.latitude, owner.longitude = 40.0, -74.0
+        with self.captureOnCommitCallbacks(execute=False):
+            owner.save()
+        self.assertEqual(owner_index.location(owner.id), (32.0, 34.0))
+
+    def test_other_workers_converge(self):
+        """Test that a change made by another worker triggers a reload."""
+        create_owner('first', 32.0, 34.0)
+        other_worker = OwnerSpatialIndex()
+        other_worker.ensure_current()
+        self.assertEqual(len(other_worker), 1)
+
+        create_owner('second', 32.01, 34.0)
+        with override_settings(OWNER_INDEX_CHECK_INTERVAL=0):
+            ids, _ = other_worker.nearby(32.0, 34.0, 5)
+        self.assertEqual(len(ids), 2)
+
+    def test_unrelated_saves_do_not_reload(self):
+        """Test that saving an owner without moving it keeps this worker's index."""
+        owner = create_owner('first', 32.0, 34.0)
+        owner_index.ensure_current()
+        owner = Owner.objects.get(pk=owner.pk)
+        owner.about_me = 'Still here.'
+        with self.captureOnCommitCallbacks(execute=True):
+            owner.save()
+        with patch.object(owner_index, 'load') as load, override_settings(OWNER_INDEX_CHECK_INTERVAL=0):
+            owner_index.ensure_current()
+        load.assert_not_called()
+
+
+
+@override_settings(PLACE_SERVICE_MODE='remote')
+class OwnerAvailabilityListTest(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.availability_url = reverse('owner:owner-availability-list')
+        start = timezone.now()
+        for index in range(3):
+            owner = create_owner(f'walker{index}')
+            dog = Dog.objects.create(owner=owner, name=f'Rex{index}', breed='Mixed', age=3)
+            for place_id in (1, 2):
+                OwnerAvailability.objects.create(
+                    owner=owner, dog=dog, place_id=place_id,
+                    start_time=start, end_time=start + timedelta(hours=1))
+
+    def setUp(self):
+        place_cache.clear()
+
+    @patch('owner.places.place_client.session.request')
+    def test_list_resolves_places_in_one_call(self, mock_get):
+        """Test that listing makes one place lookup and a single query."""
+        mock_get.return_value.status_code = 200
+        mock_get.return_value.json.return_value = {'next': None, 'results': [
+            {'id': 1, 'name': 'Dog garden'}, {'id': 2, 'name': 'Beach'}]}
+
+        with self.assertNumQueries(2):  # the ETag versions and the page
+            response = self.client.get(self.availability_url)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['results']), 6)
+        mock_get.assert_called_once()
+        self.assertEqual(mock_get.call_args.kwargs['params']['ids'], '1,2')
+        self.assertEqual(
+            {(item['dog'], item['place_name']) for item in response.data['results']},
+            {(f'Rex{index}', name) for index in range(3) for name in ('Dog garden', 'Beach')})
+
+    @patch('owner.places.place_client.session.request')
+    def test_unknown_place_name(self, mock_get):
+        """Test that places missing from the place service show as Unknown."""
+        mock_get.return_value.status_code = 200
+        mock_get.return_value.json.return_value = {'next': None, 'results': [{'id': 1, 'name': 'Dog garden'}]}
+
+        availability = OwnerAvailability.objects.filter(place_id=2).first()
+        response = self.client.get(
+            reverse('owner:owner-availability-detail', args=[availability.pk]))
+        self.assertEqual(response.data['place_name'], 'Unknown')
+
+
+
+@override_settings(PLACE_SERVICE_MODE='remote')
+class PlaceCacheTest(APITestCase):
+    def setUp(self):
+        place_cache.clear()
+        self.owner = create_owner('walker')
+        self.dog = Dog.objects.create(owner=self.owner, name='Rex', breed='Mixed', age=3)
+
+    def test_ttl_and_lru_eviction(self):
+        """Test that entries expire after the TTL and the LRU bound holds."""
+        cache = TTLCache(maxsize=2, ttl=10)
+        with patch('core.cache.time.monotonic', return_value=100):
+            cache.set('a', 1)
+            cache.set('b', 2)
+            cache.get('a')
+            cache.set('c', 3)  # evicts b, the least recently used
+            self.assertIsNone(cache.get('b'))
+            self.assertEqual(cache.get('a'), 1)
+        with patch('core.cache.time.monotonic', return_value=111):
+            self.assertIsNone(cache.get('a'))
+        self.assertEqual(cache.stats()['evictions'], 1)
+        self.assertEqual(cache.stats()['hits'], 2)
+
+    @patch('owner.places.place_client.session.request')
+    def test_ids_are_fetched_once(self, mock_get):
+        """Test that repeated lookups of the same ids hit the cache."""
+        mock_get.return_value.status_code = 200
+        mock_get.return_value.json.return_value = {'next': None, 'results': [{'id': 1, 'name': 'Dog garden'}]}
+        self.assertEqual(get_place_names([1]), {1: 'Dog garden'})
+        self.assertEqual(get_place_names([1]), {1: 'Dog garden'})
+        mock_get.assert_called_once()
+        self.assertEqual(place_cache.stats()['hits'], 1)
+
+    @patch('owner.places.place_client.session.request')
+    def test_normalized_name_reuses_place_id(self, mock_get):
+        """Test that creating availabilities resolves a known name from the cache."""
+        mock_get.return_value.status_code = 200
+        mock_get.return_value.json.return_value = {'next': None, 'results': [{'id': 7, 'name': 'Dog garden'}]}
+        url = reverse('owner:owner-availability-list')
+        for name in ('Dog garden', '  dog   GARDEN '):
+            response = self.client.post(url, {
+                'owner_username': 'walker', 'dog': 'Rex', 'place_name': name,
+                'start_time': '2025-06-23T20:00:00Z', 'end_time': '2025-06-23T21:00:00Z',
+            }, format='json')
+            self.assertEqual(response.status_code, 201)
+        self.assertEqual(mock_get.call_count, 1)  # name lookup, then names from cache
+        self.assertEqual(
+            list(OwnerAvailability.objects.values_list('place_id', flat=True)), [7, 7])
+
+    def test_place_change_evicts_entry(self):
+        """Test that saving a Place drops its cached lookups."""
+        place = Place.objects.create(name='Dog garden', address='Ra\'anana')
+        cache_place({'id': place.id, 'name': 'Old name'})
+        place_cache.set('name:dog garden', place.id)
+        place.save()
+        self.assertIsNone(place_cache.get(f'id:{place.id}'))
+        self.assertIsNone(place_cache.get('name:dog garden'))
+
+    def test_stats_require_admin(self):
+        """Test that only staff can read the cache counters."""
+        url = reverse('owner:place-cache-stats')
+        self.assertIn(self.client.get(url).status_code, (401, 403))
+        self.owner.user.is_staff = True
+        self.owner.user.save()
+        self.client.force_authenticate(self.owner.user)
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('hits', response.data)
+
+
+
+@override_settings(PLACE_SERVICE_MODE='remote')
+class PlaceServiceClientTest(APITestCase):
+    def setUp(self):
+        place_cache.clear()
+        place_client.breaker.reset()
+        self.addCleanup(place_client.breaker.reset)
+
+    def test_session_is_pooled_with_retries(self):
+        """Test that GETs are retried and every call carries a timeout."""
+        adapter = place_client.session.get_adapter('http://place-service/')
+        self.assertEqual(adapter.max_retries.total, settings.PLACE_SERVICE_RETRIES)
+        self.assertIn('GET', adapter.max_retries.allowed_methods)
+        self.assertNotIn('POST', adapter.max_retries.allowed_methods)
+        with patch.object(place_client.session, 'request') as mock_request:
+            mock_request.return_value.status_code = 200
+            mock_request.return_value.json.return_value = {'next': None, 'results': []}
+            get_place_names([1])
+        self.assertEqual(mock_request.call_args.kwargs['timeout'], (
+            settings.PLACE_SERVICE_CONNECT_TIMEOUT, settings.PLACE_SERVICE_READ_TIMEOUT))
+
+    @patch('owner.places.place_client.session.request')
+    def test_breaker_fails_fast(self, mock_request):
+        """Test that repeated failures open the breaker and stop calling out."""
+        mock_request.side_effect = requests.ConnectionError
+        for _ in range(settings.PLACE_SERVICE_BREAKER_THRESHOLD):
+            self.assertEqual(get_place_names([1]), {})
+        self.assertTrue(place_client.breaker.is_open)
+        mock_request.reset_mock()
+        self.assertEqual(get_place_names([1]), {})
+        mock_request.assert_not_called()
+
+    @patch('owner.places.place_client.session.request')
+    def test_breaker_closes_after_trial_call(self, mock_request):
+        """Test that a successful call after the reset timeout closes the breaker."""
+        mock_request.side_effect = requests.Timeout
+        for _ in range(settings.PLACE_SERVICE_BREAKER_THRESHOLD):
+            get_place_names([1])
+        mock_request.side_effect = None
+        mock_request.return_value.status_code = 200
+        mock_request.return_value.json.return_value = {'next': None, 'results': [{'id': 1, 'name': 'Beach'}]}
+        later = time.monotonic() + settings.PLACE_SERVICE_BREAKER_RESET + 1
+        with patch('core.http.time.monotonic', return_value=later):
+            self.assertEqual(get_place_names([1]), {1: 'Beach'})
+        self.assertFalse(place_client.breaker.is_open)
+
+    @patch('owner.places.place_client.session.request')
+    def test_create_when_place_service_down(self, mock_request):
+        """Test that creating an availability answers 503 when places are unreachable."""
+        mock_request.side_effect = requests.ConnectionError
+        owner = create_owner('walker')
+        Dog.objects.create(owner=owner, name='Rex', breed='Mixed', age=3)
+        response = self.client.post(reverse('owner:owner-availability-list'), {
+            'owner_username': 'walker', 'dog': 'Rex', 'place_name': 'Beach',
+            'start_time': '2025-06-23T20:00:00Z', 'end_time': '2025-06-23T21:00:00Z',
+        }, format='json')
+        self.assertEqual(response.status_code, 503)
+        self.assertFalse(OwnerAvailability.objects.exists())
+
+    @patch('owner.places.place_client.session.request')
+    def test_create_when_geocoder_down(self, mock_request):
+        """Test that a place service unable to geocode is a 503, not a bad place name."""
+        mock_request.return_value.status_code = 503
+        with self.assertRaises(PlaceServiceUnavailable):
+            remote_backend.create_place('Beach')
+
+
+class LocalPlaceBackendTest(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.availability_url = reverse('owner:owner-availability-list')
+        cls.owner = create_owner('walker')
+        cls.dog = Dog.objects.create(owner=cls.owner, name='Rex', breed='Mixed', age=3)
+        cls.garden = Place.objects.create(name='Dog garden', address='Ra\'anana')
+        cls.beach = Place.objects.create(name='Beach', address='Herzliya')
+
+    def setUp(self):
+        place_cache.clear()
+        search_index.clear()
+        # Any HTTP call to the place service would fail the test
+        patcher = patch.object(place_client.session, 'request', side_effect=AssertionError)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def post_availability(self, place_name):
+        return self.client.post(self.availability_url, {
+            'owner_username': 'walker', 'dog': 'Rex', 'place_name': place_name,
+            'start_time': '2025-06-23T20:00:00Z', 'end_time': '2025-06-23T21:00:00Z',
+        }, format='json')
+
+    def test_co_deployed_app_is_used_directly(self):
+        """Test that the place app in INSTALLED_APPS selects the ORM backend."""
+        self.assertIs(get_backend(), local_backend)
+        with override_settings(PLACE_SERVICE_MODE='remote'):
+            self.assertIsNot(get_backend(), local_backend)
+
+    def test_list_without_http(self):
+        """Test that listing resolves place names with one extra query."""
+        for place in (self.garden, self.beach):
+            OwnerAvailability.objects.create(
+                owner=self.owner, dog=self.dog, place_id=place.id,
+                start_time=timezone.now(), end_time=timezone.now() + timedelta(hours=1))
+        with self.assertNumQueries(3):
+            response = self.client.get(self.availability_url)
+        self.assertEqual({item['place_name'] for item in response.data['results']}, {'Dog garden', 'Beach'})
+
+    def test_create_with_existing_place(self):
+        """Test that a known place name is resolved through the ORM."""
+        response = self.post_availability('Beach')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['place_name'], 'Beach')
+        self.assertEqual(OwnerAvailability.objects.get().place_id, self.beach.id)
+
+    @patch('place.services.get_place_details_tomtom')
+    def test_create_with_differently_typed_place(self, mock_geocode):
+        """Test that case and spacing variants reuse the place instead of geocoding."""
+        response = self.post_availability('  beach ')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(OwnerAvailability.objects.get().place_id, self.beach.id)
+        mock_geocode.assert_not_called()
+
+    @patch('place.services.get_place_details_tomtom', side_effect=GeocodingError('timeout'))
+    def test_create_when_geocoder_down(self, mock_geocode):
+        """Test that a new place while TomTom is unreachable is a 503, not a bad name."""
+        response = self.post_availability('Yarkon park')
+        self.assertEqual(response.status_code, 503)
+        self.assertFalse(OwnerAvailability.objects.exists())
+
+    @patch('place.services.get_place_details_tomtom')
+    def test_create_with_new_place(self, mock_geocode):
+        """Test that an unknown place is geocoded and stored in-process."""
+        mock_geocode.return_value = {
+            'name': 'Yarkon Park, Tel Aviv', 'address': 'Yarkon Park, Tel Aviv',
+            'latitude': 32.0987, 'longitude': 34.8085,
+        }
+        response = self.post_availability('Yarkon park')
+        self.assertEqual(response.status_code, 201)
+        place = Place.objects.get(name='Yarkon Park, Tel Aviv')
+        self.assertEqual(OwnerAvailability.objects.get().place_id, place.id)
+
+    @patch('place.services.get_place_details_tomtom', return_value=None)
+    def test_create_with_unknown_place(self, mock_geocode):
+        """Test that a place TomTom cannot find is a validation error."""
+        response = self.post_availability('Nowhere at all')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('place_name', response.data)
+
+
+
+class OwnerAvailabilityFilterTest(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.availability_url = reverse('owner:owner-availability-list')
+        cls.owner = create_owner('walker')
+        cls.dog = Dog.objects.create(owner=cls.owner, name='Rex', breed='Mixed', age=3)
+        cls.day = timezone.now().replace(hour=0, minute=0, second=0, microsecond=0)
+        for place_id, start_hour, end_hour in [(1, 16, 17), (1, 17, 18), (1, 18, 20), (2, 17, 19)]:
+            OwnerAvailability.objects.create(
+                owner=cls.owner, dog=cls.dog, place_id=place_id,
+                start_time=cls.day + timedelta(hours=start_hour),
+                end_time=cls.day + timedelta(hours=end_hour))
+
+    def setUp(self):
+        place_cache.clear()
+
+    def windows(self, **params):
+        response = self.client.get(self.availability_url, params)
+        self.assertEqual(response.status_code, 200)
+        return sorted(
+            (int(item['place_id']),
+             (parse_datetime(item['start_time']) - self.day).seconds // 3600,
+             (parse_datetime(item['end_time']) - self.day).seconds // 3600)
+            for item in response.data['results'])
+
+    def hour(self, hour):
+        return (self.day + timedelta(hours=hour)).isoformat()
+
+    def test_overlaps(self):
+        """Test that windows touching the range only at an edge are excluded."""
+        windows = self.windows(overlaps=f'{self.hour(17)},{self.hour(18.5)}', place_id=1)
+        self.assertEqual(windows, [(1, 17, 18), (1, 18, 20)])
+
+    def test_at(self):
+        """Test that ?at= returns the windows containing the timestamp."""
+        self.assertEqual(self.windows(at=self.hour(17)), [(1, 17, 18), (2, 17, 19)])
+
+    def test_combined_with_owner(self):
+        """Test that time filters combine with the exact-match fields."""
+        other = create_owner('other')
+        OwnerAvailability.objects.create(
+            owner=other, dog=Dog.objects.create(owner=other, name='Max', breed='Pug', age=2),
+            place_id=2, start_time=self.day + timedelta(hours=17),
+            end_time=self.day + timedelta(hours=18))
+        windows = self.windows(overlaps=f'{self.hour(18)},{self.hour(19)}', owner=self.owner.id)
+        self.assertEqual(windows, [(1, 18, 20), (2, 17, 19)])
+
+    def test_invalid_range(self):
+        """Test that a malformed range is rejected."""
+        response = self.client.get(self.availability_url, {'overlaps': self.hour(17)})
+        self.assertEqual(response.status_code, 400)
+
+    def test_rejects_inverted_window(self):
+        """Test that availabilities must end after they start."""
+        serializer = serializers.OwnerAvailabilitySerializer(data={
+            'owner_username': 'walker', 'dog': 'Rex', 'place_name': 'Beach',
+            'start_time': self.hour(18), 'end_time': self.hour(17),
+        })
+        self.assertFalse(serializer.is_valid())
+        self.assertIn('end_time', serializer.errors)
+
+    def test_partial_update_keeps_window_valid(self):
+        """Test that a PATCH of one bound is checked against the stored other one."""
+        availability = OwnerAvailability.objects.get(place_id=2)
+        url = reverse('owner:owner-availability-detail', args=[availability.id])
+        for end in (self.hour(17 + 24 * 10), self.hour(16)):
+            response = self.client.patch(url, {'end_time': end}, format='json')
+            self.assertEqual(response.status_code, 400)
+            self.assertIn('end_time', response.data)
+        response = self.client.patch(url, {'end_time': self.hour(21)}, format='json')
+        self.assertEqual(response.status_code, 200)
+
+    def test_check_flags_slots_longer_than_the_setting(self):
+        """Test that lowering AVAILABILITY_MAX_DURATION below stored slots is reported."""
+        self.assertEqual(check_availability_durations(None, databases=['default']), [])
+        with override_settings(AVAILABILITY_MAX_DURATION=timedelta(hours=1)):
+            errors = check_availability_durations(None, databases=['default'])
+        self.assertEqual([error.id for error in errors], ['owner.E001'])
+        self.assertIn('2 availabilities', errors[0].msg)
+
+
+class MeetupsViewTest(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.meetups_url = reverse('owner:meetups')
+        cls.day = timezone.now().replace(minute=0, second=0, microsecond=0) + timedelta(days=1)
+        cls.me = create_owner('me')
+        cls.friend = create_owner('friend')
+        cls.stranger = create_owner('stranger')
+        cls.garden = Place.objects.create(name='Dog garden', address='Ra\'anana')
+        cls.add_slot(cls.me, cls.garden.id, 17, 19)
+        cls.add_slot(cls.me, 99, 7, 8)
+        cls.add_slot(cls.friend, cls.garden.id, 18, 20)    # 60 minutes with me
+        cls.add_slot(cls.friend, cls.garden.id, 19, 20)    # only touches my slot
+        cls.add_slot(cls.stranger, 99, 6, 9)               # 60 minutes with me
+        cls.add_slot(cls.stranger, cls.garden.id, 9, 10)   # same place, other time
+
+    @classmethod
+    def add_slot(cls, owner, place_id, start_hour, end_hour):
+        dog = owner.dogs.first() or Dog.objects.create(
+            owner=owner, name=f'{owner.user.username} dog', breed='Mixed', age=3)
+        return OwnerAvailability.objects.create(
+            owner=owner, dog=dog, place_id=place_id,
+            start_time=cls.day + timedelta(hours=start_hour),
+            end_time=cls.day + timedelta(hours=end_hour))
+
+    def setUp(self):
+        place_cache.clear()
+        self.client.force_authenticate(self.me.user)
+
+    def test_sweep_join_matches_nested_loop(self):
+        """Test the sweep against a brute-force join on random slots."""
+        rng = np.random.default_rng(3)
+
+        def random_slots(n):
+            return [
+                OwnerAvailability(
+                    pk=index, place_id=int(rng.integers(3)),
+                    start_time=self.day + timedelta(minutes=int(start)),
+                    end_time=self.day + timedelta(minutes=int(start + length)))
+                for index, (start, length) in enumerate(
+                    zip(rng.integers(0, 600, n), rng.integers(1, 120, n)))
+            ]
+
+        mine, others = random_slots(60), random_slots(300)
+        expected = {
+            (a.pk, b.pk, max(a.start_time, b.start_time), min(a.end_time, b.end_time))
+            for a in mine for b in others
+            if a.place_id == b.place_id and a.start_time < b.end_time and b.start_time < a.end_time
+        }
+        actual = {(a.pk, b.pk, start, end) for a, b, start, end in sweep_join(mine, others)}
+        self.assertSetEqual(actual, expected)
+
+    def test_meetups(self):
+        """Test that overlapping owners are returned with the overlap duration."""
+        response = self.client.get(self.meetups_url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [(m['owner_username'], m['place_id'], m['overlap_minutes']) for m in response.data],
+            [('stranger', 99, 60), ('friend', self.garden.id, 60)])
+        self.assertEqual(response.data[1]['place_name'], 'Dog garden')
+        self.assertEqual(response.data[1]['dog'], 'friend dog')
+
+    def test_requires_authentication(self):
+        """Test that anonymous users get no meetups."""
+        self.client.force_authenticate(None)
+        self.assertEqual(self.client.get(self.meetups_url).status_code, 401)
+
+
+
+class OwnerAvailabilityBulkTest(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.bulk_url = reverse('owner:owner-availability-bulk')
+        cls.owner = create_owner('walker')
+        Dog.objects.create(owner=cls.owner, name='Rex', breed='Mixed', age=3)
+        cls.park = Place.objects.create(name='Park', address='Ra\'anana')
+
+    def setUp(self):
+        place_cache.clear()
+        search_index.clear()
+
+    def post(self, **payload):
+        payload = {'owner_username': 'walker', 'dog': 'Rex', 'place_name': 'Park', **payload}
+        return self.client.post(self.bulk_url, payload, format='json')
+
+    def slots(self, count):
+        start = timezone.now() + timedelta(days=1)
+        return [
+            {'start_time': (start + timedelta(days=i)).isoformat(),
+             'end_time': (start + timedelta(days=i, hours=1)).isoformat()}
+            for i in range(count)
+        ]
+
+    def test_query_count_does_not_grow_with_slots(self):
+        """Test that a week of slots costs the same queries as one slot."""
+        TableVersion.bump('owner.owneravailability')  # the counter row exists from here on
+        with CaptureQueriesContext(connection) as one:
+            self.assertEqual(self.post(slots=self.slots(1)).status_code, 201)
+        place_cache.clear()
+        search_index.clear()
+        with CaptureQueriesContext(connection) as week:
+            response = self.post(slots=self.slots(7))
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(response.data), 7)
+        self.assertEqual(len(week), len(one))
+        self.assertEqual(OwnerAvailability.objects.count(), 8)
+
+    def test_recurrence(self):
+        """Test that a weekday schedule expands in the requested time zone."""
+        response = self.post(recurrence={
+            'start_date': '2030-03-24', 'end_date': '2030-04-06',  # two weeks from a Sunday
+            'weekdays': [6, 0, 1, 2, 3], 'start_time': '07:00', 'end_time': '08:00',
+            'timezone': 'Asia/Jerusalem',
+        })
+        self.assertEqual(response.status_code, 201)
+        starts = list(OwnerAvailability.objects.order_by('start_time').values_list('start_time', flat=True))
+        self.assertEqual(len(starts), 10)
+        self.assertTrue(all(start.weekday() in (6, 0, 1, 2, 3) for start in starts))
+        # Israel moves to summer time on 2030-03-29
+        self.assertEqual((starts[0].hour, starts[-1].hour), (5, 4))
+
+    def test_invalid_slot_creates_nothing(self):
+        """Test that one bad slot rejects the whole batch."""
+        slots = self.slots(3)
+        slots[1]['end_time'] = slots[1]['start_time']
+        response = self.post(slots=slots)
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(OwnerAvailability.objects.exists())
+
+    def test_requires_slots_or_recurrence(self):
+        """Test that an empty request is rejected."""
+        self.assertEqual(self.post().status_code, 400)
+
+    def test_slot_cap(self):
+        """Test that a request cannot create more than the configured slots."""
+        with override_settings(AVAILABILITY_BULK_MAX_SLOTS=3):
+            self.assertEqual(self.post(slots=self.slots(4)).status_code, 400)
+
+    def test_long_recurrence_is_rejected_quickly(self):
+        """Test that a rule spanning centuries is not expanded past the slot cap."""
+        started = time.monotonic()
+        response = self.post(recurrence={
+            'start_date': '2030-01-01', 'end_date': '9999-12-31',
+            'start_time': '07:00', 'end_time': '08:00',
+        })
+        self.assertEqual(response.status_code, 400)
+        self.assertLess(time.monotonic() - started, 1)
+
+    def test_recurrence_up_to_the_last_date(self):
+        """Test that a rule ending on the last representable day is expanded."""
+        response = self.post(recurrence={
+            'start_date': '9999-12-25', 'end_date': '9999-12-31',
+            'start_time': '07:00', 'end_time': '08:00',
+        })
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(response.data), 7)
+
+        response = self.post(recurrence={
+            'start_date': '9999-12-31', 'end_date': '9999-12-31',
+            'start_time': '20:00', 'end_time': '23:00', 'timezone': 'America/New_York',
+        })
+        self.assertEqual(response.status_code, 400)
+
+
+class MapViewTest(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.map_url = reverse('owner:map')
+        cls.bbox = '34.80,32.10,34.95,32.25'  # Ra'anana and around
+        cls.garden = Place.objects.create(
+            name='Dog garden', address='Ra\'anana', latitude=32.1848, longitude=34.871)
+        cls.park = Place.objects.create(
+            name='Park', address='Herzliya', latitude=32.1624, longitude=34.8447)
+        cls.haifa = Place.objects.create(
+            name='Haifa beach', address='Haifa', latitude=32.794, longitude=34.9896)
+        now = timezone.now()
+        for index in range(4):
+            owner = create_owner(f'walker{index}')
+            dog = Dog.objects.create(owner=owner, name=f'Rex{index}', breed='Mixed', age=3)
+            for place, offset in [(cls.garden, 1), (cls.haifa, 1), (cls.park, 48)]:
+                OwnerAvailability.objects.create(
+                    owner=owner, dog=dog, place_id=place.id,
+                    start_time=now + timedelta(hours=offset),
+                    end_time=now + timedelta(hours=offset + 1))
+
+    def setUp(self):
+        place_cache.clear()
+
+    def test_places_in_viewport_with_availabilities(self):
+        """Test that the map joins places, availabilities and dogs in two queries."""
+        with self.assertNumQueries(2):
+            response = self.client.get(self.map_url, {'bbox': self.bbox})
+        self.assertEqual(response.status_code, 200)
+        by_name = {place['name']: place for place in response.data}
+        self.assertSetEqual(set(by_name), {'Dog garden', 'Park'})
+        self.assertEqual(len(by_name['Dog garden']['availabilities']), 4)
+        self.assertEqual(by_name['Park']['availabilities'], [])  # outside the next 24h
+        self.assertEqual(
+            {a['dog'] for a in by_name['Dog garden']['availabilities']},
+            {f'Rex{index}' for index in range(4)})
+
+    def test_time_window(self):
+        """Test that ?start/?end select which availabilities are joined."""
+        start = timezone.now() + timedelta(hours=47)
+        response = self.client.get(self.map_url, {
+            'bbox': self.bbox, 'start': start.isoformat(),
+            'end': (start + timedelta(hours=3)).isoformat()})
+        by_name = {place['name']: place for place in response.data}
+        self.assertEqual(by_name['Dog garden']['availabilities'], [])
+        self.assertEqual(len(by_name['Park']['availabilities']), 4)
+
+    def test_clusters_with_active_counts(self):
+        """Test that clusters carry the number of availabilities in the window."""
+        cluster_index.clear()
+        response = self.client.get(reverse('owner:map-clusters'), {'bbox': '34,31,36,34', 'zoom': 8})
+        self.assertEqual(response.status_code, 200)
+        clusters = sorted(response.data, key=lambda cluster: cluster['latitude'])
+        # Dog garden and Park share a cluster; only the garden is active today
+        self.assertEqual([(c['count'], c['active_count']) for c in clusters], [(2, 4), (1, 4)])
+        self.assertNotIn('place_ids', clusters[0])
+
+    def test_invalid_bbox(self):
+        """Test that a missing or malformed bbox is rejected."""
+        self.assertEqual(self.client.get(self.map_url).status_code, 400)
+        response = self.client.get(self.map_url, {'bbox': '34.8,32.1,34.9'})
+        self.assertEqual(response.status_code, 400)
+
+
+class ConditionalGetTest(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = create_owner('walker')
+        cls.dog = Dog.objects.create(owner=cls.owner, name='Rex', breed='Mixed', age=3)
+        cls.owners_url = reverse('owner:owners-list')
+        cls.dogs_url = reverse('owner:dogs-list')
+        cls.availability_url = reverse('owner:owner-availability-list')
+
+    def revalidate(self, url, etag):
+        return self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+    def test_not_modified(self):
+        """Test that a matching If-None-Match gets a bodiless 304 from one query."""
+        etag = self.client.get(self.owners_url)['ETag']
+        with self.assertNumQueries(1):
+            response = self.revalidate(self.owners_url, etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+        self.assertFalse(response.content)
+
+    def test_write_changes_etag(self):
+        """Test that writing to a listed table invalidates the ETag."""
+        etag = self.client.get(self.dogs_url)['ETag']
+        Dog.objects.create(owner=self.owner, name='Bella', breed='Poodle', age=2)
+        response = self.revalidate(self.dogs_url, etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(len(response.data['results']), 2)
+
+    def test_related_table_changes_etag(self):
+        """Test that renaming a user invalidates the owner list it shows up in."""
+        etag = self.client.get(self.owners_url)['ETag']
+        self.owner.user.first_name = 'Renamed'
+        self.owner.user.save()
+        self.assertEqual(self.revalidate(self.owners_url, etag).status_code, 200)
+
+    def test_login_keeps_etag(self):
+        """Test that updating last_login alone does not invalidate anything."""
+        etag = self.client.get(self.owners_url)['ETag']
+        self.owner.user.last_login = timezone.now()
+        self.owner.user.save(update_fields=['last_login'])
+        self.assertEqual(self.revalidate(self.owners_url, etag).status_code, 304)
+
+    def test_bulk_create_changes_etag(self):
+        """Test that bulk-created availabilities invalidate the list too."""
+        etag = self.client.get(self.availability_url)['ETag']
+        start = timezone.now()
+        with patch('owner.serializers.get_or_create_place_id', return_value=1):
+            response = self.client.post(reverse('owner:owner-availability-bulk'), {
+                'owner_username': 'walker', 'dog': 'Rex', 'place_name': 'Beach',
+                'slots': [{'start_time': start, 'end_time': start + timedelta(hours=1)}],
+            }, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(self.revalidate(self.availability_url, etag).status_code, 200)
+
+    @override_settings(PLACE_SERVICE_MODE='remote')
+    def test_remote_place_names_expire_etag(self):
+        """Test that with a remote place service the ETag outlives no place cache window."""
+        with patch('owner.views.time') as clock:
+            clock.time.return_value = 0
+            etag = self.client.get(self.availability_url)['ETag']
+            self.assertEqual(self.revalidate(self.availability_url, etag).status_code, 304)
+            Place.objects.create(name='Beach', address='Herzliya')  # Not this service's counter
+            self.assertEqual(self.revalidate(self.availability_url, etag).status_code, 304)
+            clock.time.return_value = settings.PLACE_CACHE_TTL
+            self.assertEqual(self.revalidate(self.availability_url, etag).status_code, 200)
+
+    def test_etag_depends_on_query(self):
+        """Test that different filters of the same list get different ETags."""
+        etag = self.client.get(self.dogs_url)['ETag']
+        self.assertNotEqual(self.client.get(self.dogs_url, {'name': 'Rex'})['ETag'], etag)
+        self.assertEqual(self.revalidate(f'{self.dogs_url}?name=Bella', etag).status_code, 200)
+
+
+@override_settings(SYNC_CURSOR_OVERLAP=timedelta(0))
+class DeltaSyncTest(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = create_owner('walker')
+        cls.dogs = [
+            Dog.objects.create(owner=cls.owner, name=name, breed='Mixed', age=3)
+            for name in ('Rex', 'Bella', 'Max')
+        ]
+        cls.dogs_url = reverse('owner:dogs-list')
+
+    def sync(self, cursor, **params):
+        response = self.client.get(self.dogs_url, {'since': cursor, **params})
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_changes_since_cursor(self):
+        """Test that a cursor returns only rows changed or deleted after it."""
+        data = self.sync('0')
+        self.assertEqual([dog['name'] for dog in data['results']], ['Rex', 'Bella', 'Max'])
+        self.assertEqual(data['deleted'], [])
+
+        rex, bella, _ = self.dogs
+        rex.age = 4
+        rex.save()
+        bella_id = bella.id
+        bella.delete()
+        data = self.sync(data['cursor'])
+        self.assertEqual([(dog['id'], dog['age']) for dog in data['results']], [(rex.id, 4)])
+        self.assertEqual(data['deleted'], [bella_id])
+
+        data = self.sync(data['cursor'])
+        self.assertEqual((data['results'], data['deleted']), ([], []))
+
+    def test_has_more(self):
+        """Test that large deltas come in chunks that resume where they stopped."""
+        names = []
+        cursor = '0'
+        with override_settings(API_MAX_PAGE_SIZE=2):
+            while True:
+                data = self.sync(cursor)
+                names.extend(dog['name'] for dog in data['results'])
+                cursor = data['cursor']
+                if not data['has_more']:
+                    break
+        self.assertEqual(names, ['Rex', 'Bella', 'Max'])
+
+    def test_filters_apply(self):
+        """Test that list filters narrow the changed rows too."""
+        data = self.sync('0', name='Max')
+        self.assertEqual([dog['name'] for dog in data['results']], ['Max'])
+
+    def test_user_and_dog_changes_reach_dependent_rows(self):
+        """Test that renames show up in the rows that display them."""
+        OwnerAvailability.objects.create(
+            owner=self.owner, dog=self.dogs[0], place_id=1,
+            start_time=timezone.now(), end_time=timezone.now() + timedelta(hours=1))
+        owners_cursor = self.client.get(reverse('owner:owners-list'), {'since': '0'}).data['cursor']
+        availability_url = reverse('owner:owner-availability-list')
+        cursor = self.client.get(availability_url, {'since': '0'}).data['cursor']
+
+        self.owner.user.first_name = 'Renamed'
+        self.owner.user.save()
+        data = self.client.get(reverse('owner:owners-list'), {'since': owners_cursor}).data
+        self.assertEqual([owner['first_name'] for owner in data['results']], ['Renamed'])
+
+        self.dogs[0].name = 'Rexy'
+        self.dogs[0].save()
+        with patch('owner.serializers.get_place_names', return_value={}):
+            data = self.client.get(availability_url, {'since': cursor}).data
+        self.assertEqual([item['dog'] for item in data['results']], ['Rexy'])
+
+    def test_invalid_and_expired_cursors(self):
+        """Test that garbage cursors are rejected and stale ones must resync."""
+        response = self.client.get(self.dogs_url, {'since': 'yesterday'})
+        self.assertEqual(response.status_code, 400)
+        stale = encode_cursor(timezone.now() - settings.SYNC_TOMBSTONE_RETENTION - timedelta(days=1))
+        response = self.client.get(self.dogs_url, {'since': stale})
+        self.assertEqual(response.status_code, 410)
+
+    def test_prune_tombstones(self):
+        """Test that tombstones past the retention period are deleted."""
+        self.dogs[0].delete()
+        Tombstone.objects.update(deleted_at=timezone.now() - settings.SYNC_TOMBSTONE_RETENTION * 2)
+        recent_id = self.dogs[1].id
+        self.dogs[1].delete()
+        call_command('prune_tombstones', stdout=StringIO())
+        self.assertEqual(list(Tombstone.objects.values_list('object_id', flat=True)), [recent_id])
+
+
+@override_settings(EVENTS_BUS='local')
+class AvailabilityEventsTest(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = create_owner('walker')
+        cls.dog = Dog.objects.create(owner=cls.owner, name='Rex', breed='Mixed', age=3)
+        cls.garden = Place.objects.create(
+            name='Dog garden', address='Ra\'anana', latitude=32.1848, longitude=34.871)
+
+    def setUp(self):
+        place_cache.clear()
+        self.loop = asyncio.new_event_loop()
+        self.addCleanup(self.loop.close)
+
+    def subscribe(self, **filters):
+        subscription = event_broker.subscribe(self.loop, **filters)
+        self.addCleanup(event_broker.unsubscribe, subscription)
+        return subscription
+
+    def received(self, subscription):
+        self.loop.run_until_complete(asyncio.sleep(0))  # run the queued puts
+        events = []
+        while not subscription.queue.empty():
+            events.append(subscription.queue.get_nowait())
+        return events
+
+    def create_availability(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            return OwnerAvailability.objects.create(
+                owner=self.owner, dog=self.dog, place_id=self.garden.id,
+                start_time=timezone.now(), end_time=timezone.now() + timedelta(hours=1))
+
+    def test_writes_are_pushed_on_commit(self):
+        """Test that create, update and delete reach subscribers of the place."""
+        by_place = self.subscribe(place_ids={self.garden.id})
+        by_bbox = self.subscribe(bbox=(34.8, 32.1, 34.95, 32.25))
+        elsewhere = self.subscribe(place_ids={self.garden.id + 1})
+
+        availability = self.create_availability()
+        with self.captureOnCommitCallbacks(execute=True):
+            availability.end_time += timedelta(hours=1)
+            availability.save()
+        availability_id = availability.id
+        with self.captureOnCommitCallbacks(execute=True):
+            availability.delete()
+
+        for subscription in (by_place, by_bbox):
+            events = self.received(subscription)
+            self.assertEqual([event['event'] for event in events], ['created', 'updated', 'deleted'])
+            self.assertEqual([event['ids'] for event in events], [[availability_id]] * 3)
+        self.assertEqual(self.received(elsewhere), [])
+
+    def test_nothing_is_published_on_rollback(self):
+        """Test that events wait for the commit."""
+        subscription = self.subscribe(place_ids={self.garden.id})
+        with self.captureOnCommitCallbacks(execute=False):
+            OwnerAvailability.objects.create(
+                owner=self.owner, dog=self.dog, place_id=self.garden.id,
+                start_time=timezone.now(), end_time=timezone.now() + timedelta(hours=1))
+        self.assertEqual(self.received(subscription), [])
+
+    def test_bulk_create_is_pushed(self):
+        """Test that bulk-created slots are announced one by one."""
+        subscription = self.subscribe(place_ids={self.garden.id})
+        start = timezone.now()
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('owner:owner-availability-bulk'), {
+                'owner_username': 'walker', 'dog': 'Rex', 'place_name': 'Dog garden',
+                'slots': [{'start_time': start + timedelta(days=day),
+                           'end_time': start + timedelta(days=day, hours=1)} for day in range(3)],
+            }, format='json')
+        self.assertEqual(response.status_code, 201)
+        events = self.received(subscription)
+        self.assertEqual([event['event'] for event in events], ['created'])
+        self.assertEqual(len(events[0]['ids']), 3)
+
+    def test_stream(self):
+        """Test that the SSE endpoint streams matching events until the client leaves."""
+        sent = []
+
+        async def run():
+            left = asyncio.Event()
+
+            async def receive():
+                await left.wait()
+                return {'type': 'http.disconnect'}
+
+            async def send(message):
+                sent.append(message)
+                if message.get('body') == b': subscribed\n\n':
+                    event_broker.publish({'event': 'created', 'place_id': 99, 'ids': [1]})
+                    event_broker.publish({'event': 'created', 'place_id': 7, 'ids': [2]})
+                elif message.get('body', b'').startswith(b'event:'):
+                    left.set()
+
+            scope = {'type': 'http', 'path': EVENTS_PATH, 'query_string': b'place_ids=7,8'}
+            await asyncio.wait_for(availability_events(scope, receive, send), 5)
+
+        self.loop.run_until_complete(run())
+        self.assertEqual(sent[0]['status'], 200)
+        self.assertIn((b'content-type', b'text/event-stream'), sent[0]['headers'])
+        events = [message['body'] for message in sent[1:] if message.get('body', b'').startswith(b'event:')]
+        self.assertEqual(events, [b'event: created\ndata: {"place_id": 7, "ids": [2]}\n\n'])
+        self.assertFalse(event_broker.has_subscribers())
+
+    def test_stream_locates_events_for_a_bbox(self):
+        """Test that a bbox stream looks places up itself and drops those outside."""
+        sent = []
+        haifa = Place.objects.create(name='Haifa beach', address='Haifa', latitude=32.794, longitude=34.9896)
+
+        async def run():
+            left = asyncio.Event()
+
+            async def receive():
+                await left.wait()
+                return {'type': 'http.disconnect'}
+
+            async def send(message):
+                sent.append(message)
+                if message.get('body') == b': subscribed\n\n':
+                    event_broker.publish({'event': 'created', 'place_id': haifa.id, 'ids': [1]})
+                    event_broker.publish({'event': 'created', 'place_id': self.garden.id, 'ids': [2]})
+                elif message.get('body', b'').startswith(b'event:'):
+                    left.set()
+
+            scope = {'type': 'http', 'path': EVENTS_PATH, 'query_string': b'bbox=34.8,32.1,34.95,32.25'}
+            await asyncio.wait_for(availability_events(scope, receive, send), 5)
+
+        places = {place.id: {'id': place.id, 'latitude': place.latitude, 'longitude': place.longitude}
+                  for place in (haifa, self.garden)}
+        with patch('owner.places.get_places', lambda ids: {i: places[i] for i in ids}):
+            self.loop.run_until_complete(run())
+        events = [message['body'] for message in sent[1:] if message.get('body', b'').startswith(b'event:')]
+        self.assertEqual(len(events), 1)
+        self.assertIn(f'"ids": [2]'.encode(), events[0])
+
+    def test_stream_needs_a_filter(self):
+        """Test that subscribing to everything is refused."""
+        sent = []
+
+        async def send(message):
+            sent.append(message)
+
+        scope = {'type': 'http', 'path': EVENTS_PATH, 'query_string': b'bbox=1,2'}
+        self.loop.run_until_complete(availability_events(scope, None, send))
+        self.assertEqual(sent[0]['status'], 400)
+
+    def test_stream_allows_the_frontend(self):
+        """Test that the allowed origins may read the stream from another port."""
+        sent = []
+
+        async def receive():
+            return {'type': 'http.disconnect'}
+
+        async def send(message):
+            sent.append(message)
+
+        for origin in (b'http://localhost:5173', b'http://evil.example'):
+            sent.clear()
+            scope = {'type': 'http', 'path': EVENTS_PATH, 'query_string': b'place_ids=7',
+                     'headers': [(b'origin', origin)]}
+            self.loop.run_until_complete(availability_events(scope, receive, send))
+            allowed = dict(sent[0]['headers']).get(b'access-control-allow-origin')
+            self.assertEqual(allowed, origin if origin.endswith(b':5173') else None)
+
+
+@unittest.skipUnless(connection.vendor == 'postgresql', 'LISTEN/NOTIFY needs PostgreSQL')
+class PostgresEventBusTest(TransactionTestCase):
+    """Writes committed by another connection reach the ASGI process's subscribers"""
+
+    def setUp(self):
+        self.owner = create_owner('walker')
+        self.dog = Dog.objects.create(owner=self.owner, name='Rex', breed='Mixed', age=3)
+        self.loop = asyncio.new_event_loop()
+        self.addCleanup(self.loop.close)
+        event_listener.start()
+        self.addCleanup(event_listener.stop)
+
+    def test_committed_writes_are_relayed(self):
+        """Test that the listener hands committed writes to the broker, and not rolled back ones."""
+        subscription = event_broker.subscribe(self.loop, place_ids={1})
+        self.addCleanup(event_broker.unsubscribe, subscription)
+        time.sleep(0.5)  # let the listener connect
+
+        try:
+            with transaction.atomic():
+                OwnerAvailability.objects.create(
+                    owner=self.owner, dog=self.dog, place_id=1,
+                    start_time=timezone.now(), end_time=timezone.now() + timedelta(hours=1))
+                raise RuntimeError
+        except RuntimeError:
+            pass
+        availability = OwnerAvailability.objects.create(
+            owner=self.owner, dog=self.dog, place_id=1,
+            start_time=timezone.now(), end_time=timezone.now() + timedelta(hours=1))
+
+        event = self.loop.run_until_complete(asyncio.wait_for(subscription.queue.get(), 5))
+        self.assertEqual((event['event'], event['ids']), ('created', [availability.id]))
+        self.assertTrue(subscription.queue.empty())
+
+
+class ArchiveAvailabilitiesTest(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        owner = create_owner('walker')
+        dog = Dog.objects.create(owner=owner, name='Rex', breed='Mixed', age=3)
+        now = timezone.now()
+        cls.past = [
+            OwnerAvailability.objects.create(
+                owner=owner, dog=dog, place_id=place_id,
+                start_time=now - timedelta(days=days, hours=2),
+                end_time=now - timedelta(days=days))
+            for place_id, days in ((1, 30), (1, 20), (2, 10))
+        ]
+        cls.current = OwnerAvailability.objects.create(
+            owner=owner, dog=dog, place_id=1,
+            start_time=now - timedelta(days=1), end_time=now + timedelta(hours=1))
+
+    def archive(self, *args):
+        call_command('archive_availabilities', '--days=7', *args, stdout=StringIO())
+
+    def test_archive(self):
+        """Test that only long-expired slots move, keeping their ids."""
+        self.archive('--batch-size=2')
+        self.assertEqual(list(OwnerAvailability.objects.values_list('id', flat=True)), [self.current.id])
+        self.assertEqual(
+            sorted(OwnerAvailabilityArchive.objects.values_list('id', flat=True)),
+            sorted(availability.id for availability in self.past))
+        # Delta-sync clients learn that the slots left the live list
+        self.assertEqual(
+            sorted(Tombstone.objects.filter(model='owner.owneravailability').values_list('object_id', flat=True)),
+            sorted(availability.id for availability in self.past))
+        self.archive()  # Nothing left to move
+        self.assertEqual(OwnerAvailabilityArchive.objects.count(), 3)
+
+    def test_prune(self):
+        """Test that --prune drops expired slots without archiving them."""
+        self.archive('--prune')
+        self.assertEqual(OwnerAvailability.objects.count(), 1)
+        self.assertFalse(OwnerAvailabilityArchive.objects.exists())
+
+    def test_history_and_stats(self):
+        """Test that archived slots stay listable and feed the stats."""
+        self.archive()
+        response = self.client.get(reverse('owner:availability-history-list'), {'place_id': 1})
+        self.assertEqual(len(response.data['results']), 2)
+        self.assertEqual(response.data['results'][0]['dog'], 'Rex')
+        response = self.client.get(reverse('owner:availability-history-stats'))
+        self.assertEqual(response.data, [
+            {'place_id': 1, 'slots': 2, 'owners': 1, 'hours': 4.0},
+            {'place_id': 2, 'slots': 1, 'owners': 1, 'hours': 2.0},
+        ])
+
+
+class SingleFlightTest(APITestCase):
+    def setUp(self):
+        place_cache.clear()
+
+    def run_concurrently(self, flight, key, targets):
+        """Start `targets` while the first holds the flight, then let it finish"""
+        results = [None] * len(targets)
+
+        def run(position, target):
+            try:
+                results[position] = target()
+            except Exception as e:
+                results[position] = e
+
+        threads = [threading.Thread(target=run, args=item) for item in enumerate(targets)]
+        threads[0].start()
+        while key not in flight._calls:
+            time.sleep(0.001)
+        for thread in threads[1:]:
+            thread.start()
+        deadline = time.monotonic() + 5
+        while flight._calls[key].waiters < len(targets) - 1 and time.monotonic() < deadline:
+            time.sleep(0.001)
+        self.release.set()
+        for thread in threads:
+            thread.join(5)
+        return results
+
+    def test_concurrent_calls_share_one_execution(self):
+        """Test that callers arriving mid-flight get the leader's result."""
+        flight = SingleFlight()
+        self.release = threading.Event()
+        calls = []
+
+        def work():
+            calls.append(1)
+            self.release.wait(5)
+            return object()
+
+        results = self.run_concurrently(flight, 'key', [lambda: flight.do('key', work)] * 5)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(len({id(result) for result, _ in results}), 1)
+        self.assertEqual(sorted(shared for _, shared in results), [False] + [True] * 4)
+        self.assertEqual(flight.do('key', lambda: 'again'), ('again', False))
+
+    def test_errors_reach_every_caller(self):
+        """Test that waiters see the leader's exception."""
+        flight = SingleFlight()
+        self.release = threading.Event()
+
+        def work():
+            self.release.wait(5)
+            raise ValueError('geocoder down')
+
+        results = self.run_concurrently(flight, 'key', [lambda: flight.do('key', work)] * 3)
+        self.assertTrue(all(isinstance(result, ValueError) for result in results))
+
+    @override_settings(PLACE_SERVICE_MODE='remote')
+    def test_place_lookups_are_coalesced(self):
+        """Test that concurrent availabilities at a new place make one place-service round trip."""
+        self.release = threading.Event()
+        calls = []
+
+        def find_place(place_name):
+            calls.append(place_name)
+            self.release.wait(5)
+            return {'id': 7, 'name': 'Dog garden'}
+
+        with patch.object(remote_backend, 'find_place', side_effect=find_place):
+            results = self.run_concurrently(place_lookups, 'dog garden', [
+                lambda name=name: get_or_create_place_id(name)
+                for name in ('Dog garden', 'dog garden', ' Dog  Garden')
+            ])
+        self.assertEqual(results, [7, 7, 7])
+        self.assertEqual(len(calls), 1)
+
+
+class FakeGeoIPReader:
+    def __init__(self, records):
+        self.records = records
+        self.lookups = []
+
+    def get(self, ip):
+        self.lookups.append(ip)
+        return self.records.get(ip)
+
+
+class GeoIPTest(APITestCase):
+    def setUp(self):
+        self.reader = FakeGeoIPReader({
+            '8.8.8.8': {'location': {'latitude': 32.0853, 'longitude': 34.7818}},
+            '9.9.9.9': {'country': {'iso_code': 'CH'}},  # no coordinates
+        })
+        self.locator = GeoIPLocator('/nonexistent.mmdb', cache_size=10, cache_ttl=60)
+        self.locator._reader = self.reader
+
+    def request(self, remote_addr, forwarded=None):
+        request = RequestFactory().post('/', REMOTE_ADDR=remote_addr)
+        if forwarded:
+            request.META['HTTP_X_FORWARDED_FOR'] = forwarded
+        return request
+
+    def test_client_ip(self):
+        """Test that X-Forwarded-For is only trusted as far as the configured proxies."""
+        request = self.request('10.0.0.2', forwarded='6.6.6.6, 8.8.8.8')
+        self.assertEqual(client_ip(request), '10.0.0.2')
+        with override_settings(GEOIP_PROXY_COUNT=1):
+            self.assertEqual(client_ip(request), '8.8.8.8')
+        with override_settings(GEOIP_PROXY_COUNT=5):
+            self.assertEqual(client_ip(request), '6.6.6.6')
+
+    def test_lookups_are_cached(self):
+        """Test that each IP is read from the database once, misses included."""
+        for _ in range(3):
+            self.assertEqual(self.locator.locate('8.8.8.8'), {'latitude': 32.0853, 'longitude': 34.7818})
+            self.assertIsNone(self.locator.locate('9.9.9.9'))
+        self.assertEqual(self.reader.lookups, ['8.8.8.8', '9.9.9.9'])
+
+    def test_private_and_invalid_addresses(self):
+        """Test that addresses the database cannot know are not looked up."""
+        for ip in ('127.0.0.1', '10.1.2.3', '::1', 'not-an-ip', None):
+            self.assertIsNone(self.locator.locate(ip))
+        self.assertEqual(self.reader.lookups, [])
+
+    def test_without_database(self):
+        """Test that a missing database file disables lookups instead of failing."""
+        locator = GeoIPLocator(None, cache_size=10, cache_ttl=60)
+        self.assertIsNone(locator.locate('8.8.8.8'))
+
+    def test_login_writes_only_changed_locations(self):
+        """Test that logging in from the same place does not rewrite the owner."""
+        owner = create_owner('walker', 32.0853, 34.7818)
+        updated_at = owner.updated_at
+        with patch('owner.geoip.locator', self.locator):
+            response = self.client.post(
+                reverse('owner:login'), {'username': 'walker', 'password': 'securepassword'},
+                REMOTE_ADDR='8.8.8.8')
+            self.assertEqual(response.status_code, 200)
+            owner.refresh_from_db()
+            self.assertEqual(owner.updated_at, updated_at)
+
+            self.reader.records['8.8.8.8'] = {'location': {'latitude': 31.7683, 'longitude': 35.2137}}
+            self.locator.cache.clear()
+            self.client.post(
+                reverse('owner:login'), {'username': 'walker', 'password': 'securepassword'},
+                REMOTE_ADDR='8.8.8.8')
+        owner.refresh_from_db()
+        self.assertEqual(owner.location, (31.7683, 35.2137))
+
+
+class CachedTokenAuthenticationTest(APITestCase):
+    def setUp(self):
+        token_cache.clear()
+        self.owner = create_owner('walker', 32.0853, 34.7818)
+        self.token = Token.objects.create(user=self.owner.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+    def tables_queried(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response, ' '.join(query['sql'] for query in queries.captured_queries)
+
+    def test_repeat_requests_skip_auth_queries(self):
+        """Test that a known token needs neither the token nor the owner query."""
+        _, sql = self.tables_queried(reverse('owner:meetups'))
+        self.assertIn('authtoken_token', sql)
+
+        response, sql = self.tables_queried(reverse('owner:meetups'))
+        self.assertNotIn('authtoken_token', sql)
+        self.assertNotIn('FROM "owner_owner"', sql)
+        self.assertEqual(response.data, [])
+
+    def test_deleted_token_is_rejected(self):
+        """Test that a revoked token stops working even while it is cached."""
+        self.assertEqual(self.client.get(reverse('owner:me')).status_code, 200)
+        self.token.delete()
+        self.assertEqual(self.client.get(reverse('owner:me')).status_code, 401)
+
+    def test_owner_changes_evict(self):
+        """Test that views see an owner's new location right after it is saved."""
+        create_owner('nearby', 31.7683, 35.2137)
+        url = reverse('owner:nearby-owners-list')
+        self.assertEqual(self.client.get(url, {'radius': 10}).data, [])
+
+        self.owner.latitude, self.owner.longitude = 31.7690, 35.2140
+        self.owner.save()
+        response = self.client.get(url, {'radius': 10})
+        self.assertEqual([owner['first_name'] for owner in response.data], ['Nearby'])
+
+    def test_user_without_owner(self):
+        """Test that users without a profile authenticate with no owner attached."""
+        user = User.objects.create_user(username='visitor', password='securepassword')
+        token = Token.objects.create(user=user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+        for _ in range(2):
+            response = self.client.get(reverse('owner:meetups'))
+            self.assertEqual(response.status_code, 404)
+
+
+class OwnerMatchesTest(APITestCase):
+    def setUp(self):
+        owner_index.clear()
+        self.url = reverse('owner:owner-matches-list')
+        self.me = create_owner('me', 32.1848, 34.8710, age=30)
+        Dog.objects.create(owner=self.me, name='Rex', breed='Labrador Retriever', age=3)
+        self.client.force_authenticate(self.me.user)
+
+    def add_owner(self, username, lat, lon, age, breed=None, dog_age=None):
+        owner = create_owner(username, lat, lon, age=age)
+        if breed:
+            Dog.objects.create(owner=owner, name=f'{username} dog', breed=breed, age=dog_age)
+        return owner
+
+    def test_ranking_and_breakdown(self):
+        """Test that similar nearby owners rank first, with their score explained."""
+        self.add_owner('twin', 32.1900, 34.8800, 31, 'labrador retriever', 3)
+        self.add_owner('cousin', 32.1624, 34.8447, 45, 'Golden Retriever', 9)
+        self.add_owner('stranger', 32.1700, 34.8600, 70)
+        self.add_owner('faraway', 31.7683, 35.2137, 30, 'Labrador Retriever', 3)  # ~60 km
+
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([match['first_name'] for match in response.data], ['Twin', 'Cousin', 'Stranger'])
+        twin, cousin, _ = response.data
+        self.assertEqual(twin['score_breakdown']['breed'], 1.0)
+        self.assertEqual(cousin['score_breakdown']['breed'], 0.5)
+        self.assertEqual(twin['score_breakdown']['dog_age'], 1.0)
+        self.assertGreater(twin['score'], cousin['score'])
+        self.assertAlmostEqual(twin['distance_km'], 1.0, delta=0.1)
+
+        response = self.client.get(self.url, {'limit': 1})
+        self.assertEqual(len(response.data), 1)
+        self.assertEqual(self.client.get(self.url, {'limit': 0}).status_code, 400)
+
+    def test_shared_availability_counts(self):
+        """Test that upcoming time at the same place lifts a candidate above a nearer one."""
+        self.add_owner('neighbour', 32.1850, 34.8712, 30)
+        walker = self.add_owner('walker', 32.2000, 34.9000, 30, 'Poodle', 8)
+        start = timezone.now() + timedelta(hours=1)
+        OwnerAvailability.objects.create(
+            owner=self.me, dog=self.me.dogs.get(), place_id=7, start_time=start, end_time=start + timedelta(hours=3))
+        OwnerAvailability.objects.create(
+            owner=walker, dog=walker.dogs.get(), place_id=7,
+            start_time=start + timedelta(hours=1), end_time=start + timedelta(hours=5))
+
+        matches = compute_matches(self.me)
+        self.assertEqual(matches[0]['owner_id'], walker.id)
+        self.assertAlmostEqual(matches[0]['breakdown']['availability'], 1 - np.exp(-1), places=4)
+
+    def test_queries_do_not_grow_with_candidates(self):
+        """Test that scoring costs the same number of queries for any number of candidates."""
+        self.add_owner('first', 32.19, 34.88, 30, 'Poodle', 2)
+        owner_index.load()
+        with CaptureQueriesContext(connection) as few:
+            compute_matches(self.me)
+        for i in range(10):
+            self.add_owner(f'more{i}', 32.18 + i / 1000, 34.87, 25 + i, 'Beagle', i + 1)
+        owner_index.load()
+        with CaptureQueriesContext(connection) as many:
+            self.assertEqual(len(compute_matches(self.me, limit=20)), 11)
+        self.assertEqual(len(many), len(few))
+
+    def test_owner_without_location(self):
+        """Test that owners without a location are matched within their city."""
+        self.me.latitude = self.me.longitude = None
+        self.me.save()
+        self.add_owner('local', None, None, 29)
+        create_owner('elsewhere', None, None, city='Haifa')
+        response = self.client.get(self.url)
+        self.assertEqual([match['first_name'] for match in response.data], ['Local'])
+        self.assertIsNone(response.data[0]['distance_km'])
+
+    @override_settings(SUGGESTION_PROVIDER='local')
+    def test_suggestion_without_llm(self):
+        """Test that the suggestion view explains the top match locally when no LLM is set up."""
+        self.add_owner('twin', 32.1900, 34.8800, 31, 'Labrador Retriever', 3)
+        response = self.client.post(reverse('owner:ai-based-match'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['source'], 'local')
+        self.assertTrue(response.data['suggestion'].startswith('Twin Test is your best match'))
+        self.assertEqual([match['first_name'] for match in response.data['matches']], ['Twin'])
+
+
+class MatchStoreTest(APITestCase):
+    def setUp(self):
+        owner_index.clear()
+        self.me = create_owner('me', 32.1848, 34.8710, age=30)
+        self.near = create_owner('near', 32.1900, 34.8800, age=31)
+        self.other = create_owner('other', 32.1624, 34.8447, age=50)
+        self.rex = Dog.objects.create(owner=self.me, name='Rex', breed='Beagle', age=3)
+        call_command('rebuild_matches', stdout=StringIO())
+
+    def stored(self, owner):
+        return [match.user.username for match in stored_matches(owner)]
+
+    def test_full_rebuild(self):
+        """Test that a rebuild stores every owner's matches and empties the queue."""
+        self.assertFalse(MatchRefresh.objects.exists())
+        self.assertEqual(MatchCandidate.objects.count(), 6)
+        self.assertEqual(self.stored(self.me), ['near', 'other'])
+
+    def test_reads_are_one_lookup(self):
+        """Test that stored matches cost one read, queued or not."""
+        Dog.objects.create(owner=self.other, name='Bo', breed='Beagle', age=3)
+        with self.assertNumQueries(1):
+            matches = stored_matches(self.me, limit=1)
+        self.assertEqual(matches[0].user.username, 'near')
+        self.assertGreater(matches[0].score_breakdown['distance'], 0.9)
+        self.assertTrue(MatchRefresh.objects.filter(owner_id=self.me.id).exists())
+
+    def test_reads_compute_new_owners(self):
+        """Test that a queued owner with nothing stored yet is computed on read, once."""
+        newcomer = create_owner('newcomer', 32.1850, 34.8712, age=30)
+        self.assertEqual(self.stored(newcomer), ['me', 'near', 'other'])
+        self.assertFalse(MatchRefresh.objects.filter(owner_id=newcomer.id).exists())
+
+    def test_availability_queues_owners_sharing_time(self):
+        """Test that an availability only queues the owners with time at that place."""
+        start = timezone.now() + timedelta(hours=1)
+        OwnerAvailability.objects.create(
+            owner=self.me, dog=self.rex, place_id=7, start_time=start, end_time=start + timedelta(hours=2))
+        refresh_pending()
+        bo = Dog.objects.create(owner=self.other, name='Bo', breed='Poodle', age=9)
+        refresh_pending()
+
+        slot = OwnerAvailability.objects.create(
+            owner=self.other, dog=bo, place_id=7, start_time=start, end_time=start + timedelta(hours=1))
+        queued = set(MatchRefresh.objects.values_list('owner_id', flat=True))
+        self.assertEqual(queued, {self.me.id, self.other.id})
+
+        refresh_pending()
+        slot.place_id = 8  # the owners that shared time are queued again
+        slot.save()
+        queued = set(MatchRefresh.objects.values_list('owner_id', flat=True))
+        self.assertEqual(queued, {self.me.id, self.other.id})
+
+    def test_changes_queue_affected_owners(self):
+        """Test that a change queues the owner and those around them, and only them."""
+        create_owner('faraway', 31.7683, 35.2137)
+        refresh_pending()
+        Dog.objects.create(owner=self.other, name='Bo', breed='Beagle', age=3)
+        queued = set(MatchRefresh.objects.values_list('owner_id', flat=True))
+        self.assertEqual(queued, {self.me.id, self.near.id, self.other.id})
+
+        refresh_pending()
+        self.assertEqual(self.stored(self.me), ['other', 'near'])
+        self.assertFalse(MatchRefresh.objects.exists())
+
+    def test_moved_and_deleted_owners(self):
+        """Test that owners moving away or deleted leave the stored matches once refreshed."""
+        self.near.latitude, self.near.longitude = 31.7683, 35.2137
+        with self.captureOnCommitCallbacks(execute=True):
+            self.near.save()
+        call_command('rebuild_matches', '--pending', stdout=StringIO())
+        self.assertEqual(self.stored(self.me), ['other'])
+        self.assertEqual(self.stored(self.near), [])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.other.user.delete()
+        self.assertTrue(MatchRefresh.objects.filter(owner_id=self.me.id).exists())
+        refresh_pending()
+        self.assertEqual(self.stored(self.me), [])
+
+
+class GatedProvider:
+    """Completion provider that writes two chunks once the test lets it"""
+    name = 'gated'
+    calls = 0
+    gate = threading.Event()
+
+    def stream(self, prompt, matches):
+        GatedProvider.calls += 1
+        yield 'Meet '
+        self.gate.wait(5)
+        yield matches[0].user.first_name
+
+
+class FailingProvider:
+    name = 'failing'
+
+    def stream(self, prompt, matches):
+        raise RuntimeError('provider down')
+        yield
+
+
+@override_settings(SUGGESTION_PROVIDER='local')
+class SuggestionTest(APITestCase):
+    def setUp(self):
+        owner_index.clear()
+        suggestion_cache.clear()
+        self.url = reverse('owner:ai-based-match')
+        self.me = create_owner('me', 32.1848, 34.8710)
+        self.twin = create_owner('twin', 32.1900, 34.8800)
+        self.client.force_authenticate(self.me.user)
+
+    def events(self, response):
+        body = b''.join(response.streaming_content).decode()
+        events = []
+        for block in body.strip().split('\n\n'):
+            name, data = block.split('\n')
+            events.append((name[len('event: '):], json.loads(data[len('data: '):])))
+        return events
+
+    def test_answers_are_cached(self):
+        """Test that the same profile and candidates reuse the finished suggestion."""
+        first = self.client.post(self.url).data
+        second = self.client.post(self.url).data
+        self.assertFalse(first['cached'])
+        self.assertTrue(second['cached'])
+        self.assertEqual(first['suggestion'], second['suggestion'])
+
+        self.me.about_me = 'Cat person, actually.'
+        self.me.save()
+        self.assertFalse(self.client.post(self.url).data['cached'])
+
+    def test_streamed_events(self):
+        """Test that ?stream=1 sends the matches, the text in pieces, then done."""
+        response = self.client.post(f'{self.url}?stream=1')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        events = self.events(response)
+        self.assertEqual(events[0][0], 'matches')
+        self.assertEqual(events[0][1][0]['first_name'], 'Twin')
+        tokens = [data['text'] for name, data in events if name == 'token']
+        self.assertGreater(len(tokens), 1)
+        self.assertTrue(''.join(tokens).startswith('Twin Test is your best match'))
+        self.assertEqual(events[-1], ('done', {'source': 'local', 'cached': False}))
+
+    @override_settings(SUGGESTION_PROVIDER='owner.tests.GatedProvider')
+    def test_concurrent_requests_share_one_completion(self):
+        """Test that identical requests in flight read the same completion."""
+        GatedProvider.calls = 0
+        GatedProvider.gate.clear()
+        matches = stored_matches(self.me)
+        profiles = serializers.OwnerMatchSerializer(matches, many=True).data
+        first = suggest(self.me, matches, profiles)
+        second = suggest(self.me, matches, profiles)
+        self.assertIs(first, second)
+        self.assertEqual(next(iter(first)), 'Meet ')  # readable before it is done
+        GatedProvider.gate.set()
+        self.assertEqual(''.join(second), 'Meet Twin')
+        self.assertEqual(suggest(self.me, matches, profiles).text, 'Meet Twin')
+        self.assertEqual(GatedProvider.calls, 1)
+
+    @override_settings(SUGGESTION_PROVIDER='owner.tests.FailingProvider')
+    def test_provider_failure_falls_back(self):
+        """Test that a failing provider is replaced by the local explanation, uncached."""
+        for _ in range(2):
+            with self.assertLogs('owner.suggestions', 'WARNING'):
+                data = self.client.post(self.url).data
+            self.assertEqual(data['source'], 'local')
+            self.assertFalse(data['cached'])
+            self.assertTrue(data['suggestion'].startswith('Twin Test'))
+
+
 '''
 login
 http://localhost:8000/api/login/
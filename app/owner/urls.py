@@ -8,7 +8,9 @@ router = DefaultRouter()
 
 router.register('owners', views.OwnerViewSet, basename='owners')
 router.register('owner-availability', views.OwnerAvailabilityViewSet, basename='owner-availability')
+router.register('availability-history', views.AvailabilityHistoryViewSet, basename='availability-history')
 router.register('nearby-owners', views.NearbyOwnersViewSet, basename='nearby-owners')
+router.register('owner-matches', views.OwnerMatchesViewSet, basename='owner-matches')
 router.register('dogs', views.DogViewSet, basename='dogs')
 router.register('dogs/my', views.MyDogsViewSet, basename='my-dogs')
 
@@ -17,6 +19,10 @@ urlpatterns = [
     path('login/', views.UserLoginApiView.as_view(), name='login'),
     path('auth/me/', views.UserMeView.as_view(), name='me'),
     path('register/', views.UserRegisterApiView.as_view(), name='register'),
-    path('ai-based-match/', views.AIBaseSuggestionView.as_view()),
+    path('ai-based-match/', views.AIBaseSuggestionView.as_view(), name='ai-based-match'),
+    path('meetups/', views.MeetupsView.as_view(), name='meetups'),
+    path('map/', views.MapView.as_view(), name='map'),
+    path('map/clusters/', views.MapClustersView.as_view(), name='map-clusters'),
+    path('place-cache/stats/', views.PlaceCacheStatsView.as_view(), name='place-cache-stats'),
     path('', include(router.urls)),
 ]
\ No newline at end of file
@@ -1,22 +1,42 @@
+import time
+
 from django.conf import settings
-from django.db.models import F
+from django.db.models import Count, F, Sum
 from django.db.models.functions import Abs
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 from django_filters.rest_framework import DjangoFilterBackend
-from math import radians, cos, sin, asin, sqrt
-# import openai # type: ignore
-from owner.models import Owner, OwnerAvailability, Dog
+from core.conditional import ConditionalGetMixin
+from core.geo import (
+    cells_within_radius, haversine_distances, parse_bbox, parse_zoom, rank_by_distance,
+)
+from core.sync import DeltaSyncMixin
+from owner.models import Owner, OwnerAvailability, OwnerAvailabilityArchive, Dog
 from rest_framework import status
-from rest_framework.authentication import TokenAuthentication
+from rest_framework.decorators import action
 from rest_framework.authtoken.models import Token
 from rest_framework.authtoken.views import ObtainAuthToken
+from rest_framework.exceptions import ValidationError
 from rest_framework.filters import OrderingFilter
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.settings import api_settings
 from rest_framework.views import APIView
-from rest_framework.viewsets import ReadOnlyModelViewSet, ModelViewSet
+from rest_framework.viewsets import ReadOnlyModelViewSet, ModelViewSet, ViewSet
 from . import serializers
-from .utils import get_current_location
+from .authentication import CachedTokenAuthentication, request_owner
+from .events import format_event, publish_availabilities
+from .geoip import get_current_location
+from .match_store import availability_affected_owners, queue_refresh, stored_matches
+from .filters import OwnerAvailabilityFilter, overlapping
+from .meetups import sweep_join
+from .places import (
+    PlaceServiceUnavailable, get_backend, get_clusters, get_place_names, get_places_in_bbox,
+    local_backend, place_cache,
+)
+from .spatial_index import owner_index
+from .suggestions import suggest
 
 
 # input username, password, output - AuthToken
@@ -31,23 +51,26 @@ class UserLoginApiView(ObtainAuthToken):
 
         if token:
             user = Token.objects.get(key=token).user
-            self.update_user_location(user)  # Call the location update function
+            self.update_user_location(request, user)  # Call the location update function
 
         return response
 
-    def update_user_location(self, user):
-        """Update user's location when they log in"""
-        
-        location = get_current_location()
-        if location:
-            owner, _ = Owner.objects.get_or_create(user=user)
-            owner.latitude = location["latitude"]
-            owner.longitude = location["longitude"]
-            owner.save()
+    def update_user_location(self, request, user):
+        """Move the user's owner to where they log in from, if it is known and changed"""
+        location = get_current_location(request)
+        if not location:
+            return
+        owner = Owner.objects.filter(user=user).first()
+        if owner is None:
+            return
+        owner.latitude = location["latitude"]
+        owner.longitude = location["longitude"]
+        if owner.location_changed:
+            owner.save(update_fields=['latitude', 'longitude'])
 
 
 class UserMeView(APIView):
-    authentication_classes = (TokenAuthentication,)  # Use Token-based authentication
+    authentication_classes = (CachedTokenAuthentication,)  # Use Token-based authentication
     permission_classes = [IsAuthenticated]
 
     def get(self, request):
@@ -72,44 +95,103 @@ class UserRegisterApiView(APIView):
         )
 
 
-class OwnerViewSet(ReadOnlyModelViewSet):
+class OwnerViewSet(ConditionalGetMixin, DeltaSyncMixin, ReadOnlyModelViewSet):
     """
     ViewSet for viewing profiles along with user information.
     """
+    etag_tables = ('owner.owner', 'auth.user')
     queryset = Owner.objects.select_related('user').all()
     serializer_class = serializers.BaseOwnerSerializer
     
 
-class OwnerAvailabilityViewSet(ModelViewSet):
+class OwnerAvailabilityViewSet(ConditionalGetMixin, DeltaSyncMixin, ModelViewSet):
     """
     ViewSet for viewing and managing owner availability.
     """
-    queryset = OwnerAvailability.objects.all()
+    etag_tables = ('owner.owneravailability', 'owner.owner', 'auth.user', 'owner.dog')
+    queryset = OwnerAvailability.objects.select_related('owner__user', 'dog')
     serializer_class = serializers.OwnerAvailabilitySerializer
     filter_backends = [DjangoFilterBackend]
-    filterset_fields = ['owner', 'place_id', 'dog', 'start_time', 'end_time']
+    filterset_class = OwnerAvailabilityFilter
+
+    def get_etag_tables(self):
+        # Place names: the place app's counter when it runs in this project
+        if get_backend() is local_backend:
+            return self.etag_tables + ('place',)
+        return self.etag_tables
+
+    def get_etag_extra(self):
+        # Remote place names are cached for PLACE_CACHE_TTL, renames show up
+        # once it expires: the ETag moves with the TTL windows
+        if get_backend() is local_backend:
+            return ()
+        return (f"places:{int(time.time() // settings.PLACE_CACHE_TTL)}",)
+
+    @action(detail=False, methods=['post'])
+    def bulk(self, request):
+        """Create many slots, or a recurring schedule, in one transaction"""
+        serializer = serializers.OwnerAvailabilityBulkSerializer(
+            data=request.data, context=self.get_serializer_context())
+        serializer.is_valid(raise_exception=True)
+        availabilities = serializer.save()
+        publish_availabilities('created', availabilities)  # bulk_create sends no post_save
+        queue_refresh(availability_affected_owners(availabilities))
+        data = self.get_serializer(availabilities, many=True).data
+        return Response(data, status=status.HTTP_201_CREATED)
+
+
+class AvailabilityHistoryViewSet(ReadOnlyModelViewSet):
+    """
+    Past availabilities moved to the archive by the archive_availabilities
+    command, for history and stats. Recent past slots are still in the live
+    owner-availability list until they are archived.
+    """
+    queryset = OwnerAvailabilityArchive.objects.select_related('owner__user', 'dog')
+    serializer_class = serializers.AvailabilityHistorySerializer
+    filter_backends = [DjangoFilterBackend]
+    filterset_fields = ['owner', 'dog', 'place_id']
+
+    @action(detail=False)
+    def stats(self, request):
+        """Slots, distinct owners and hours spent per place"""
+        rows = (
+            self.filter_queryset(OwnerAvailabilityArchive.objects.all())
+            .values('place_id')
+            .annotate(
+                slots=Count('id'),
+                owners=Count('owner', distinct=True),
+                duration=Sum(F('end_time') - F('start_time')),
+            )
+            .order_by('-slots', 'place_id')
+        )
+        return Response([
+            {
+                'place_id': row['place_id'],
+                'slots': row['slots'],
+                'owners': row['owners'],
+                'hours': round(row['duration'].total_seconds() / 3600, 2),
+            }
+            for row in rows
+        ])
+
+
+class PlaceCacheStatsView(APIView):
+    """Hit/miss counters of this worker's place lookup cache"""
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return Response(place_cache.stats())
 
 
 class NearbyOwnersViewSet(ReadOnlyModelViewSet):
     """
     ViewSet for viewing profiles near the current profile.
     """
-    authentication_classes = (TokenAuthentication,)  # Use Token-based authentication
+    authentication_classes = (CachedTokenAuthentication,)  # Use Token-based authentication
     permission_classes = [IsAuthenticated]
 
-    @staticmethod
-    def haversine_distance(lat1, lon1, lat2, lon2):
-        R = 6371  # Earth radius in km
-        lat1, lon1, lat2, lon2 = map(radians, [lat1, lon1, lat2, lon2])
-        dlat = lat2 - lat1
-        dlon = lon2 - lon1
-        a = sin(dlat/2)**2 + cos(lat1) * cos(lat2) * sin(dlon/2)**2
-        c = 2 * asin(sqrt(a))
-        return R * c
-
     def get_queryset(self):
-        user = self.request.user
-        user_owner = Owner.objects.get(user=user)
+        user_owner = request_owner(self.request)
 
         if not user_owner or user_owner.latitude is None or user_owner.longitude is None:
             return Owner.objects.none()  # No location data
@@ -118,103 +200,311 @@ class NearbyOwnersViewSet(ReadOnlyModelViewSet):
 
         # Get radius from query params (default is 10 km)
         radius_km = float(self.request.query_params.get("radius", 10))
+        k = self.get_k()
 
+        if settings.OWNER_SPATIAL_INDEX:
+            ids, distances = owner_index.nearby(
+                user_lat, user_lon, radius_km, k=k, exclude=user_owner.id)
+        else:
+            ids, distances = self.nearby_from_db(user_owner, radius_km, k)
+
+        # Hydrate only the owners that made the cut, in distance order
+        owners = Owner.objects.select_related('user').in_bulk(ids)
         nearby_owners = []
-        for owner in Owner.objects.exclude(user=user):
-            if owner.latitude is not None and owner.longitude is not None:
-                distance = NearbyOwnersViewSet.haversine_distance(
-                    user_lat, user_lon, owner.latitude, owner.longitude)
-                if distance <= radius_km:
-                    nearby_owners.append(owner)
-        
+        for owner_id, distance in zip(ids, distances):
+            if owner_id in owners:
+                owner = owners[owner_id]
+                owner.distance_km = distance
+                nearby_owners.append(owner)
+
         return nearby_owners
 
+    @staticmethod
+    def nearby_from_db(user_owner, radius_km, k):
+        """Nearest owners straight from the database, using the grid index"""
+        user_lat, user_lon = user_owner.latitude, user_owner.longitude
+
+        # Only owners in grid cells overlapping the search circle are candidates
+        candidates = Owner.objects.exclude(pk=user_owner.pk).filter(
+            latitude__isnull=False, longitude__isnull=False)
+        cells = cells_within_radius(user_lat, user_lon, radius_km)
+        if cells is not None:
+            candidates = candidates.filter(geo_cell__in=cells)
+
+        rows = list(candidates.values_list('id', 'latitude', 'longitude'))
+        if not rows:
+            return [], []
+
+        # Distances for the whole candidate batch in one array operation
+        ids, lats, lons = zip(*rows)
+        distances = haversine_distances(user_lat, user_lon, lats, lons)
+        nearest = rank_by_distance(distances, radius_km=radius_km, k=k)
+        return [ids[i] for i in nearest], distances[nearest].tolist()
+
+    def get_k(self):
+        """Number of nearest owners requested with ?k=, or None for all"""
+        k = self.request.query_params.get("k")
+        if k is None:
+            return None
+        try:
+            k = int(k)
+        except ValueError:
+            k = 0
+        if k < 1:
+            raise ValidationError({"k": "Must be a positive integer."})
+        return k
+
     def list(self, request):
         nearby_profiles = self.get_queryset()
-        serializer = serializers.BaseOwnerSerializer(nearby_profiles, many=True)
+        serializer = serializers.NearbyOwnerSerializer(nearby_profiles, many=True)
         return Response(serializer.data)
     
 
+class MeetupsView(APIView):
+    """
+    Other owners whose availability overlaps the current owner's upcoming
+    availability at the same place, with the overlap duration.
+    """
+    authentication_classes = (CachedTokenAuthentication,)  # Use Token-based authentication
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        owner = request_owner(request)
+        if not owner:
+            return Response({"error": "Owner not found"}, status=404)
+
+        my_slots = list(
+            OwnerAvailability.objects.filter(owner=owner, end_time__gt=timezone.now())
+            .select_related('dog')
+        )
+        if not my_slots:
+            return Response([])
+
+        # Candidates: other owners' slots at my places within my overall time span
+        other_slots = overlapping(
+            OwnerAvailability.objects.filter(place_id__in={slot.place_id for slot in my_slots}),
+            min(slot.start_time for slot in my_slots),
+            max(slot.end_time for slot in my_slots),
+        ).exclude(owner=owner).select_related('owner__user', 'dog')
+
+        pairs = sweep_join(my_slots, other_slots)
+        place_names = get_place_names(mine.place_id for mine, _, _, _ in pairs)
+        return Response([
+            {
+                "owner_username": other.owner.user.username,
+                "first_name": other.owner.user.first_name,
+                "dog": other.dog.name,
+                "my_dog": mine.dog.name,
+                "place_id": mine.place_id,
+                "place_name": place_names.get(mine.place_id, 'Unknown'),
+                "start_time": start,
+                "end_time": end,
+                "overlap_minutes": int((end - start).total_seconds() // 60),
+            }
+            for mine, other, start, end in pairs
+        ])
+
+
+class MapView(APIView):
+    """
+    Places inside a viewport with their current and upcoming availabilities,
+    dogs already joined. Costs a fixed number of queries: one for the places
+    and one for their availabilities.
+
+    ?bbox=min_lon,min_lat,max_lon,max_lat (required), ?start= and ?end=
+    (ISO 8601) bound the time window, by default now to MAP_DEFAULT_WINDOW.
+    """
+
+    def get(self, request):
+        bbox = self.get_bbox()
+        start, end = self.get_window()
+
+        try:
+            places = get_places_in_bbox(bbox)
+        except PlaceServiceUnavailable as e:
+            raise serializers.PlaceServiceDown(str(e))
+
+        availabilities = overlapping(
+            OwnerAvailability.objects.filter(place_id__in=[place['id'] for place in places]),
+            start, end,
+        ).select_related('owner__user', 'dog').order_by('start_time')
+
+        by_place = {}
+        for availability in availabilities:
+            by_place.setdefault(availability.place_id, []).append(availability)
+
+        context = {'request': request}
+        return Response([
+            {
+                **place,
+                'availabilities': serializers.MapAvailabilitySerializer(
+                    by_place.get(place['id'], []), many=True, context=context).data,
+            }
+            for place in places
+        ])
+
+    def get_bbox(self):
+        try:
+            return parse_bbox(self.request.query_params.get('bbox'))
+        except ValueError as e:
+            raise ValidationError({'bbox': str(e)})
+
+    def get_window(self):
+        params = self.request.query_params
+        start = timezone.now()
+        end = start + settings.MAP_DEFAULT_WINDOW
+        for name, default in (('start', start), ('end', end)):
+            if name in params:
+                value = parse_datetime(params[name])
+                if value is None:
+                    raise ValidationError({name: 'Must be an ISO 8601 timestamp.'})
+                if timezone.is_naive(value):
+                    value = timezone.make_aware(value)
+                if name == 'start':
+                    start = value
+                else:
+                    end = value
+        if end <= start:
+            raise ValidationError({'end': 'End must be after start.'})
+        return start, end
+
+
+class MapClustersView(MapView):
+    """
+    Pre-aggregated map markers for ?bbox= at ?zoom=: grid clusters with a
+    place count, centroid and number of availabilities in the time window
+    (same ?start=/?end= as the map), or single places at high zoom.
+    """
+
+    def get(self, request):
+        bbox = self.get_bbox()
+        start, end = self.get_window()
+        try:
+            zoom = parse_zoom(request.query_params.get('zoom'))
+        except ValueError as e:
+            raise ValidationError({'zoom': str(e)})
+
+        try:
+            clusters = get_clusters(bbox, zoom)
+        except PlaceServiceUnavailable as e:
+            raise serializers.PlaceServiceDown(str(e))
+
+        place_ids = [place_id for cluster in clusters for place_id in cluster['place_ids']]
+        active = dict(
+            overlapping(OwnerAvailability.objects.filter(place_id__in=place_ids), start, end)
+            .order_by().values_list('place_id').annotate(Count('id'))
+        )
+        for cluster in clusters:
+            cluster['active_count'] = sum(
+                active.get(place_id, 0) for place_id in cluster.pop('place_ids'))
+        return Response(clusters)
+
+
+class OwnerMatchesViewSet(ViewSet):
+    """
+    The owners best matched with the current one, scored by owner.matching
+    and read from the MatchCandidate table. ?limit= caps the number
+    returned (MATCH_TOP_N by default).
+    """
+    authentication_classes = (CachedTokenAuthentication,)  # Use Token-based authentication
+    permission_classes = [IsAuthenticated]
+
+    def list(self, request):
+        owner = request_owner(request)
+        if not owner:
+            return Response({"error": "Owner not found"}, status=404)
+        matches = stored_matches(owner, get_match_limit(request))
+        return Response(serializers.OwnerMatchSerializer(matches, many=True).data)
+
+
+def get_match_limit(request):
+    """?limit= as a positive int up to MATCH_STORED_K, or None for the default"""
+    limit = request.query_params.get("limit")
+    if limit is None:
+        return None
+    try:
+        limit = int(limit)
+    except ValueError:
+        limit = 0
+    if not 1 <= limit <= settings.MATCH_STORED_K:
+        raise ValidationError({"limit": f"Must be between 1 and {settings.MATCH_STORED_K}."})
+    return limit
+
+
 class AIBaseSuggestionView(APIView):
     """
     View for AI-based suggestions for profile matches.
+
+    The matches come from the local scoring engine and a completion
+    provider (see owner.suggestions) only writes the suggestion for that
+    short list. With ?stream=1 the answer is sent as Server-Sent Events: a
+    "matches" event, "token" events as the text is written, then "done".
     """
-    authentication_classes = (TokenAuthentication,)  # Use Token-based authentication
+    authentication_classes = (CachedTokenAuthentication,)  # Use Token-based authentication
     permission_classes = [IsAuthenticated]
 
     def post(self, request):
-        user_owner = Owner.objects.filter(user=request.user).first()
+        user_owner = request_owner(request)
 
         if not user_owner:
             return Response({"error": "Owner not found"}, status=404)
 
-        # Reuse the match logic from ProfileMatchesViewSet
-        #viewset = OwnerMatchesViewSet()
-        viewset = "todo"
-        viewset.request = request
-        matches = viewset.get_queryset()
-
-        if not matches.exists():
+        matches = stored_matches(user_owner, get_match_limit(request))
+        if not matches:
             return Response({"message": "No suitable matches found."}, status=200)
 
-        serializer = serializers.BaseOwnerSerializer(matches, many=True)
-        profiles_data = serializer.data
-        
-        match_strings = "".join([
-            f"- Name: {match['first_name']} {match['last_name']}, Age: {match['age']}, "
-            f"Gender: {match['gender']}, City: {match['city']}\n"
-            f"  About: {match['about_me']}\n"
-            for match in profiles_data
-            ])
-
-        # Prepare AI prompt
-        prompt = (
-            f"You are an AI matchmaker helping users find a compatible match.\n"
-            f"The user profile is:\n"
-            f"Name: {user_owner.user.first_name} {user_owner.user.last_name},\n"
-            f"Age: {user_owner.age}, Gender: {user_owner.gender}, "
-            f"City: {user_owner.city}\n"
-            f"About: {user_owner.about_me}\n"
-            f"Here are potential matches:\n{match_strings}"
-            f"Based on age compatibility and shared interests, suggest the best match and explain why."
-        )
+        profiles_data = serializers.OwnerMatchSerializer(matches, many=True).data
+        completion = suggest(user_owner, matches, profiles_data)
+
+        if request.query_params.get("stream") in ("1", "true"):
+            response = StreamingHttpResponse(
+                self.stream_events(completion, profiles_data), content_type='text/event-stream')
+            response['Cache-Control'] = 'no-cache'
+            response['X-Accel-Buffering'] = 'no'  # Stream through the nginx proxy
+            return response
 
-        client = openai.OpenAI(api_key=settings.OPENAI_API_KEY)
         try:
-            response = client.chat.completions.create(
-                model="gpt-4o-mini",
-                messages=[
-                    {"role": "system", "content": "You are an expert relationship matchmaker."},
-                    {"role": "user", "content": prompt}
-                ]
-            )
-            suggestion = response.choices[0].message.content
+            suggestion = ''.join(completion)
         except Exception as e:
             return Response({"error": str(e)}, status=500)
+        return Response({
+            "suggestion": suggestion, "source": completion.source,
+            "cached": completion.cached, "matches": profiles_data,
+        })
 
-        return Response({"suggestion": suggestion})
+    @staticmethod
+    def stream_events(completion, profiles_data):
+        yield format_event('matches', profiles_data)
+        try:
+            for chunk in completion:
+                yield format_event('token', {"text": chunk})
+        except Exception as e:
+            yield format_event('error', {"error": str(e)})
+            return
+        yield format_event('done', {"source": completion.source, "cached": completion.cached})
 
 
-class DogViewSet(ModelViewSet):
+class DogViewSet(ConditionalGetMixin, DeltaSyncMixin, ModelViewSet):
     """
     ViewSet for viewing and managing Dog.
     """
+    etag_tables = ('owner.dog',)
     queryset = Dog.objects.all()
     serializer_class = serializers.DogSerializer
     filter_backends = [DjangoFilterBackend]
     filterset_fields = ['name']
 
 
-class MyDogsViewSet(ModelViewSet):
+class MyDogsViewSet(ConditionalGetMixin, DeltaSyncMixin, ModelViewSet):
     """
     ViewSet for viewing and managing Dog.
     """
-    authentication_classes = (TokenAuthentication,)  # Use Token-based authentication
+    etag_tables = ('owner.dog', 'owner.owner')
+    authentication_classes = (CachedTokenAuthentication,)  # Use Token-based authentication
     permission_classes = [IsAuthenticated]
 
     serializer_class = serializers.DogSerializer
 
     def get_queryset(self):
-        owner = Owner.objects.filter(user=self.request.user).first()
-        return Dog.objects.filter(owner=owner)
+        return Dog.objects.filter(owner=request_owner(self.request))
         
\ No newline at end of file
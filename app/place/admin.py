@@ -2,4 +2,4 @@ from django.contrib import admin
 from place import models
 
 admin.site.register(models.Place)
-
+admin.site.register(models.GeocodeCache)
@@ -0,0 +1,122 @@
+"""
+Zoom-aware clustering of places for the map.
+
+Places are bucketed into a lat/lon grid whose cell size halves with every
+zoom level. Each worker computes the grid for a zoom level once and keeps
+it until the "place" TableVersion stamp moves, i.e. until a place is
+created, changed or deleted.
+"""
+import threading
+import time
+
+import numpy as np
+from django.conf import settings
+
+from core.models import TableVersion
+
+VERSION_KEY = 'place'
+
+
+def cell_degrees(zoom):
+    """Grid cell size at a zoom level; a 256px map tile spans 360 / 2**zoom degrees"""
+    return 360 / (2 ** zoom * settings.PLACE_CLUSTER_CELLS_PER_TILE)
+
+
+def _in_bbox(lats, lons, bbox):
+    min_lon, min_lat, max_lon, max_lat = bbox
+    mask = (lats >= min_lat) & (lats <= max_lat)
+    if min_lon <= max_lon:
+        return mask & (lons >= min_lon) & (lons <= max_lon)
+    return mask & ((lons >= min_lon) | (lons <= max_lon))
+
+
+class PlaceClusterIndex:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._grids = {}  # zoom -> (keys, counts, lats, lons, members)
+        self._ids = np.empty(0, dtype=np.int64)
+        self._lats = self._lons = np.empty(0)
+        self._version = None
+        self._checked_at = 0.0
+
+    def clear(self):
+        with self._lock:
+            self._grids = {}
+            self._version = None
+
+    def _load(self):
+        from place.models import Place
+
+        self._version = TableVersion.current(VERSION_KEY)
+        rows = list(Place.objects.filter(
+            latitude__isnull=False, longitude__isnull=False,
+        ).values_list('id', 'latitude', 'longitude'))
+        data = np.array(rows, dtype=np.float64).reshape(-1, 3)
+        self._ids = data[:, 0].astype(np.int64)
+        self._lats = data[:, 1]
+        self._lons = data[:, 2]
+        self._grids = {}
+
+    def _ensure_current(self):
+        now = time.monotonic()
+        if self._version is not None and now - self._checked_at < settings.PLACE_CLUSTER_CHECK_INTERVAL:
+            return
+        if self._version is None or TableVersion.current(VERSION_KEY) != self._version:
+            self._load()
+        self._checked_at = now
+
+    def _grid(self, zoom):
+        if zoom not in self._grids:
+            size = cell_degrees(zoom)
+            cols = int(np.ceil(360 / size))
+            rows = np.floor((self._lats + 90) / size).astype(np.int64)
+            keys = rows * cols + np.floor((self._lons + 180) / size).astype(np.int64) % cols
+            keys, inverse, counts = np.unique(keys, return_inverse=True, return_counts=True)
+            lats = np.bincount(inverse, weights=self._lats, minlength=len(keys)) / np.maximum(counts, 1)
+            lons = np.bincount(inverse, weights=self._lons, minlength=len(keys)) / np.maximum(counts, 1)
+            order = np.argsort(inverse, kind='stable')
+            members = np.split(self._ids[order], np.cumsum(counts)[:-1]) if len(keys) else []
+            self._grids[zoom] = (keys, counts, lats, lons, members)
+        return self._grids[zoom]
+
+    def clusters(self, bbox, zoom):
+        """
+        Clusters whose centroid lies in the bbox, as dicts with the cell id,
+        centroid, place count and member place ids.
+        """
+        with self._lock:
+            self._ensure_current()
+            keys, counts, lats, lons, members = self._grid(zoom)
+        return [
+            {
+                'id': f"{zoom}:{keys[i]}",
+                'latitude': round(float(lats[i]), 6),
+                'longitude': round(float(lons[i]), 6),
+                'count': int(counts[i]),
+                'place_ids': members[i].tolist(),
+            }
+            for i in np.flatnonzero(_in_bbox(lats, lons, bbox))
+        ]
+
+
+cluster_index = PlaceClusterIndex()
+
+
+def clusters_in_bbox(bbox, zoom):
+    """
+    Map items for a viewport: grid clusters below PLACE_CLUSTER_MAX_ZOOM and
+    individual places from there on. Both carry a type, a centroid, a count
+    and the ids of the places they stand for.
+    """
+    if zoom < settings.PLACE_CLUSTER_MAX_ZOOM:
+        return [{'type': 'cluster', **cluster} for cluster in cluster_index.clusters(bbox, zoom)]
+
+    from place.models import Place
+    from place.serializers import PlaceSerializer
+
+    places = Place.objects.in_bbox(bbox)
+    return [
+        {'type': 'place', **place, 'count': 1, 'place_ids': [place['id']]}
+        for place in PlaceSerializer(places, many=True).data
+    ]
@@ -0,0 +1,23 @@
+import django_filters
+from rest_framework.exceptions import ValidationError
+from core.geo import parse_bbox
+from .models import Place
+
+
+class NumberInFilter(django_filters.BaseInFilter, django_filters.NumberFilter):
+    """Comma-separated list of numbers, e.g. ?ids=1,2,3"""
+
+
+class PlaceFilter(django_filters.FilterSet):
+    ids = NumberInFilter(field_name='id', lookup_expr='in')
+    bbox = django_filters.CharFilter(method='filter_bbox')
+
+    class Meta:
+        model = Place
+        fields = ['name', 'ids', 'bbox']
+
+    def filter_bbox(self, queryset, name, value):
+        try:
+            return queryset.in_bbox(parse_bbox(value))
+        except ValueError as e:
+            raise ValidationError({'bbox': str(e)})
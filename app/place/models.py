@@ -1,4 +1,18 @@
+from django.conf import settings
 from django.db import models
+from django.utils import timezone
+
+
+class PlaceQuerySet(models.QuerySet):
+
+    def in_bbox(self, bbox):
+        """Places inside a (min_lon, min_lat, max_lon, max_lat) box"""
+        min_lon, min_lat, max_lon, max_lat = bbox
+        queryset = self.filter(latitude__gte=min_lat, latitude__lte=max_lat)
+        if min_lon <= max_lon:
+            return queryset.filter(longitude__gte=min_lon, longitude__lte=max_lon)
+        # The box crosses the antimeridian
+        return queryset.filter(models.Q(longitude__gte=min_lon) | models.Q(longitude__lte=max_lon))
 
 
 class Place(models.Model):
@@ -6,6 +20,36 @@ class Place(models.Model):
     address = models.CharField(max_length=100)
     latitude = models.DecimalField(max_digits=9, decimal_places=6, null=True, blank=True)
     longitude = models.DecimalField(max_digits=9, decimal_places=6, null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    objects = PlaceQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['latitude', 'longitude'], name='place_location_idx'),
+        ]
 
     def __str__(self):
-        return self.name
\ No newline at end of file
+        return self.name
+
+
+class GeocodeCache(models.Model):
+    """
+    Geocoder answers by normalized query, so that names already looked up
+    do not cost another TomTom request. A null result records that the
+    geocoder found nothing.
+    """
+    query = models.CharField(max_length=255, unique=True)
+    result = models.JSONField(null=True, blank=True)
+    fetched_at = models.DateTimeField()
+
+    def __str__(self):
+        return self.query
+
+    @property
+    def is_fresh(self):
+        if self.result is None:
+            max_age = settings.GEOCODE_NEGATIVE_CACHE_MAX_AGE
+        else:
+            max_age = settings.GEOCODE_CACHE_MAX_AGE
+        return self.fetched_at > timezone.now() - max_age
@@ -0,0 +1,124 @@
+"""
+In-memory place name search for autocomplete.
+
+Every worker keeps the place names in a sorted token array for prefix
+matches, plus a trigram index for fuzzy matches when the user made a typo.
+Like place.clustering it is rebuilt when the "place" TableVersion moves.
+"""
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter, defaultdict
+
+from django.conf import settings
+
+from core.models import TableVersion
+from .clustering import VERSION_KEY
+
+
+def normalize(text):
+    return " ".join(text.split()).casefold()
+
+
+def trigrams(text):
+    """Trigrams of each word padded like pg_trgm: "dog" -> "  d", " do", "dog", "og " """
+    grams = set()
+    for word in text.split():
+        padded = f"  {word} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+class PlaceSearchIndex:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._places = []  # place dicts, as PlaceSerializer renders them
+        self._names = []  # normalized name per place
+        self._exact = {}  # normalized name -> place index
+        self._tokens = []  # sorted (token, place index, is the full name)
+        self._trigrams = {}  # trigram -> place indexes
+        self._trigram_counts = []
+        self._version = None
+        self._checked_at = 0.0
+
+    def clear(self):
+        with self._lock:
+            self._version = None
+
+    def _load(self):
+        from .models import Place
+        from .serializers import PlaceSerializer
+
+        self._version = TableVersion.current(VERSION_KEY)
+        self._places = list(PlaceSerializer(Place.objects.order_by('id'), many=True).data)
+        self._names = [normalize(place['name']) for place in self._places]
+        self._exact = {name: index for index, name in enumerate(self._names)}
+        tokens = []
+        postings = defaultdict(list)
+        self._trigram_counts = []
+        for index, name in enumerate(self._names):
+            tokens.append((name, index, True))
+            tokens.extend((word, index, False) for word in set(name.split()[1:]))
+            grams = trigrams(name)
+            for gram in grams:
+                postings[gram].append(index)
+            self._trigram_counts.append(len(grams))
+        self._tokens = sorted(tokens)
+        self._trigrams = dict(postings)
+
+    def _ensure_current(self):
+        now = time.monotonic()
+        if self._version is not None and now - self._checked_at < settings.PLACE_SEARCH_CHECK_INTERVAL:
+            return
+        if self._version is None or TableVersion.current(VERSION_KEY) != self._version:
+            self._load()
+        self._checked_at = now
+
+    def exact(self, name):
+        """The place whose name equals `name` up to case and whitespace"""
+        with self._lock:
+            self._ensure_current()
+            index = self._exact.get(normalize(name))
+            return None if index is None else self._places[index]
+
+    def search(self, query, limit=10):
+        """
+        Places ranked for `query`: names starting with it, then names with a
+        word starting with it, then names similar to it by trigram overlap
+        (at least PLACE_SEARCH_MIN_SIMILARITY). Each comes with its score.
+        """
+        query = normalize(query)
+        if not query:
+            return []
+        with self._lock:
+            self._ensure_current()
+            scores = {}
+
+            # Prefix matches: a range of the sorted token array
+            position = bisect_left(self._tokens, (query,))
+            while position < len(self._tokens) and self._tokens[position][0].startswith(query):
+                _, index, is_name = self._tokens[position]
+                scores[index] = max(scores.get(index, 0), 3.0 if is_name else 2.0)
+                position += 1
+
+            # Fuzzy matches: Jaccard similarity of the trigram sets
+            grams = trigrams(query)
+            shared = Counter()
+            for gram in grams:
+                shared.update(self._trigrams.get(gram, ()))
+            for index, common in shared.items():
+                similarity = common / (len(grams) + self._trigram_counts[index] - common)
+                if index in scores:
+                    scores[index] += similarity
+                elif similarity >= settings.PLACE_SEARCH_MIN_SIMILARITY:
+                    scores[index] = similarity
+
+            ranked = sorted(scores.items(), key=lambda item: (-item[1], len(self._names[item[0]]), item[0]))
+            return [
+                {**self._places[index], 'score': round(score, 3)}
+                for index, score in ranked[:limit]
+            ]
+
+
+search_index = PlaceSearchIndex()
@@ -0,0 +1,77 @@
+from django.utils import timezone
+
+from core.singleflight import SingleFlight, advisory_lock
+from .models import GeocodeCache, Place
+from .utils import GeocodingError, get_place_details_tomtom
+
+
+def normalize_query(place_name):
+    return " ".join(place_name.split()).casefold()
+
+
+def geocode(place_name):
+    """
+    TomTom's details for `place_name`, or None when it has no results.
+
+    Answers are kept in GeocodeCache under the normalized name and reused
+    while younger than GEOCODE_CACHE_MAX_AGE, or GEOCODE_NEGATIVE_CACHE_MAX_AGE
+    for "no results". A stale answer is still used when TomTom is unreachable;
+    without one, GeocodingError is raised.
+    """
+    query = normalize_query(place_name)
+    if not query:
+        return None
+    # Longer names are geocoded but not cached
+    cacheable = len(query) <= GeocodeCache._meta.get_field('query').max_length
+
+    entry = GeocodeCache.objects.filter(query=query).first() if cacheable else None
+    if entry is not None and entry.is_fresh:
+        return entry.result
+    try:
+        result = get_place_details_tomtom(place_name)
+    except GeocodingError:
+        if entry is None:
+            raise
+        return entry.result
+
+    if cacheable:
+        GeocodeCache.objects.update_or_create(
+            query=query, defaults={'result': result, 'fetched_at': timezone.now()})
+    return result
+
+
+place_creations = SingleFlight()
+
+
+def create_place(place_name):
+    """
+    Geocode `place_name` and store it, returning (place, created), or None
+    when TomTom does not know the place. Raises GeocodingError when TomTom
+    cannot be reached.
+
+    Concurrent requests for the same normalized name share one geocode call
+    and insert: within this worker through `place_creations`, across workers
+    through an advisory lock after which the geocode cache answers. The
+    unique place name settles any race left.
+    """
+    query = normalize_query(place_name)
+    result, shared = place_creations.do(query, lambda: _create_place(place_name, query))
+    if result and shared:
+        return result[0], False  # Created by the call this one waited for
+    return result
+
+
+def _create_place(place_name, query):
+    with advisory_lock(f"place:create:{query}"):
+        place_data = geocode(place_name)
+        if not place_data:
+            return None
+
+        return Place.objects.get_or_create(
+            name=place_data["name"],
+            defaults={
+                "address": place_data["address"],
+                "latitude": place_data["latitude"],
+                "longitude": place_data["longitude"]
+            }
+        )
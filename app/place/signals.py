@@ -0,0 +1,22 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from core.models import TableVersion, Tombstone
+from .clustering import VERSION_KEY, cluster_index
+from .models import Place
+from .search import search_index
+
+
+@receiver(post_save, sender=Place)
+@receiver(post_delete, sender=Place)
+def place_changed(sender, instance, **kwargs):
+    """Invalidate the cached clusters and search index in this and every other worker"""
+    TableVersion.bump(VERSION_KEY)
+    cluster_index.clear()
+    search_index.clear()
+
+
+@receiver(post_delete, sender=Place)
+def record_tombstone(sender, instance, **kwargs):
+    """Let delta-sync clients know the place is gone, see core.sync"""
+    Tombstone.record(instance)
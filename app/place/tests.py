@@ -1,10 +1,288 @@
-from django.test import TestCase
+from datetime import timedelta
+from django.conf import settings
+from django.urls import reverse
+from place.clustering import cluster_index
+from django.utils import timezone
+from place.models import GeocodeCache, Place
+from place.search import search_index
+from place.services import geocode, place_creations
+from place.utils import GeocodingError, get_place_details_tomtom
+from rest_framework.test import APITestCase
+from unittest.mock import patch
+
+
+class PlaceViewSetTest(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.places_url = reverse('place-list')
+        cls.places = [
+            Place.objects.create(name=name, address=f'{name}, Israel')
+            for name in ('Dog garden', 'Beach', 'Park')
+        ]
+
+    def test_filter_by_ids(self):
+        """Test that ?ids= returns exactly the requested places."""
+        ids = [self.places[0].id, self.places[2].id]
+        response = self.client.get(self.places_url, {'ids': ','.join(map(str, ids))})
+        self.assertEqual(response.status_code, 200)
+        self.assertSetEqual({place['id'] for place in response.data['results']}, set(ids))
+
+    def test_filter_by_bbox(self):
+        """Test that ?bbox= returns the places inside the box, across the antimeridian too."""
+        Place.objects.create(name='Fiji', address='Suva', latitude=-18.1, longitude=178.4)
+        Place.objects.create(name='Samoa', address='Apia', latitude=-13.8, longitude=-171.8)
+        Place.objects.create(name='Ra\'anana', address='Israel', latitude=32.18, longitude=34.87)
+        response = self.client.get(self.places_url, {'bbox': '170,-20,-170,-10'})
+        self.assertSetEqual({place['name'] for place in response.data['results']}, {'Fiji', 'Samoa'})
+        response = self.client.get(self.places_url, {'bbox': '34,31,35,33'})
+        self.assertEqual([place['name'] for place in response.data['results']], ['Ra\'anana'])
+        response = self.client.get(self.places_url, {'bbox': 'nowhere'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_filter_by_name(self):
+        """Test that the exact name lookup still works."""
+        response = self.client.get(self.places_url, {'name': 'Beach'})
+        self.assertEqual([place['name'] for place in response.data['results']], ['Beach'])
+
+    def test_cursor_pagination(self):
+        """Test that following the next cursor walks every place once, in id order."""
+        Place.objects.bulk_create(
+            Place(name=f'Garden {i}', address='Israel') for i in range(7))
+        seen = []
+        response = self.client.get(self.places_url, {'page_size': 4})
+        while True:
+            self.assertEqual(response.status_code, 200)
+            self.assertLessEqual(len(response.data['results']), 4)
+            seen.extend(place['id'] for place in response.data['results'])
+            if not response.data['next']:
+                break
+            response = self.client.get(response.data['next'])
+        self.assertEqual(seen, sorted(Place.objects.values_list('id', flat=True)))
+
+    def test_conditional_get(self):
+        """Test that unchanged places revalidate with 304 and a new place does not."""
+        etag = self.client.get(self.places_url)['ETag']
+        response = self.client.get(self.places_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        Place.objects.create(name='Forest', address='Israel')
+        response = self.client.get(self.places_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_delta_sync(self):
+        """Test that ?since= reports new and deleted places after the cursor."""
+        with self.settings(SYNC_CURSOR_OVERLAP=timedelta(0)):
+            cursor = self.client.get(self.places_url, {'since': '0'}).data['cursor']
+            forest = Place.objects.create(name='Forest', address='Israel')
+            beach_id = self.places[1].id
+            self.places[1].delete()
+            data = self.client.get(self.places_url, {'since': cursor}).data
+        self.assertEqual([place['id'] for place in data['results']], [forest.id])
+        self.assertEqual(data['deleted'], [beach_id])
+
+    @patch('core.pagination.KeysetPagination.max_page_size', 2)
+    def test_page_size_is_capped(self):
+        """Test that ?page_size= cannot exceed the configured maximum."""
+        response = self.client.get(self.places_url, {'page_size': 1000})
+        self.assertEqual(len(response.data['results']), 2)
+        self.assertIsNotNone(response.data['next'])
+
+
+
+class CreatePlaceViewTest(APITestCase):
+    create_url = '/api/place/create/'
+
+    @patch('place.services.get_place_details_tomtom')
+    def test_create_place(self, mock_geocode):
+        """Test that a geocoded place is stored once and then reused."""
+        mock_geocode.return_value = {
+            'name': 'Dog garden, Ra\'anana', 'address': 'Ahuza St, Ra\'anana',
+            'latitude': 32.1848, 'longitude': 34.871,
+        }
+        response = self.client.post(self.create_url, {'name': 'Dog garden'}, format='json')
+        self.assertEqual(response.status_code, 201)
+        response = self.client.post(self.create_url, {'name': 'Dog garden'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Place.objects.count(), 1)
+
+    def test_coalesced_request_did_not_create(self):
+        """Test that a request that waited for another one's insert gets a 200."""
+        place = Place.objects.create(name='Dog garden', address='Ra\'anana')
+        with patch.object(place_creations, 'do', return_value=((place, True), True)):
+            response = self.client.post(self.create_url, {'name': 'Dog garden'}, format='json')
+        self.assertEqual(response.status_code, 200)
+
+    @patch('place.services.get_place_details_tomtom', return_value=None)
+    def test_create_unknown_place(self, mock_geocode):
+        """Test that a place TomTom cannot find is a 404."""
+        response = self.client.post(self.create_url, {'name': 'Nowhere'}, format='json')
+        self.assertEqual(response.status_code, 404)
+
+    @patch('place.services.get_place_details_tomtom', side_effect=GeocodingError('timeout'))
+    def test_create_when_geocoder_down(self, mock_geocode):
+        """Test that an unreachable TomTom is a 503, not "not found"."""
+        response = self.client.post(self.create_url, {'name': 'Dog garden'}, format='json')
+        self.assertEqual(response.status_code, 503)
+        self.assertFalse(Place.objects.exists())
+
+
+
+@patch('place.services.get_place_details_tomtom')
+class GeocodeCacheTest(APITestCase):
+    garden = {
+        'name': 'Dog garden, Ra\'anana', 'address': 'Ahuza St, Ra\'anana',
+        'latitude': 32.1848, 'longitude': 34.871,
+    }
+
+    def age(self, **delta):
+        GeocodeCache.objects.update(fetched_at=timezone.now() - timedelta(**delta))
+
+    def test_normalized_names_share_an_entry(self, mock_geocode):
+        """Test that case and whitespace variants cost a single lookup."""
+        mock_geocode.return_value = self.garden
+        for name in ('Dog garden', '  dog   GARDEN ', 'Dog Garden'):
+            self.assertEqual(geocode(name), self.garden)
+        mock_geocode.assert_called_once()
+        self.assertEqual(GeocodeCache.objects.get().query, 'dog garden')
+
+    def test_refresh_after_max_age(self, mock_geocode):
+        """Test that entries older than GEOCODE_CACHE_MAX_AGE are fetched again."""
+        mock_geocode.return_value = self.garden
+        geocode('Dog garden')
+        self.age(days=settings.GEOCODE_CACHE_MAX_AGE.days + 1)
+        geocode('Dog garden')
+        self.assertEqual(mock_geocode.call_count, 2)
+
+    def test_negative_cache(self, mock_geocode):
+        """Test that "no results" is remembered for the shorter negative age."""
+        mock_geocode.return_value = None
+        self.assertIsNone(geocode('Nowhere'))
+        self.assertIsNone(geocode('nowhere'))
+        mock_geocode.assert_called_once()
+        self.age(hours=settings.GEOCODE_NEGATIVE_CACHE_MAX_AGE.total_seconds() // 3600 + 1)
+        mock_geocode.return_value = self.garden
+        self.assertEqual(geocode('Nowhere'), self.garden)
+
+    def test_stale_entry_when_geocoder_fails(self, mock_geocode):
+        """Test that an expired answer is used while TomTom is unreachable."""
+        mock_geocode.return_value = self.garden
+        geocode('Dog garden')
+        self.age(days=settings.GEOCODE_CACHE_MAX_AGE.days + 1)
+        mock_geocode.side_effect = GeocodingError('timeout')
+        self.assertEqual(geocode('Dog garden'), self.garden)
+        with self.assertRaises(GeocodingError):
+            geocode('Beach')
+        self.assertEqual(GeocodeCache.objects.count(), 1)  # failures are not cached
+
+    @patch('place.utils.requests.get')
+    def test_http_errors_are_not_no_results(self, mock_get, mock_geocode):
+        """Test that the TomTom client tells failures apart from empty answers."""
+        mock_get.return_value.status_code = 503
+        with self.assertRaises(GeocodingError):
+            get_place_details_tomtom('Dog garden')
+        mock_get.return_value.status_code = 200
+        mock_get.return_value.json.return_value = {'summary': {'numResults': 0}, 'results': []}
+        self.assertIsNone(get_place_details_tomtom('Dog garden'))
+
+
+class PlaceAutocompleteTest(APITestCase):
+    autocomplete_url = '/api/place/autocomplete/'
+
+    @classmethod
+    def setUpTestData(cls):
+        for name in ('Dog garden Ra\'anana', 'Yarkon Park', 'Park Hayarkon dog run',
+                     'Parkway', 'Gan Meir'):
+            Place.objects.create(name=name, address='Israel')
+
+    def setUp(self):
+        search_index.clear()
+
+    def suggest(self, q, **params):
+        response = self.client.get(self.autocomplete_url, {'q': q, **params})
+        self.assertEqual(response.status_code, 200)
+        return [place['name'] for place in response.data]
+
+    def test_prefix_ranking(self):
+        """Test that name prefixes rank above word prefixes, shorter names first."""
+        self.assertEqual(self.suggest('park'), ['Parkway', 'Park Hayarkon dog run', 'Yarkon Park'])
+
+    def test_typos(self):
+        """Test that misspelled queries still find the place."""
+        self.assertEqual(self.suggest('yarkn prk')[0], 'Yarkon Park')
+        self.assertEqual(self.suggest('gan  MEIR'), ['Gan Meir'])
+        self.assertEqual(self.suggest('zzzz'), [])
+
+    def test_limit(self):
+        """Test that ?limit= caps the suggestions and must be positive."""
+        self.assertEqual(len(self.suggest('park', limit=1)), 1)
+        response = self.client.get(self.autocomplete_url, {'q': 'park', 'limit': 0})
+        self.assertEqual(response.status_code, 400)
+
+    def test_new_places_are_searchable(self):
+        """Test that the index picks up places created after it was built."""
+        self.assertEqual(self.suggest('herz'), [])
+        Place.objects.create(name='Herzliya beach', address='Herzliya')
+        self.assertEqual(self.suggest('herz'), ['Herzliya beach'])
+
+    def test_exact_match(self):
+        """Test that names differing in case or spacing resolve to the same place."""
+        self.assertEqual(search_index.exact('  gan meir ')['name'], 'Gan Meir')
+        self.assertIsNone(search_index.exact('Gan'))
+
+
+class PlaceClustersViewTest(APITestCase):
+    clusters_url = '/api/place/clusters/'
+    bbox = '34.0,31.0,36.0,34.0'
+
+    @classmethod
+    def setUpTestData(cls):
+        # Three places in Ra'anana and one in Haifa
+        for name, lat, lon in [('Garden', 32.1848, 34.871), ('Park', 32.1901, 34.8802),
+                               ('Square', 32.1789, 34.8655), ('Haifa', 32.794, 34.9896)]:
+            Place.objects.create(name=name, address=name, latitude=lat, longitude=lon)
+
+    def setUp(self):
+        cluster_index.clear()
+
+    def get(self, zoom, bbox=None):
+        response = self.client.get(self.clusters_url, {'bbox': bbox or self.bbox, 'zoom': zoom})
+        self.assertEqual(response.status_code, 200)
+        return sorted(response.data, key=lambda item: -item['count'])
+
+    def test_low_zoom_clusters(self):
+        """Test that nearby places are merged into one cluster with a centroid."""
+        clusters = self.get(8)
+        self.assertEqual([cluster['count'] for cluster in clusters], [3, 1])
+        self.assertEqual(clusters[0]['type'], 'cluster')
+        self.assertAlmostEqual(clusters[0]['latitude'], (32.1848 + 32.1901 + 32.1789) / 3, places=5)
+
+    def test_high_zoom_returns_places(self):
+        """Test that single places are returned from PLACE_CLUSTER_MAX_ZOOM on."""
+        items = self.get(settings.PLACE_CLUSTER_MAX_ZOOM, bbox='34.86,32.17,34.89,32.20')
+        self.assertEqual({item['type'] for item in items}, {'place'})
+        self.assertSetEqual({item['name'] for item in items}, {'Garden', 'Park', 'Square'})
+
+    def test_bbox_limits_clusters(self):
+        """Test that only clusters with their centroid in view are returned."""
+        self.assertEqual([cluster['count'] for cluster in self.get(8, '34.5,32.5,35.5,33.0')], [1])
+
+    @patch('place.services.get_place_details_tomtom')
+    def test_created_place_invalidates_clusters(self, mock_geocode):
+        """Test that a place created through CreatePlaceView shows up at once."""
+        self.assertEqual(sum(cluster['count'] for cluster in self.get(8)), 4)
+        mock_geocode.return_value = {
+            'name': 'Herzliya park', 'address': 'Herzliya', 'latitude': 32.1624, 'longitude': 34.8447}
+        self.client.post('/api/place/create/', {'name': 'Herzliya park'}, format='json')
+        self.assertEqual(sum(cluster['count'] for cluster in self.get(8)), 5)
+
+    def test_invalid_zoom(self):
+        """Test that a zoom level outside the web map range is rejected."""
+        response = self.client.get(self.clusters_url, {'bbox': self.bbox, 'zoom': 40})
+        self.assertEqual(response.status_code, 400)
 
-# Create your tests here.
 
 '''
 create place
 {
     "name": "Ayin Hillel Street 10 Ra'anana"
 }
-'''
\ No newline at end of file
+'''
@@ -8,5 +8,7 @@ router.register('places', views.PlaceViewSet)
 
 urlpatterns = [
     path('create/', views.CreatePlaceView.as_view()),
+    path('clusters/', views.PlaceClustersView.as_view(), name='place-clusters'),
+    path('autocomplete/', views.PlaceAutocompleteView.as_view(), name='place-autocomplete'),
     path('', include(router.urls)),
 ]
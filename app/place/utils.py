@@ -1,8 +1,16 @@
 import requests
 from django.conf import settings
 
+
+class GeocodingError(Exception):
+    """TomTom could not be asked, as opposed to having no results"""
+
+
 def get_place_details_tomtom(place_name):
-    """Fetch place details (address, lat, lng) from TOMTOM Maps API"""
+    """
+    Fetch place details (address, lat, lng) from TOMTOM Maps API, None when
+    it has no results. Raises GeocodingError when the request fails.
+    """
     url = "https://api.tomtom.com/search/2/geocode/" + requests.utils.quote(place_name) + ".json"
     params = {
         "key": settings.TOMTOM_MAPS_API_KEY,
@@ -12,9 +20,12 @@ def get_place_details_tomtom(place_name):
         "limit": 1
     }
     
-    resp = requests.get(url, params=params)
+    try:
+        resp = requests.get(url, params=params, timeout=settings.GEOCODE_TIMEOUT)
+    except requests.RequestException as e:
+        raise GeocodingError(str(e)) from e
     if resp.status_code != 200:
-        return None  # Handle error appropriately in production
+        raise GeocodingError(f'TomTom answered {resp.status_code}')
     data = resp.json()
     if data.get("summary", {}).get("numResults", 0) < 1:
         return None
@@ -1,21 +1,65 @@
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework import status
+from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from rest_framework.viewsets import ReadOnlyModelViewSet
+from core.conditional import ConditionalGetMixin
+from core.geo import parse_bbox, parse_zoom
+from core.sync import DeltaSyncMixin
 from . import serializers
+from .clustering import clusters_in_bbox
+from .filters import PlaceFilter
 from place.models import Place
-from .utils import get_place_details_tomtom
+from .search import search_index
+from .services import create_place
+from .utils import GeocodingError
 
 
-class PlaceViewSet(ReadOnlyModelViewSet):
+class PlaceViewSet(ConditionalGetMixin, DeltaSyncMixin, ReadOnlyModelViewSet):
     """
     ViewSet for viewing places along with their information.
     """
+    etag_tables = ('place',)
     queryset = Place.objects.all()
     serializer_class = serializers.PlaceSerializer
     filter_backends = [DjangoFilterBackend]
-    filterset_fields = ['name']
+    filterset_class = PlaceFilter
+
+
+class PlaceClustersView(APIView):
+    """
+    Places inside ?bbox=min_lon,min_lat,max_lon,max_lat aggregated for
+    ?zoom=, as grid clusters at low zoom and single places at high zoom.
+    """
+    def get(self, request):
+        try:
+            bbox = parse_bbox(request.query_params.get("bbox"))
+        except ValueError as e:
+            raise ValidationError({"bbox": str(e)})
+        try:
+            zoom = parse_zoom(request.query_params.get("zoom"))
+        except ValueError as e:
+            raise ValidationError({"zoom": str(e)})
+        return Response(clusters_in_bbox(bbox, zoom))
+
+
+class PlaceAutocompleteView(APIView):
+    """
+    Places matching what the user typed so far, ?q=, best first: name
+    prefixes, then word prefixes, then typo-tolerant trigram matches.
+    ?limit= caps the number of suggestions.
+    """
+    max_limit = 50
+
+    def get(self, request):
+        try:
+            limit = min(int(request.query_params.get("limit", 10)), self.max_limit)
+        except ValueError:
+            raise ValidationError({"limit": "Must be an integer."})
+        if limit < 1:
+            raise ValidationError({"limit": "Must be a positive integer."})
+        return Response(search_index.search(request.query_params.get("q", ""), limit))
 
 
 class CreatePlaceView(APIView):
@@ -23,18 +67,13 @@ class CreatePlaceView(APIView):
     def post(self, request):
         place_name = request.data.get("name")
         
-        place_data = get_place_details_tomtom(place_name)
-        if not place_data:
+        try:
+            result = create_place(place_name)
+        except GeocodingError:
+            return Response({"error": "Geocoding is unavailable"}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+        if not result:
             return Response({"error": "Place not found in tomtom"}, status=status.HTTP_404_NOT_FOUND)
-        
-        place, created = Place.objects.get_or_create(
-            name=place_data["name"],
-            defaults={
-                "address": place_data["address"],
-                "latitude": place_data["latitude"],
-                "longitude": place_data["longitude"]    
-            }
-        )
+        place, created = result
 
         serializer = serializers.PlaceSerializer(place)
         return Response(serializer.data, status=status.HTTP_201_CREATED if created else status.HTTP_200_OK)
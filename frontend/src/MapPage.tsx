@@ -56,91 +56,101 @@ export function DogMap() {
             }
         });
 
-        map.on("load", async () => {
-            console.log("Map loaded");
+        let markers: maplibregl.Marker[] = [];
+        // Bumped by every load, so an overlapping older one adds no markers
+        let generation = 0;
+
+        // Fetch the places in view, with their availabilities and dogs already joined
+        const loadViewport = async () => {
+            const bbox = map.getBounds().toArray().flat().join(",");
+            const load = ++generation;
 
             try {
-                const [placesRes, availabilitiesRes, dogsRes] = await Promise.all([
-                fetch("http://localhost:8000/api/place/places/"),
-                fetch("http://localhost:8000/api/owner/owner-availability/"),
-                fetch('http://localhost:8000/api/owner/dogs/')
-            ]);
-
-            const places = await placesRes.json(); // [{id, name, lat, lon...}]
-            const availabilities = await availabilitiesRes.json(); // [{place_id, dog, ...}]
-            const dogs = await dogsRes.json();
-
-            console.log("Places:", places);
-            console.log("Availabilities:", availabilities);
-            console.log("Dogs:", dogs);
-
-            // Create a map of dog name -> picture
-            const dogPhotoMap = Object.fromEntries(
-                dogs.map((dog: any) => [dog.name, dog.picture])
-            );
-            console.log("Dog photo map:", dogPhotoMap);
-
-            const merged = places
-            .filter((place: any) => place.latitude && place.longitude)
-            .map((place: any) => ({
-                ...place,
-                availabilities: availabilities.filter(
-                (a: any) => a.place_id == place.id
-                ),
-            }));
-            
-            console.log("Merged data:", merged);
-
-            merged.forEach((place: any) => {
-                place.availabilities.forEach((a: any) => {
-                    const el = document.createElement("div");
-                    el.style.width = "40px";
-                    el.style.height = "40px";
-                    el.style.borderRadius = "50%";
-                    el.style.overflow = "hidden";
-                    el.style.display = "flex";
-                    el.style.alignItems = "center";
-                    el.style.justifyContent = "center";
-                    el.style.background = "blue"; // debugging only
-
-                    const dogIcon = document.createElement("img");
-
-                    dogIcon.src = dogPhotoMap[a.dog];
-                    console.log("Dog icon URL:", dogIcon.src);
-                    
-                    dogIcon.style.width = "100%";
-                    dogIcon.style.height = "100%";
-                    dogIcon.style.borderRadius = "50%";
-                    dogIcon.style.objectFit = "cover";
-                    dogIcon.style.display = "block";
-                    
-                    // document.body.appendChild(dogIcon.cloneNode(true));
-
-                    const description = `From: ${new Date(a.start_time).toLocaleString()}<br>To: ${new Date(a.end_time).toLocaleString()}`;
-                    
-                    dogIcon.onload = () => {
-                        el.appendChild(dogIcon);
-                        
-                        new maplibregl.Marker(el)
-                            .setLngLat([parseFloat(place.longitude), parseFloat(place.latitude)])
-                            .setPopup(
-                                new maplibregl.Popup({ offset: 25 }).setHTML(
-                                `<strong>${a.dog}</strong><br>${description}<br>Owner: ${a.owner_username}<br>Place: ${a.place_name}`
+                const res = await fetch(`${import.meta.env.VITE_API_URL}owner/map/?bbox=${bbox}`);
+                if (!res.ok) throw new Error("Failed to load map data");
+                const places = await res.json(); // [{id, name, latitude, longitude, availabilities: [...]}]
+                if (load !== generation) return;
+
+                markers.forEach((marker) => marker.remove());
+                markers = [];
+
+                places
+                .filter((place: any) => place.latitude && place.longitude)
+                .forEach((place: any) => {
+                    place.availabilities.forEach((a: any) => {
+                        const el = document.createElement("div");
+                        el.style.width = "40px";
+                        el.style.height = "40px";
+                        el.style.borderRadius = "50%";
+                        el.style.overflow = "hidden";
+                        el.style.display = "flex";
+                        el.style.alignItems = "center";
+                        el.style.justifyContent = "center";
+                        el.style.background = "blue"; // debugging only
+
+                        const dogIcon = document.createElement("img");
+
+                        dogIcon.src = a.dog_picture;
+
+                        dogIcon.style.width = "100%";
+                        dogIcon.style.height = "100%";
+                        dogIcon.style.borderRadius = "50%";
+                        dogIcon.style.objectFit = "cover";
+                        dogIcon.style.display = "block";
+
+                        const description = `From: ${new Date(a.start_time).toLocaleString()}<br>To: ${new Date(a.end_time).toLocaleString()}`;
+
+                        dogIcon.onload = () => {
+                            if (load !== generation) return;
+                            el.appendChild(dogIcon);
+
+                            const marker = new maplibregl.Marker(el)
+                                .setLngLat([parseFloat(place.longitude), parseFloat(place.latitude)])
+                                .setPopup(
+                                    new maplibregl.Popup({ offset: 25 }).setHTML(
+                                    `<strong>${a.dog}</strong><br>${description}<br>Owner: ${a.owner_username}<br>Place: ${place.name}`
+                                    )
                                 )
-                            )
-                            .addTo(map);
-                    };
+                                .addTo(map);
+                            markers.push(marker);
+                        };
+                    });
                 });
-            });
             } catch (err) {
                 console.error("Failed to load place or availability data", err);
             }
+        };
+
+        // Refresh the viewport when availabilities in it change, instead of polling.
+        // The events come from the ASGI server (uvicorn), behind the API's nginx by default.
+        const eventsUrl = import.meta.env.VITE_EVENTS_URL || `${import.meta.env.VITE_API_URL}owner/events/`;
+        let events: EventSource | null = null;
+        const subscribeViewport = () => {
+            events?.close();
+            const bbox = map.getBounds().toArray().flat().join(",");
+            events = new EventSource(`${eventsUrl}?bbox=${bbox}`);
+            ["created", "updated", "deleted", "resync"].forEach((name) =>
+                events!.addEventListener(name, loadViewport)
+            );
+        };
+
+        map.on("load", () => {
+            console.log("Map loaded");
+            loadViewport();
+            subscribeViewport();
+        });
+        map.on("moveend", () => {
+            loadViewport();
+            subscribeViewport();
         });
 
         // Add navigation controls (zoom buttons)
         map.addControl(new maplibregl.NavigationControl(), 'top-right');
 
-            return () => map.remove();
+            return () => {
+                events?.close();
+                map.remove();
+            };
         }, []);
 
         return (
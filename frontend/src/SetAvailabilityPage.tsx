@@ -5,6 +5,7 @@ export function SetAvailabilityPage() {
   const [ownerUsername, setOwnerUsername] = useState('');
   const [selectedDogName, setSelectedDogName] = useState('');
   const [place, setPlace] = useState('');
+  const [placeSuggestions, setPlaceSuggestions] = useState<{ id: number; name: string }[]>([]);
   const [startTime, setStartTime] = useState('');
   const [endTime, setEndTime] = useState('');
 
@@ -26,13 +27,29 @@ export function SetAvailabilityPage() {
         headers: { Authorization: `Token ${token}` },
       });
       const data = await res.json();
-      setDogs(data); // expecting [{ name: "Pashosho" }, ...]
+      setDogs(data.results); // expecting {results: [{ name: "Pashosho" }, ...]}
     };
 
     fetchUser();
     fetchDogs();
   }, [token]);
 
+  // Suggest known places as the user types, so typos don't create new ones
+  useEffect(() => {
+    if (!place.trim()) {
+      setPlaceSuggestions([]);
+      return;
+    }
+    const controller = new AbortController();
+    fetch(`${import.meta.env.VITE_API_URL}place/autocomplete/?q=${encodeURIComponent(place)}`, {
+      signal: controller.signal,
+    })
+      .then((res) => res.json())
+      .then(setPlaceSuggestions)
+      .catch(() => {});
+    return () => controller.abort();
+  }, [place]);
+
   const handleSubmit = async (e: React.FormEvent) => {
     e.preventDefault();
 
@@ -92,8 +109,14 @@ export function SetAvailabilityPage() {
               className="w-full border border-gray-300 p-2 rounded-xl"
               value={place}
               onChange={(e) => setPlace(e.target.value)}
+              list="place-suggestions"
               required
             />
+            <datalist id="place-suggestions">
+              {placeSuggestions.map((suggestion) => (
+                <option key={suggestion.id} value={suggestion.name} />
+              ))}
+            </datalist>
           </div>
 
           <div>
@@ -9,6 +9,16 @@ server {
         alias /vol/web/media;
     }
 
+    # Long-lived Server-Sent Events, served by uvicorn rather than uwsgi
+    location /api/owner/events/ {
+        proxy_pass              http://${EVENTS_HOST}:${EVENTS_PORT};
+        proxy_http_version      1.1;
+        proxy_set_header        Connection "";
+        proxy_set_header        Host $host;
+        proxy_buffering         off;
+        proxy_read_timeout      1h;
+    }
+
     location / {
         uwsgi_pass              ${APP_HOST}:${APP_PORT};
         include                 /etc/nginx/uwsgi_params;